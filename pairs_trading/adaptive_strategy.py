@@ -6,29 +6,39 @@ import pandas as pd
 from data_loader import fetch_data
 from analysis import calculate_hedge_ratio, calculate_spread
 from advanced_metrics import score_pair_quality
+from profiling import span, profiled
+import events
 
-def select_strategy(series1, series2, verbose=True):
+@profiled('select_strategy')
+def select_strategy(series1, series2, verbose=True, health=None):
     """
     Intelligently select between static and Kalman Filter strategy.
     
     Decision logic:
+    - If a live breakdown alert is raised (no mean reversion or trending spread): Use Kalman
     - If regime unstable (long half-life OR high correlation variance): Use Kalman
     - If strong mean-reversion (low Hurst): Use Static
     - Otherwise: Use Static as default
     
     Args:
-        series1, series2: Price series for the pair
-        verbose: Print decision reasoning
+        series1, series2: Price series for the pair (unused when health is given)
+        verbose: Report the decision reasoning at info level (otherwise debug)
+        health: Live metrics from PairHealthMonitor.health(pair); used instead of
+                recomputing score_pair_quality over the full history
         
     Returns:
-        str: 'static' or 'kalman'
+        tuple: ('static' or 'kalman', metrics dict)
     """
-    # Calculate static hedge ratio and spread
-    hedge_ratio = calculate_hedge_ratio(series1, series2)
-    spread = calculate_spread(series1, series2, hedge_ratio)
-    
-    # Get quality metrics
-    metrics = score_pair_quality(spread, series1, series2)
+    if health is not None:
+        metrics = health
+    else:
+        # Calculate static hedge ratio and spread
+        hedge_ratio = calculate_hedge_ratio(series1, series2)
+        spread = calculate_spread(series1, series2, hedge_ratio)
+        
+        # Get quality metrics
+        with span('score_pair_quality'):
+            metrics = score_pair_quality(spread, series1, series2)
     
     half_life = metrics['half_life']
     hurst = metrics['hurst_exponent']
@@ -38,6 +48,10 @@ def select_strategy(series1, series2, verbose=True):
     decision = 'static'  # Default
     reason = []
     
+    if metrics.get('broken'):
+        decision = 'kalman'
+        reason.append(f"Live breakdown alert ({', '.join(metrics['alerts'])}) indicates the static relationship has broken")
+    
     # Check for regime instability (Kalman helps)
     if half_life > 60:
         decision = 'kalman'
@@ -59,23 +73,29 @@ def select_strategy(series1, series2, verbose=True):
             decision = 'kalman'
             reason.append(f"Low quality score ({metrics['overall_score']:.1f}) suggests trying adaptive approach")
     
-    if verbose:
-        print(f"\n{'='*70}")
-        print(f"ADAPTIVE STRATEGY SELECTION")
-        print(f"{'='*70}")
-        print(f"Metrics:")
-        print(f"  Half-Life: {half_life:.1f} days")
-        print(f"  Hurst Exponent: {hurst:.3f}")
-        print(f"  Correlation Stability: {corr_stability:.3f}")
-        print(f"  Overall Quality Score: {metrics['overall_score']:.1f}/100")
-        print(f"\nDecision: {decision.upper()}")
-        print(f"Reasoning:")
-        for r in reason:
-            print(f"  - {r}")
-        print(f"{'='*70}\n")
+    level = 'info' if verbose else 'debug'
+    if events.enabled(level):
+        report = [
+            f"\n{'='*70}",
+            f"ADAPTIVE STRATEGY SELECTION",
+            f"{'='*70}",
+            f"Metrics:",
+            f"  Half-Life: {half_life:.1f} days",
+            f"  Hurst Exponent: {hurst:.3f}",
+            f"  Correlation Stability: {corr_stability:.3f}",
+            f"  Overall Quality Score: {metrics['overall_score']:.1f}/100",
+            f"\nDecision: {decision.upper()}",
+            f"Reasoning:"
+        ]
+        report += [f"  - {r}" for r in reason]
+        report.append(f"{'='*70}\n")
+        events.emit(level, 'strategy_selected', '\n'.join(report),
+                    decision=decision, reasons=reason, half_life=half_life, hurst_exponent=hurst,
+                    correlation_stability=corr_stability, overall_score=metrics['overall_score'])
     
     return decision, metrics
 
+@profiled('run_adaptive_backtest')
 def run_adaptive_backtest(tickers, start_date, end_date, name):
     """
     Run backtest with adaptive strategy selection.
@@ -90,15 +110,16 @@ def run_adaptive_backtest(tickers, start_date, end_date, name):
     """
     from main import run_experiment
     
-    print(f"\n{'='*80}")
-    print(f"ADAPTIVE BACKTEST: {name} ({tickers[0]} / {tickers[1]})")
-    print(f"{'='*80}")
+    events.info('adaptive_backtest_started',
+                f"\n{'='*80}\nADAPTIVE BACKTEST: {name} ({tickers[0]} / {tickers[1]})\n{'='*80}",
+                name=name, tickers=tickers)
     
     # Fetch data
-    data = fetch_data(tickers, start_date, end_date)
+    with span('fetch_data'):
+        data = fetch_data(tickers, start_date, end_date, how='intersection')
     
     if data.empty or len(data.columns) < 2:
-        print("Insufficient data for adaptive selection")
+        events.warning('no_data', "Insufficient data for adaptive selection", name=name)
         return None
     
     series1 = data[tickers[0]]
@@ -110,7 +131,8 @@ def run_adaptive_backtest(tickers, start_date, end_date, name):
     # Run backtest with selected strategy
     use_kalman = (strategy == 'kalman')
     
-    print(f"\nRunning backtest with {strategy.upper()} strategy...")
+    events.info('adaptive_backtest_model', f"\nRunning backtest with {strategy.upper()} strategy...",
+                strategy=strategy)
     run_experiment(
         tickers=tickers,
         start_date=start_date,
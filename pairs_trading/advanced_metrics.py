@@ -114,6 +114,15 @@ def score_pair_quality(spread, series1, series2):
     hurst = calculate_hurst_exponent(spread)
     corr_stability = calculate_correlation_stability(series1, series2)
     
+    return score_metrics(half_life, hurst, corr_stability)
+
+def score_metrics(half_life, hurst, corr_stability):
+    """
+    Quality score (0-100) from already computed metrics, e.g. the live
+    estimates of pair_monitor.PairHealthMonitor.
+    
+    Returns the same dict as score_pair_quality.
+    """
     # Score components (0-100 each)
     
     # Half-life score: optimal is 10-40 days
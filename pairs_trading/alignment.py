@@ -0,0 +1,188 @@
+import numpy as np
+import pandas as pd
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+FILL_POLICIES = ('ffill', 'none')
+
+def _staleness_ns(max_staleness):
+    """Converts a pandas offset string / Timedelta (or None) to nanoseconds."""
+    if max_staleness is None:
+        return None
+    return pd.Timedelta(max_staleness).value
+
+def check_fill_policy(fill):
+    if fill not in FILL_POLICIES:
+        raise ValueError(f"Unknown fill policy '{fill}', expected one of {list(FILL_POLICIES)}")
+
+def _timeline_values(index):
+    """int64 sort keys of an index: nanoseconds for datetimes, the values otherwise."""
+    if isinstance(index, pd.DatetimeIndex):
+        return index.as_unit('ns').asi8
+    return np.asarray(index, dtype=np.int64)
+
+def asof_join(ts, values, timeline, fill='ffill', max_staleness=None, prior=None):
+    """
+    Samples one ticker's observations on a timeline with a vectorized as-of join.
+
+    Each timeline point takes the most recent observation at or before it
+    (one searchsorted over the whole timeline), so nothing from the future
+    ever leaks in.
+
+    Args:
+        ts (np.ndarray): Sorted int64 observation timestamps.
+        values (np.ndarray): Observed values, same length as ts.
+        timeline (np.ndarray): Sorted int64 timestamps to sample at.
+        fill (str): 'ffill' carries the last observation forward; 'none' keeps
+                    only timeline points with an observation at exactly that time.
+        max_staleness: Optional pandas offset (e.g. '5min', '3D'); carried values
+                       older than this become NaN.
+        prior (tuple): Optional (timestamp, value) of the last observation before
+                       ts[0], e.g. from a previous partition, used with 'ffill'.
+
+    Returns:
+        np.ndarray: float64 values on the timeline, NaN where there is none.
+    """
+    check_fill_policy(fill)
+    out = np.full(len(timeline), np.nan)
+    obs_ts = np.array(timeline, dtype=np.int64)
+    pos = np.searchsorted(ts, timeline, side='right') - 1
+    has_obs = pos >= 0
+    out[has_obs] = values[pos[has_obs]]
+    obs_ts[has_obs] = ts[pos[has_obs]]
+
+    if fill == 'none':
+        out[obs_ts != timeline] = np.nan
+    elif prior is not None:
+        out[~has_obs] = prior[1]
+        obs_ts[~has_obs] = prior[0]
+
+    staleness_ns = _staleness_ns(max_staleness)
+    if staleness_ns is not None:
+        out[timeline - obs_ts > staleness_ns] = np.nan
+    return out
+
+class CalendarIndex:
+    """
+    Per-ticker trading calendars of a universe, indexed once for fast alignment.
+
+    Every ticker keeps only the bars it actually printed (a 24/7 crypto asset,
+    a weekday ETF and an exchange with its own holidays each have their own
+    calendar). Building the index runs one as-of join per ticker against the
+    union timeline and stores the resulting positions; aligning any subset of
+    tickers afterwards is just boolean masks and array gathers, so thousands
+    of pairs can each be aligned on their own calendar in one pass over the
+    universe instead of intersecting the whole universe up front.
+
+    Args:
+        series (dict): Ticker -> pd.Series of prices (NaNs are dropped). The
+                       indexes may differ between tickers.
+    """
+    def __init__(self, series: Dict[str, pd.Series]):
+        series = {ticker: s.dropna().sort_index() for ticker, s in series.items()}
+        self.tickers = [ticker for ticker, s in series.items() if len(s)]
+        indexes = [series[ticker].index for ticker in self.tickers]
+        self.index = indexes[0].append(indexes[1:]).unique().sort_values() if indexes else pd.DatetimeIndex([])
+        self.timeline = _timeline_values(self.index)
+
+        self._ts = {}
+        self._values = {}
+        self._pos = {}
+        self._exact = {}
+        for ticker in self.tickers:
+            s = series[ticker]
+            ts = _timeline_values(s.index)
+            pos = np.searchsorted(ts, self.timeline, side='right') - 1
+            exact = np.zeros(len(self.timeline), dtype=bool)
+            exact[pos >= 0] = ts[pos[pos >= 0]] == self.timeline[pos >= 0]
+            self._ts[ticker] = ts
+            self._values[ticker] = s.values.astype(np.float64)
+            self._pos[ticker] = pos.astype(np.int32 if len(ts) < 2 ** 31 else np.int64)
+            self._exact[ticker] = exact
+
+    @classmethod
+    def from_frame(cls, data: pd.DataFrame) -> 'CalendarIndex':
+        """Index of a wide price frame whose NaNs mark bars a ticker did not print (e.g. fetch_unaligned_data)."""
+        return cls({ticker: data[ticker] for ticker in data.columns})
+
+    def __contains__(self, ticker):
+        return ticker in self._pos
+
+    def coverage(self) -> pd.DataFrame:
+        """Bars, first/last bar and share of the union timeline printed, per ticker."""
+        rows = []
+        for ticker in self.tickers:
+            bars = int(self._exact[ticker].sum())
+            first, last = np.flatnonzero(self._exact[ticker])[[0, -1]]
+            rows.append({'ticker': ticker, 'bars': bars, 'first': self.index[first], 'last': self.index[last],
+                         'coverage': bars / len(self.timeline)})
+        return pd.DataFrame(rows).set_index('ticker')
+
+    def _rows(self, tickers, how):
+        if how == 'intersection':
+            return np.logical_and.reduce([self._exact[t] for t in tickers])
+        if how == 'union':
+            return np.logical_or.reduce([self._exact[t] for t in tickers])
+        if how in self._exact:
+            return self._exact[how]
+        raise ValueError(f"Unknown calendar '{how}', expected 'intersection', 'union' or a ticker")
+
+    def align(self,
+              tickers: List[str],
+              how: str = 'intersection',
+              fill: str = 'ffill',
+              max_staleness=None) -> pd.DataFrame:
+        """
+        Aligns a few tickers (typically a pair) on a shared calendar.
+
+        Args:
+            tickers: Tickers to align; all must be in the index
+            how: Calendar of the result: 'intersection' (bars every ticker printed),
+                 'union' (bars any ticker printed), or a ticker name to trade on
+                 that ticker's calendar (e.g. the exchange-traded leg of a
+                 crypto/ETF pair)
+            fill: 'ffill' samples the other tickers as-of each bar; 'none' keeps
+                  only bars every ticker printed exactly
+            max_staleness: Optional pandas offset limiting how old a carried
+                           value may be (e.g. '3D' to bridge weekends but not
+                           long halts)
+
+        Returns:
+            pd.DataFrame: Prices without NaNs; rows before every ticker has
+            printed, or with a value too stale, are dropped.
+        """
+        check_fill_policy(fill)
+        if not len(tickers) or not len(self.timeline):
+            return pd.DataFrame(columns=list(tickers))
+        missing = [t for t in tickers if t not in self._pos]
+        if missing:
+            raise KeyError(f"No data for {missing}")
+        rows = np.flatnonzero(self._rows(tickers, how))
+        timeline = self.timeline[rows]
+        staleness_ns = _staleness_ns(max_staleness)
+
+        columns = {}
+        keep = np.ones(len(rows), dtype=bool)
+        for ticker in tickers:
+            pos = self._pos[ticker][rows]
+            has_obs = pos >= 0
+            values = np.full(len(rows), np.nan)
+            values[has_obs] = self._values[ticker][pos[has_obs]]
+            if fill == 'none':
+                values[~self._exact[ticker][rows]] = np.nan
+            elif staleness_ns is not None:
+                obs_ts = np.where(has_obs, self._ts[ticker][np.maximum(pos, 0)], timeline)
+                values[timeline - obs_ts > staleness_ns] = np.nan
+            keep &= ~np.isnan(values)
+            columns[ticker] = values
+
+        return pd.DataFrame({ticker: values[keep] for ticker, values in columns.items()},
+                            index=self.index[rows[keep]])
+
+    def align_pairs(self,
+                    pairs: Iterable[Tuple[str, str]],
+                    how: str = 'intersection',
+                    fill: str = 'ffill',
+                    max_staleness=None) -> Iterator[Tuple[Tuple[str, str], pd.DataFrame]]:
+        """Yields ((ticker1, ticker2), aligned prices) for every pair, each on its own calendar."""
+        for pair in pairs:
+            yield pair, self.align(list(pair), how=how, fill=fill, max_staleness=max_staleness)
@@ -39,6 +39,23 @@ def calculate_spread(series1, series2, hedge_ratio):
     """
     return series1 - hedge_ratio * series2
 
+def calculate_basket_spread(prices, weights):
+    """
+    Calculates the spread of a multi-leg basket: sum_i weights_i * price_i.
+    
+    Args:
+        prices (pd.DataFrame): Leg prices, columns in the order of `weights`.
+        weights (array-like): Units per leg, either fixed (n_legs,) or per bar
+                              (n_obs, n_legs), e.g. [1, -beta_1, ..., -beta_m].
+    """
+    values = np.asarray(prices, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+    if weights.ndim == 1:
+        spread = values @ weights
+    else:
+        spread = np.einsum('ij,ij->i', values, weights)
+    return pd.Series(spread, index=getattr(prices, 'index', None), name='spread')
+
 def calculate_zscore(spread, window):
     """
     Calculates the rolling z-score of the spread.
@@ -47,3 +64,115 @@ def calculate_zscore(spread, window):
     std = spread.rolling(window=window).std()
     zscore = (spread - mean) / std
     return zscore
+
+def _compensated_cumsum(values):
+    """
+    Prefix sums along axis 0 as (hi, lo) pairs with a leading zero row.
+    
+    hi is the ordinary float cumsum; lo accumulates the exact rounding error of
+    each addition (the TwoSum error term), so hi + lo is the prefix sum to
+    about twice float precision.
+    """
+    zero = np.zeros((1,) + values.shape[1:])
+    hi = np.cumsum(values, axis=0)
+    previous = np.concatenate([zero, hi[:-1]])
+    added = hi - previous
+    error = (previous - (hi - added)) + (values - added)
+    return np.concatenate([zero, hi]), np.concatenate([zero, np.cumsum(error, axis=0)])
+
+class RollingStats:
+    """
+    Rolling mean, std and z-score for any window length, from prefix sums.
+    
+    Built once per spread: cumulative sums of x and x^2 (and of the count of
+    valid values) are stored, so each query costs O(1) per bar whatever the
+    window, and many windows can be compared on the same spread without
+    recomputing anything. Values are shifted by their mean before summing,
+    and each prefix sum carries the exact rounding error of every addition
+    (compensated summation), so differences of two large prefix sums stay
+    accurate to within a few ulps of the window's own sum of squares.
+    
+    Matches calculate_zscore (pandas rolling with min_periods=window): a
+    window containing a NaN gives NaN.
+    
+    Args:
+        values (pd.Series, pd.DataFrame or np.ndarray): Spread(s), time along the first axis.
+    """
+    def __init__(self, values):
+        self._index = getattr(values, 'index', None)
+        self._columns = getattr(values, 'columns', None)
+        self._name = getattr(values, 'name', None)
+        
+        x = np.asarray(values, dtype=float)
+        self._ndim = x.ndim
+        if x.ndim == 1:
+            x = x[:, None]
+        self.values = x
+        
+        valid = np.isfinite(x)
+        with np.errstate(invalid='ignore'):
+            self.shift = np.where(valid.any(axis=0), np.nanmean(np.where(valid, x, np.nan), axis=0), 0.0)
+        d = np.where(valid, x - self.shift, 0.0)
+        
+        zero = np.zeros((1, x.shape[1]))
+        self._count = np.concatenate([zero, np.cumsum(valid, axis=0)])
+        self._s1 = _compensated_cumsum(d)
+        self._s2 = _compensated_cumsum(d * d)
+    
+    def __len__(self):
+        return len(self.values)
+    
+    def _sums(self, window):
+        """Count, sum and sum of squares of each full window, NaN before the first."""
+        if window < 1:
+            raise ValueError(f"window must be at least 1, got {window}")
+        n = len(self.values)
+        shape = self.values.shape
+        count, s1, s2 = (np.full(shape, np.nan) for _ in range(3))
+        if window <= n:
+            count[window - 1:] = self._count[window:] - self._count[:n - window + 1]
+            for out, (hi, lo) in ((s1, self._s1), (s2, self._s2)):
+                out[window - 1:] = (hi[window:] - hi[:n - window + 1]) + (lo[window:] - lo[:n - window + 1])
+        full = count == window
+        s1[~full] = np.nan
+        s2[~full] = np.nan
+        return s1, s2
+    
+    def _wrap(self, array):
+        if self._ndim == 1:
+            array = array[:, 0]
+            return pd.Series(array, index=self._index, name=self._name) if self._index is not None else array
+        if self._columns is not None:
+            return pd.DataFrame(array, index=self._index, columns=self._columns)
+        return array
+    
+    def _mean(self, window):
+        s1, _ = self._sums(window)
+        return s1 / window + self.shift
+    
+    def _std(self, window, ddof=1):
+        s1, s2 = self._sums(window)
+        if window - ddof <= 0:
+            return np.full(self.values.shape, np.nan)
+        sq_dev = s2 - s1 * s1 / window
+        # Anything within rounding error of the window's sum of squares is a flat window
+        with np.errstate(invalid='ignore'):
+            sq_dev = np.where(sq_dev > 16 * np.finfo(float).eps * s2, sq_dev, 0.0)
+        return np.sqrt(sq_dev / (window - ddof))
+    
+    def mean(self, window):
+        return self._wrap(self._mean(window))
+    
+    def std(self, window, ddof=1):
+        return self._wrap(self._std(window, ddof))
+    
+    def zscore(self, window):
+        """Same as calculate_zscore(values, window); flat windows give NaN."""
+        std = self._std(window)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            zscore = (self.values - self._mean(window)) / np.where(std > 0, std, np.nan)
+        return self._wrap(zscore)
+    
+    def zscores(self, windows):
+        """dict: window -> z-score, for comparing several windows on one spread."""
+        return {window: self.zscore(window) for window in windows}
@@ -66,3 +66,41 @@ def calculate_returns(data, signals):
     metrics['cumulative_returns'] = (1 + metrics['daily_returns']).cumprod()
     
     return metrics
+
+def calculate_basket_returns(data, positions, weights):
+    """
+    Calculates the returns of trading a multi-leg spread.
+    
+    One unit of the spread holds weights[i] units of each leg, so
+    PnL(t) = Position(t-1) * sum_i weights[i] * (Price_i,t - Price_i,t-1),
+    expressed as a return on the gross capital sum_i |weights[i]| * Price_i,t-1.
+    With per-bar (dynamic) weights, the units held over bar t are those of t-1.
+    
+    Args:
+        data (pd.DataFrame): Prices of the legs, columns in the order of `weights`.
+        positions (pd.Series): Spread position per bar (1 long, -1 short, 0 flat).
+        weights (array-like): Units of each leg in one unit of the spread, either
+                              fixed (n_legs,) or per bar (n_obs, n_legs).
+        
+    Returns:
+        pd.DataFrame: DataFrame with 'daily_returns' and 'cumulative_returns'.
+    """
+    prices = data.values.astype(float)
+    weights = np.asarray(weights, dtype=float)
+    
+    pnl = np.full(len(prices), np.nan)
+    gross = np.full(len(prices), np.nan)
+    if weights.ndim == 1:
+        pnl[1:] = np.diff(prices, axis=0) @ weights
+        gross[1:] = np.abs(prices[:-1]) @ np.abs(weights)
+    else:
+        pnl[1:] = np.einsum('ij,ij->i', np.diff(prices, axis=0), weights[:-1])
+        gross[1:] = np.einsum('ij,ij->i', np.abs(prices[:-1]), np.abs(weights[:-1]))
+    
+    strategy_returns = pd.Series(positions).shift(1).values * pnl / gross
+    
+    metrics = pd.DataFrame(index=data.index)
+    metrics['daily_returns'] = strategy_returns
+    metrics['cumulative_returns'] = (1 + metrics['daily_returns']).cumprod()
+    
+    return metrics
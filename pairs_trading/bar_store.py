@@ -0,0 +1,184 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import pandas as pd
+from typing import Iterator, List, Optional
+
+from alignment import asof_join, check_fill_policy
+
+PARTITION_UNITS = {'day': 'D', 'month': 'M'}
+
+class BarStore:
+    """
+    On-disk store of price bars, partitioned by time and memory-mapped on read.
+
+    Layout: <root>/<ticker>/<partition>.ts.npy (int64 UTC nanoseconds) and
+    <root>/<ticker>/<partition>.close.npy (float64), one pair of files per
+    day or month. Reads use np.load(mmap_mode='r'), so only the partitions
+    being processed are paged into memory and years of minute bars can be
+    iterated within a fixed memory budget.
+    """
+    def __init__(self, root, partition='day'):
+        if partition not in PARTITION_UNITS:
+            raise ValueError(f"Unknown partition '{partition}', expected one of {list(PARTITION_UNITS)}")
+        self.root = root
+        self.partition = partition
+        self._unit = PARTITION_UNITS[partition]
+        os.makedirs(root, exist_ok=True)
+
+    def _ticker_dir(self, ticker):
+        return os.path.join(self.root, ticker)
+
+    def _paths(self, ticker, key):
+        base = os.path.join(self._ticker_dir(ticker), key)
+        return base + '.ts.npy', base + '.close.npy'
+
+    def _partition_keys(self, timestamps):
+        return np.datetime_as_string(timestamps.astype('datetime64[ns]').astype(f'datetime64[{self._unit}]'))
+
+    def write(self, ticker, prices):
+        """
+        Adds bars for one ticker, merging with any bars already stored.
+
+        Args:
+            ticker (str): Ticker symbol.
+            prices (pd.Series): Close prices indexed by timestamp. NaNs are dropped;
+                                timezone-aware indexes are stored as UTC.
+        """
+        prices = prices.dropna()
+        if prices.empty:
+            return
+        index = pd.DatetimeIndex(prices.index)
+        if index.tz is not None:
+            index = index.tz_convert('UTC').tz_localize(None)
+        timestamps = index.values.astype('datetime64[ns]').view('int64')
+        values = prices.values.astype('float64')
+        keys = self._partition_keys(timestamps)
+
+        os.makedirs(self._ticker_dir(ticker), exist_ok=True)
+        for key in np.unique(keys):
+            mask = keys == key
+            ts, close = timestamps[mask], values[mask]
+            ts_path, close_path = self._paths(ticker, key)
+            if os.path.exists(ts_path):
+                ts = np.concatenate([np.load(ts_path), ts])
+                close = np.concatenate([np.load(close_path), close])
+            # Keep the latest write for duplicate timestamps
+            order = np.argsort(ts, kind='stable')
+            ts, close = ts[order], close[order]
+            keep = np.append(ts[1:] != ts[:-1], True)
+            np.save(ts_path, ts[keep])
+            np.save(close_path, close[keep])
+
+    def write_frame(self, data):
+        """Writes every column of a price DataFrame (e.g. from fetch_intraday_data)."""
+        for ticker in data.columns:
+            self.write(ticker, data[ticker])
+
+    def tickers(self) -> List[str]:
+        return sorted(name for name in os.listdir(self.root)
+                      if os.path.isdir(os.path.join(self.root, name)))
+
+    def partitions(self, ticker) -> List[str]:
+        directory = self._ticker_dir(ticker)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(name[:-len('.ts.npy')] for name in os.listdir(directory) if name.endswith('.ts.npy'))
+
+    def load_partition(self, ticker, key):
+        """
+        Returns the memory-mapped (timestamps, closes) arrays of one partition,
+        or None if the ticker has no bars in it.
+        """
+        ts_path, close_path = self._paths(ticker, key)
+        if not os.path.exists(ts_path):
+            return None
+        return np.load(ts_path, mmap_mode='r'), np.load(close_path, mmap_mode='r')
+
+    def _key_range(self, key):
+        """[start, end) of a partition key in int64 nanoseconds."""
+        first = np.datetime64(key, self._unit)
+        return (int(first.astype('datetime64[ns]').astype(np.int64)),
+                int((first + 1).astype('datetime64[ns]').astype(np.int64)))
+
+    def _overlaps(self, key, start_ns, end_ns):
+        first, stop = self._key_range(key)
+        return (start_ns is None or stop > start_ns) and (end_ns is None or first < end_ns)
+
+    def iter_aligned_chunks(self,
+                            tickers: List[str],
+                            start: Optional[str] = None,
+                            end: Optional[str] = None,
+                            fill: str = 'ffill',
+                            max_staleness: Optional[str] = None) -> Iterator[pd.DataFrame]:
+        """
+        Yields aligned price chunks, one partition at a time.
+
+        Each chunk is indexed by the union of the tickers' bar timestamps in that
+        partition. Missing bars are filled with an as-of join on the most recent
+        earlier bar (carried across partition boundaries) instead of dropping the
+        row; only rows before every ticker has printed at least once, or whose
+        as-of value is older than `max_staleness`, are dropped.
+
+        Args:
+            tickers: Tickers to align
+            start, end: Optional [start, end) timestamp bounds; partitions outside
+                        them are not read, so a window costs what it covers
+            fill: 'ffill' for as-of alignment, or 'none' to keep only timestamps
+                  where every ticker has a bar
+            max_staleness: Optional pandas offset string (e.g. '5min') limiting
+                           how old a forward-filled value may be
+        """
+        check_fill_policy(fill)
+
+        start_ns = pd.Timestamp(start).value if start is not None else None
+        end_ns = pd.Timestamp(end).value if end is not None else None
+
+        # Partitions entirely outside [start, end) are never read
+        keys = [key for key in sorted(set().union(*(self.partitions(ticker) for ticker in tickers)))
+                if self._overlaps(key, start_ns, end_ns)]
+
+        # As-of state carried from the previous partition; the window starts from
+        # the last bar of each ticker's latest partition before it
+        prior = {ticker: None for ticker in tickers}
+        if start_ns is not None and fill == 'ffill':
+            for ticker in tickers:
+                earlier = [key for key in self.partitions(ticker) if self._key_range(key)[1] <= start_ns]
+                arrays = self.load_partition(ticker, earlier[-1]) if earlier else None
+                if arrays is not None and len(arrays[0]) > 0:
+                    prior[ticker] = (int(arrays[0][-1]), float(arrays[1][-1]))
+
+        for key in keys:
+            loaded = {ticker: self.load_partition(ticker, key) for ticker in tickers}
+            present = [arrays[0] for arrays in loaded.values() if arrays is not None]
+            if not present:
+                continue
+            timeline = np.unique(np.concatenate(present))
+            if start_ns is not None:
+                timeline = timeline[timeline >= start_ns]
+            if end_ns is not None:
+                timeline = timeline[timeline < end_ns]
+
+            columns = {}
+            valid = np.ones(len(timeline), dtype=bool)
+            for ticker in tickers:
+                arrays = loaded[ticker]
+                if arrays is None:
+                    arrays = (np.empty(0, dtype=np.int64), np.empty(0))
+                ts, close = arrays
+                values = asof_join(ts, close, timeline, fill=fill, max_staleness=max_staleness,
+                                   prior=prior[ticker])
+                valid &= ~np.isnan(values)
+                columns[ticker] = values
+
+                in_range = ts < end_ns if end_ns is not None else slice(None)
+                ts_in, close_in = ts[in_range], close[in_range]
+                if len(ts_in) > 0:
+                    prior[ticker] = (int(ts_in[-1]), float(close_in[-1]))
+
+            if not valid.any():
+                continue
+            index = pd.DatetimeIndex(timeline[valid].astype('datetime64[ns]'))
+            yield pd.DataFrame({ticker: values[valid] for ticker, values in columns.items()}, index=index)
@@ -0,0 +1,342 @@
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from itertools import combinations
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from scipy.linalg import eigh
+from statsmodels.tsa.coint_tables import c_sjt
+
+from data_loader import fetch_data
+from analysis import calculate_zscore, calculate_basket_spread
+from kalman import run_kalman_basket
+from strategy import compute_positions
+from backtest import calculate_basket_returns
+from pair_pruning import cluster_tickers
+from profiling import span, count, profiled
+import events
+
+# Column of statsmodels' Johansen critical value tables for each significance level
+SIGNIFICANCE_LEVELS = {0.10: 0, 0.05: 1, 0.01: 2}
+
+@dataclass
+class BasketCandidate:
+    """A cointegrated basket and its leading Johansen cointegrating vector."""
+    tickers: Tuple[str, ...]
+    trace_stat: float
+    critical_value: float
+    eigenvalue: float
+    weights: np.ndarray
+
+    @property
+    def strength(self) -> float:
+        """Trace statistic relative to its critical value (> 1 means cointegrated)."""
+        return self.trace_stat / self.critical_value
+
+    def __repr__(self):
+        legs = " ".join(f"{w:+.4f}*{t}" for t, w in zip(self.tickers, self.weights))
+        return f"{'/'.join(self.tickers)}: trace={self.trace_stat:.2f} (crit {self.critical_value:.2f}), spread = {legs}"
+
+class JohansenMoments:
+    """
+    Moment matrices of a whole universe, shared by every candidate basket.
+
+    The Johansen test on a basket only needs the covariances of its
+    differences, lagged levels and lagged differences. All of these are
+    sub-blocks of one universe-wide moment matrix, which is computed once
+    here. Each basket is then an O(k^3) problem on a k-column slice,
+    independent of the number of bars.
+
+    Matches statsmodels' coint_johansen(prices, det_order=0, k_ar_diff)
+    (constant term) for k_ar_diff >= 1: the eigenvalues agree to rounding
+    error. With k_ar_diff=0 the levels are lagged by one bar (X_{t-1}), where
+    statsmodels uses X_t.
+
+    Args:
+        data (pd.DataFrame): Aligned prices, one column per ticker.
+        k_ar_diff (int): Number of lagged differences in the VECM.
+    """
+    def __init__(self, data: pd.DataFrame, k_ar_diff: int = 1):
+        self.tickers = list(data.columns)
+        self.k_ar_diff = k_ar_diff
+        n_tickers = len(self.tickers)
+
+        levels = data.values.astype(float)
+        diffs = np.diff(levels, axis=0)
+        n_obs = len(diffs) - k_ar_diff
+        if n_obs <= (k_ar_diff + 1) * n_tickers:
+            raise ValueError(f"Not enough bars ({len(levels)}) for {n_tickers} tickers and k_ar_diff={k_ar_diff}")
+
+        # Rows are t = k_ar_diff + 1 ... end: [dX_t | X_{t-1} | dX_{t-1} ... dX_{t-k}]
+        blocks = [diffs[k_ar_diff:], levels[k_ar_diff:-1]]
+        for lag in range(1, k_ar_diff + 1):
+            blocks.append(diffs[k_ar_diff - lag:len(diffs) - lag])
+        stacked = np.hstack(blocks)
+        stacked -= stacked.mean(axis=0)
+
+        self.n_obs = n_obs
+        self.n_tickers = n_tickers
+        self.moments = stacked.T @ stacked / n_obs
+
+    def columns(self, tickers: Sequence[str]) -> np.ndarray:
+        """Ticker positions in the universe."""
+        position = {ticker: i for i, ticker in enumerate(self.tickers)}
+        return np.array([position[t] for t in tickers])
+
+    def test(self, idx: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Johansen test of the basket at universe positions `idx`.
+
+        Returns:
+            tuple: (eigenvalues in descending order, matching eigenvectors as
+                    columns), where the eigenvectors are the cointegrating vectors
+        """
+        return _johansen_from_moments(self.moments, self.n_tickers, self.k_ar_diff, idx)
+
+def _johansen_from_moments(moments, n_tickers, k_ar_diff, idx):
+    """Eigenvalues/vectors of the Johansen problem for one basket, from shared moments."""
+    d = idx
+    l = n_tickers + idx
+    z = np.concatenate([(2 + lag) * n_tickers + idx for lag in range(k_ar_diff)]) if k_ar_diff else idx[:0]
+
+    s00 = moments[np.ix_(d, d)]
+    s0k = moments[np.ix_(d, l)]
+    skk = moments[np.ix_(l, l)]
+    if len(z):
+        # Partial out the lagged differences (the residual regression step)
+        mzz_inv = np.linalg.pinv(moments[np.ix_(z, z)])
+        m0z = moments[np.ix_(d, z)]
+        mkz = moments[np.ix_(l, z)]
+        s00 = s00 - m0z @ mzz_inv @ m0z.T
+        s0k = s0k - m0z @ mzz_inv @ mkz.T
+        skk = skk - mkz @ mzz_inv @ mkz.T
+
+    sig = s0k.T @ np.linalg.solve(s00, s0k)
+    eigenvalues, eigenvectors = eigh(sig, skk)
+    return eigenvalues[::-1], eigenvectors[:, ::-1]
+
+def _screen_baskets(args):
+    """Worker: Johansen-test one block of baskets against the shared moments."""
+    moments, n_tickers, n_obs, k_ar_diff, baskets, level = args
+    column = SIGNIFICANCE_LEVELS[level]
+    accepted = []
+    failed = 0
+    for idx in baskets:
+        idx = np.asarray(idx)
+        try:
+            eigenvalues, eigenvectors = _johansen_from_moments(moments, n_tickers, k_ar_diff, idx)
+        except (np.linalg.LinAlgError, ValueError):
+            failed += 1
+            continue
+        eigenvalues = np.clip(eigenvalues, 0.0, 1 - 1e-12)
+        trace_stat = -n_obs * np.sum(np.log(1 - eigenvalues))
+        critical_value = c_sjt(len(idx), 0)[column]
+        if trace_stat > critical_value:
+            vector = eigenvectors[:, 0]
+            accepted.append((tuple(idx.tolist()), float(trace_stat), float(critical_value),
+                             float(eigenvalues[0]), vector / vector[0]))
+    return accepted, len(baskets), failed
+
+def candidate_baskets(tickers: List[str],
+                      basket_sizes: Sequence[int] = (3, 4),
+                      clusters: Optional[Dict[str, int]] = None) -> List[Tuple[str, ...]]:
+    """
+    Baskets to test, optionally restricted to tickers sharing a cluster.
+
+    Args:
+        tickers: Universe
+        basket_sizes: Numbers of legs (at most 12, the size of the critical value tables)
+        clusters: ticker -> cluster label (see pair_pruning.cluster_tickers); when
+                  given, every leg of a basket must come from the same cluster
+
+    Returns:
+        list of ticker tuples, in universe order
+    """
+    if any(size < 2 or size > 12 for size in basket_sizes):
+        raise ValueError("basket sizes must be between 2 and 12 legs")
+    if clusters is None:
+        groups = [list(tickers)]
+    else:
+        members = {}
+        for ticker in tickers:
+            members.setdefault(clusters[ticker], []).append(ticker)
+        groups = list(members.values())
+
+    baskets = []
+    for size in basket_sizes:
+        for group in groups:
+            baskets.extend(combinations(group, size))
+    return baskets
+
+@profiled('screen_baskets')
+def screen_baskets(data: pd.DataFrame,
+                   basket_sizes: Sequence[int] = (3, 4),
+                   prune_method: Optional[str] = 'correlation',
+                   sectors: Optional[Dict[str, List[str]]] = None,
+                   k_ar_diff: int = 1,
+                   significance: float = 0.05,
+                   n_jobs: Optional[int] = None,
+                   block_size: int = 2000,
+                   top_k: Optional[int] = None) -> List[BasketCandidate]:
+    """
+    Johansen-screens multi-asset baskets on an in-memory price frame.
+
+    Args:
+        data: Aligned prices, one column per ticker
+        basket_sizes: Numbers of legs to try
+        prune_method: None (every combination), or 'sector', 'correlation' or 'pca'
+                      to only combine tickers from the same cluster
+        sectors: Sector mapping for prune_method='sector'
+        k_ar_diff: Lagged differences in the VECM
+        significance: 0.10, 0.05 or 0.01
+        n_jobs: Worker processes (defaults to the CPU count; 1 runs in-process)
+        block_size: Baskets per worker task
+        top_k: Keep only the strongest baskets
+
+    Returns:
+        list of BasketCandidate, strongest (highest trace / critical value) first
+    """
+    if significance not in SIGNIFICANCE_LEVELS:
+        raise ValueError(f"significance must be one of {sorted(SIGNIFICANCE_LEVELS)}")
+
+    clusters = None
+    if prune_method is not None:
+        with span('prune'):
+            clusters = cluster_tickers(data, method=prune_method, sectors=sectors)
+
+    with span('moments'):
+        moments = JohansenMoments(data, k_ar_diff)
+
+    baskets = candidate_baskets(moments.tickers, basket_sizes, clusters)
+    baskets = [moments.columns(basket) for basket in baskets]
+    events.info('basket_screen_started', f"Testing {len(baskets)} baskets of {list(basket_sizes)} legs "
+                f"from {len(moments.tickers)} tickers...",
+                baskets=len(baskets), tickers=len(moments.tickers))
+
+    tasks = [(moments.moments, moments.n_tickers, moments.n_obs, k_ar_diff,
+              baskets[start:start + block_size], significance)
+             for start in range(0, len(baskets), block_size)]
+
+    accepted = []
+    tested = 0
+    with span('johansen'):
+        n_jobs = n_jobs or os.cpu_count() or 1
+        if n_jobs == 1 or len(tasks) <= 1:
+            results = map(_screen_baskets, tasks)
+            pool = None
+        else:
+            pool = ProcessPoolExecutor(max_workers=min(n_jobs, len(tasks)))
+            results = pool.map(_screen_baskets, tasks)
+        try:
+            for block, n_tested, n_failed in results:
+                accepted.extend(block)
+                tested += n_tested
+                count('baskets_failed', n_failed)
+                events.progress('baskets tested', tested, len(baskets))
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+    count('baskets_accepted', len(accepted))
+    events.incr('baskets_tested', tested)
+    events.incr('baskets_found', len(accepted))
+
+    candidates = [
+        BasketCandidate(
+            tickers=tuple(moments.tickers[i] for i in idx),
+            trace_stat=trace_stat,
+            critical_value=critical_value,
+            eigenvalue=eigenvalue,
+            weights=weights
+        )
+        for idx, trace_stat, critical_value, eigenvalue, weights in accepted
+    ]
+    candidates.sort(key=lambda c: c.strength, reverse=True)
+    events.info('basket_screen_finished', f"Found {len(candidates)} cointegrated baskets",
+                found=len(candidates), tested=tested)
+    return candidates[:top_k] if top_k is not None else candidates
+
+def discover_baskets(tickers: List[str],
+                     start_date: str,
+                     end_date: str,
+                     **kwargs) -> List[BasketCandidate]:
+    """
+    Fetches prices and runs screen_baskets on them.
+
+    Args:
+        tickers: Universe to search
+        start_date, end_date: Training window
+        **kwargs: Passed to screen_baskets
+
+    Returns:
+        list of BasketCandidate, strongest first
+    """
+    data = fetch_data(tickers, start_date, end_date)
+    if data.empty:
+        events.warning('no_data', "No data fetched. Skipping basket discovery.")
+        return []
+    return screen_baskets(data, **kwargs)
+
+def basket_spread(data: pd.DataFrame, basket: BasketCandidate) -> pd.Series:
+    """Spread of the basket's legs weighted by its cointegrating vector."""
+    return calculate_basket_spread(data[list(basket.tickers)], basket.weights)
+
+def run_basket_pipeline(data: pd.DataFrame,
+                        basket: BasketCandidate,
+                        window: int = 30,
+                        entry_threshold: float = 2.0,
+                        exit_threshold: float = 0.0,
+                        use_kalman: bool = False) -> dict:
+    """
+    Runs the z-score, signal and backtest stages on a multi-leg spread.
+
+    Same shape as main.run_pipeline, with the cointegrating vector in place of
+    the hedge ratio. Returns come from calculate_basket_returns, which
+    weights each leg by its units in the spread.
+
+    Args:
+        use_kalman: Re-estimate the hedge weights every bar with KalmanFilterMulti
+                    (first leg regressed on the others) instead of using the fixed
+                    Johansen vector.
+
+    Returns:
+        dict: 'spread', 'weights' (pd.Series, or a pd.DataFrame per bar when
+              use_kalman), 'zscore', 'positions' and 'metrics'
+    """
+    prices = data[list(basket.tickers)]
+    if use_kalman:
+        with span('kalman_filter'):
+            spread, states = run_kalman_basket(prices)
+        weights = pd.DataFrame(-states.iloc[:, :-1].values, index=data.index, columns=list(basket.tickers[1:]))
+        weights.insert(0, basket.tickers[0], 1.0)
+    else:
+        spread = basket_spread(data, basket)
+        weights = pd.Series(basket.weights, index=list(basket.tickers))
+    with span('zscore'):
+        zscore = calculate_zscore(spread, window)
+    with span('signals'):
+        positions, _ = compute_positions(zscore.values, entry_threshold, exit_threshold)
+        positions = pd.Series(positions, index=zscore.index, name='positions')
+    with span('backtest'):
+        metrics = calculate_basket_returns(prices, positions, weights.values)
+    return {
+        'spread': spread,
+        'weights': weights,
+        'zscore': zscore,
+        'positions': positions,
+        'metrics': metrics
+    }
+
+def print_basket_results(candidates: List[BasketCandidate], top_n: int = 10):
+    """Print the strongest baskets in a formatted table."""
+    print(f"\n{'='*80}")
+    print(f"TOP {min(top_n, len(candidates))} COINTEGRATED BASKETS")
+    print(f"{'='*80}")
+    print(f"{'Rank':<6} {'Basket':<28} {'Trace':<10} {'Crit':<10} {'Weights'}")
+    print(f"{'-'*80}")
+    for i, candidate in enumerate(candidates[:top_n], 1):
+        weights = ", ".join(f"{w:+.3f}" for w in candidate.weights)
+        print(f"{i:<6} {'/'.join(candidate.tickers):<28} {candidate.trace_stat:<10.2f} "
+              f"{candidate.critical_value:<10.2f} {weights}")
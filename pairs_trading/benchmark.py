@@ -0,0 +1,248 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import time
+import tracemalloc
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+import data_loader
+from data_loader import fetch_data
+from analysis import check_cointegration, calculate_hedge_ratio, calculate_spread, calculate_zscore
+from strategy import generate_signals
+from backtest import calculate_returns
+from kalman import run_kalman_strategy
+from pair_discovery import discover_pairs
+from ensemble import run_ensemble
+from execution import Book, simulate_execution
+from synthetic_data import generate_cointegrated_prices
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_FILE = os.path.join(BENCHMARK_DIR, 'benchmark_results.json')
+BASELINE_FILE = os.path.join(BENCHMARK_DIR, 'benchmark_baseline.json')
+
+# (label, n_tickers, n_bars, freq) per preset.
+# Pair stages use the first two tickers; discovery uses every ticker.
+PRESETS = {
+    'quick': {
+        'pair': [('1pair_daily_3y', 2, 756, 'B')],
+        'universe': [('10tickers_daily_3y', 10, 756, 'B')],
+        'discovery': [('10tickers_daily_3y', 10, 756, 'B')],
+    },
+    'full': {
+        'pair': [('1pair_daily_3y', 2, 756, 'B'),
+                 ('1pair_daily_20y', 2, 5040, 'B'),
+                 ('1pair_minute_1m', 2, 21 * 390, 'min'),
+                 ('1pair_minute_1y', 2, 252 * 390, 'min')],
+        'universe': [('50tickers_daily_3y', 50, 756, 'B'),
+                     ('1000tickers_daily_3y', 1000, 756, 'B'),
+                     ('50tickers_minute_1m', 50, 21 * 390, 'min')],
+        'discovery': [('10tickers_daily_3y', 10, 756, 'B'),
+                      ('50tickers_daily_3y', 50, 756, 'B'),
+                      ('100tickers_daily_3y', 100, 756, 'B')],
+    },
+}
+
+def _yfinance_frame(prices):
+    """Wraps synthetic prices in the MultiIndex layout yf.download returns."""
+    frame = prices.copy()
+    frame.columns = pd.MultiIndex.from_product([['Close'], prices.columns])
+    return frame
+
+def quiet(func):
+    """Wraps func so its progress prints do not flood the benchmark table."""
+    def wrapper():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return func()
+    return wrapper
+
+def measure(func, repeats=3):
+    """
+    Times func and records its peak traced memory.
+
+    Wall time is the best of `repeats` untraced runs; peak memory comes from a
+    separate run under tracemalloc so tracing overhead does not skew timings.
+
+    Returns:
+        dict: 'seconds', 'peak_memory_mb'
+    """
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {'seconds': min(timings), 'peak_memory_mb': peak / 1e6}
+
+def _pair_stages(prices):
+    """Builds (stage, func, items) tuples for the single-pair stages."""
+    data = prices.iloc[:, :2]
+    series1, series2 = data.iloc[:, 0], data.iloc[:, 1]
+    hedge_ratio = calculate_hedge_ratio(series1, series2)
+    spread = calculate_spread(series1, series2, hedge_ratio)
+    zscore = calculate_zscore(spread, 30)
+    signals = generate_signals(zscore)
+    book = Book(tuple(data.columns), signals['positions'], hedge_ratio)
+    n_bars = len(data)
+
+    def end_to_end():
+        check_cointegration(series1, series2)
+        ratio = calculate_hedge_ratio(series1, series2)
+        z = calculate_zscore(calculate_spread(series1, series2, ratio), 30)
+        calculate_returns(data, generate_signals(z))
+
+    return [
+        ('check_cointegration', lambda: check_cointegration(series1, series2), n_bars),
+        ('calculate_zscore', lambda: calculate_zscore(spread, 30), n_bars),
+        ('generate_signals', lambda: generate_signals(zscore), n_bars),
+        ('run_kalman_strategy', lambda: run_kalman_strategy(series1, series2), n_bars),
+        ('calculate_returns', lambda: calculate_returns(data, signals), n_bars),
+        ('end_to_end_static', end_to_end, n_bars),
+        ('run_ensemble', lambda: run_ensemble(data, list(data.columns)), n_bars),
+        ('simulate_execution', lambda: simulate_execution(data, [book]), n_bars),
+    ]
+
+def run_benchmarks(preset='quick', repeats=3, stages=None):
+    """
+    Runs every benchmark in a preset on synthetic cointegrated prices.
+
+    Network access is never needed: fetch_data and discover_pairs run against
+    a patched yf.download that returns the synthetic frame, so their timings
+    cover the post-download processing and screening work.
+
+    Args:
+        preset (str): Key of PRESETS
+        repeats (int): Timed runs per benchmark (best is kept)
+        stages (list): Optional subset of stage names to run
+
+    Returns:
+        list of result dicts
+    """
+    sizes = PRESETS[preset]
+    results = []
+
+    def record(stage, label, n_tickers, n_bars, func, items, unit):
+        if stages is not None and stage not in stages:
+            return
+        timing = measure(func, repeats)
+        result = {
+            'stage': stage,
+            'size': label,
+            'n_tickers': n_tickers,
+            'n_bars': n_bars,
+            'seconds': timing['seconds'],
+            'throughput': items / timing['seconds'] if timing['seconds'] > 0 else float('inf'),
+            'throughput_unit': unit,
+            'peak_memory_mb': timing['peak_memory_mb'],
+        }
+        results.append(result)
+        print(f"{stage:<22} {label:<22} {result['seconds']*1000:>10.1f} ms "
+              f"{result['throughput']:>14,.0f} {unit:<8} {result['peak_memory_mb']:>8.1f} MB")
+
+    for label, n_tickers, n_bars, freq in sizes['pair']:
+        prices = generate_cointegrated_prices(n_tickers, n_bars, freq=freq, n_factors=1)
+        for stage, func, items in _pair_stages(prices):
+            record(stage, label, n_tickers, n_bars, func, items, 'bars/s')
+
+    for label, n_tickers, n_bars, freq in sizes['universe']:
+        prices = generate_cointegrated_prices(n_tickers, n_bars, freq=freq)
+        frame = _yfinance_frame(prices)
+        tickers = list(prices.columns)
+        with mock.patch.object(data_loader.yf, 'download', return_value=frame):
+            record('fetch_data', label, n_tickers, n_bars,
+                   quiet(lambda: fetch_data(tickers, None, None)), n_tickers * n_bars, 'values/s')
+
+    for label, n_tickers, n_bars, freq in sizes['discovery']:
+        prices = generate_cointegrated_prices(n_tickers, n_bars, freq=freq)
+        frame = _yfinance_frame(prices)
+        tickers = list(prices.columns)
+        n_pairs = n_tickers * (n_tickers - 1) // 2
+        with mock.patch.object(data_loader.yf, 'download', return_value=frame):
+            record('discover_pairs', label, n_tickers, n_bars,
+                   quiet(lambda: discover_pairs(tickers, None, None)), n_pairs, 'pairs/s')
+
+    return results
+
+def compare_to_baseline(results, baseline, tolerance=0.25):
+    """
+    Flags benchmarks that got slower than the baseline by more than `tolerance`.
+
+    Returns:
+        list of (stage, size, baseline_seconds, seconds, ratio) for regressions
+    """
+    reference = {(r['stage'], r['size']): r for r in baseline['results']}
+    regressions = []
+    for result in results:
+        key = (result['stage'], result['size'])
+        if key not in reference:
+            continue
+        ratio = result['seconds'] / reference[key]['seconds']
+        if ratio > 1 + tolerance:
+            regressions.append((key[0], key[1], reference[key]['seconds'], result['seconds'], ratio))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every pairs trading pipeline stage.")
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='quick')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--stages', nargs='*', help="Only run these stages")
+    parser.add_argument('--output', default=RESULTS_FILE)
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--save-baseline', action='store_true', help="Store these results as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed slowdown before flagging (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    print(f"{'Stage':<22} {'Size':<22} {'Time':>13} {'Throughput':>14} {'':<8} {'Peak':>8}")
+    print("-" * 92)
+    results = run_benchmarks(args.preset, args.repeats, args.stages)
+
+    report = {
+        'preset': args.preset,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults saved to {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("No baseline found; run with --save-baseline to create one.")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare_to_baseline(results, baseline, args.tolerance)
+    if not regressions:
+        print(f"No regressions against baseline ({baseline['created']}).")
+        return 0
+
+    print(f"\n{len(regressions)} regression(s) against baseline ({baseline['created']}):")
+    for stage, size, before, after, ratio in regressions:
+        print(f"  {stage:<22} {size:<22} {before*1000:.1f} ms -> {after*1000:.1f} ms ({ratio:.2f}x)")
+    return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
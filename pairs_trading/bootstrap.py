@@ -0,0 +1,239 @@
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from analysis import calculate_zscore
+from strategy import compute_positions
+from kalman import run_kalman_batch
+
+STRATEGIES = ('static', 'kalman')
+
+def stationary_bootstrap_indices(n_obs, n_reps, mean_block, rng):
+    """
+    Index matrix for the stationary block bootstrap (Politis & Romano, 1994).
+
+    Each row is one replication. A new block starts at a random observation
+    with probability 1 / mean_block, otherwise the previous index advances by
+    one (wrapping around), so block lengths are geometric with the given mean.
+
+    Returns:
+        np.ndarray of shape (n_reps, n_obs)
+    """
+    t = np.arange(n_obs)
+    new_block = rng.random((n_reps, n_obs)) < 1.0 / mean_block
+    new_block[:, 0] = True
+    starts = rng.integers(0, n_obs, size=(n_reps, n_obs))
+    block_start = np.maximum.accumulate(np.where(new_block, t, 0), axis=1)
+    rows = np.arange(n_reps)[:, None]
+    return (starts[rows, block_start] + t - block_start) % n_obs
+
+def simulate_paths(series1, series2, n_reps, method='block', mean_block=20, rng=None):
+    """
+    Generates synthetic price paths for a pair.
+
+    Args:
+        series1, series2 (array-like): Historical prices of asset 1 and asset 2.
+        n_reps (int): Number of replications.
+        method (str): 'block' resamples the joint daily log returns of both assets
+                      with a stationary block bootstrap, keeping their cross-correlation
+                      and short-range dependence. 'synthetic' resamples asset 2's log
+                      returns and rebuilds asset 1 from the fitted static regression plus
+                      an AR(1) spread, so every path is cointegrated by construction.
+        mean_block (int): Mean block length for the bootstrap.
+        rng (np.random.Generator): Random source.
+
+    Returns:
+        tuple: (paths1, paths2), each of shape (n_obs, n_reps)
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    y = np.asarray(series1, dtype=float)
+    x = np.asarray(series2, dtype=float)
+    n_obs = len(y) - 1
+
+    log_returns = np.diff(np.log(np.column_stack([y, x])), axis=0)
+
+    if method == 'block':
+        idx = stationary_bootstrap_indices(n_obs, n_reps, mean_block, rng)
+        sampled = log_returns[idx]  # (n_reps, n_obs, 2)
+        growth = np.exp(np.cumsum(sampled, axis=1))
+        paths1 = np.concatenate([np.full((n_reps, 1), y[0]), y[0] * growth[:, :, 0]], axis=1)
+        paths2 = np.concatenate([np.full((n_reps, 1), x[0]), x[0] * growth[:, :, 1]], axis=1)
+        return paths1.T, paths2.T
+
+    if method == 'synthetic':
+        beta, alpha = np.polyfit(x, y, 1)
+        residual = y - (alpha + beta * x)
+        phi = np.dot(residual[1:], residual[:-1]) / np.dot(residual[:-1], residual[:-1])
+        innovations = residual[1:] - phi * residual[:-1]
+
+        idx = stationary_bootstrap_indices(n_obs, n_reps, mean_block, rng)
+        x_growth = np.exp(np.cumsum(log_returns[idx, 1], axis=1))
+        paths2 = np.concatenate([np.full((n_reps, 1), x[0]), x[0] * x_growth], axis=1)
+
+        shocks = innovations[rng.integers(0, n_obs, size=(n_reps, n_obs))]
+        spread = np.empty((n_reps, n_obs + 1))
+        spread[:, 0] = residual[0]
+        for t in range(1, n_obs + 1):
+            spread[:, t] = phi * spread[:, t - 1] + shocks[:, t - 1]
+
+        paths1 = alpha + beta * paths2 + spread
+        return paths1.T, paths2.T
+
+    raise ValueError(f"Unknown method '{method}', expected 'block' or 'synthetic'")
+
+def backtest_paths(paths1, paths2, strategy='static', window=30, entry_threshold=2.0,
+                   exit_threshold=0.0, delta=1e-5, R=1e-3):
+    """
+    Runs one strategy over many price paths as whole-array operations.
+
+    Mirrors run_pipeline: OLS (static) or Kalman spread, rolling z-score,
+    position state machine and Position(t-1) * (Asset1_Return - Asset2_Return).
+
+    Returns:
+        np.ndarray of daily strategy returns, shape (n_obs, n_paths); the first row is NaN.
+    """
+    if strategy == 'static':
+        x_dev = paths2 - paths2.mean(axis=0)
+        y_dev = paths1 - paths1.mean(axis=0)
+        hedge_ratio = (x_dev * y_dev).sum(axis=0) / (x_dev * x_dev).sum(axis=0)
+        spread = paths1 - hedge_ratio * paths2
+    elif strategy == 'kalman':
+        spread, _ = run_kalman_batch(paths1, paths2, delta=delta, R=R)
+    else:
+        raise ValueError(f"Unknown strategy '{strategy}', expected one of {STRATEGIES}")
+
+    zscore = calculate_zscore(pd.DataFrame(spread), window).values
+    positions, _ = compute_positions(zscore, entry_threshold, exit_threshold)
+
+    asset_returns = (paths1[1:] / paths1[:-1] - 1) - (paths2[1:] / paths2[:-1] - 1)
+    daily_returns = np.full(paths1.shape, np.nan)
+    daily_returns[1:] = positions[:-1] * asset_returns
+    return daily_returns
+
+def summarize_returns(daily_returns, periods_per_year=252):
+    """
+    Total return and annualised Sharpe ratio of each column.
+
+    Returns:
+        tuple: (total_returns, sharpe_ratios), each of shape (n_paths,)
+    """
+    returns = np.nan_to_num(daily_returns[1:])
+    total = np.prod(1 + returns, axis=0) - 1
+    std = returns.std(axis=0, ddof=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sharpe = np.where(std > 0, returns.mean(axis=0) / std * np.sqrt(periods_per_year), 0.0)
+    return total, sharpe
+
+def _run_batch(args):
+    """Worker: simulate one batch of paths and backtest every strategy on it."""
+    series1, series2, n_reps, method, mean_block, seed, strategies, params = args
+    rng = np.random.default_rng(seed)
+    paths1, paths2 = simulate_paths(series1, series2, n_reps, method=method, mean_block=mean_block, rng=rng)
+    results = {}
+    for strategy in strategies:
+        results[strategy] = summarize_returns(backtest_paths(paths1, paths2, strategy=strategy, **params))
+    return results
+
+@dataclass
+class BootstrapResult:
+    """Per-replication total returns and Sharpe ratios for each strategy."""
+    method: str
+    n_reps: int
+    total_returns: Dict[str, np.ndarray] = field(default_factory=dict)
+    sharpe_ratios: Dict[str, np.ndarray] = field(default_factory=dict)
+
+    def summary(self) -> pd.DataFrame:
+        """Distribution summary (mean, std and 5/50/95th percentiles) per strategy."""
+        rows = {}
+        for strategy in self.total_returns:
+            total = self.total_returns[strategy]
+            sharpe = self.sharpe_ratios[strategy]
+            rows[strategy] = {
+                'mean_return': total.mean(),
+                'std_return': total.std(ddof=1),
+                'p5_return': np.percentile(total, 5),
+                'median_return': np.median(total),
+                'p95_return': np.percentile(total, 95),
+                'prob_loss': (total < 0).mean(),
+                'mean_sharpe': sharpe.mean(),
+                'p5_sharpe': np.percentile(sharpe, 5),
+                'p95_sharpe': np.percentile(sharpe, 95)
+            }
+        return pd.DataFrame(rows).T
+
+    def compare(self, strategy_a='kalman', strategy_b='static', metric='sharpe') -> dict:
+        """
+        Paired bootstrap test of strategy_a - strategy_b on the same paths.
+
+        Returns:
+            dict with the mean difference, the probability strategy_a wins, and
+            one- and two-sided bootstrap p-values for 'no difference'.
+        """
+        values = self.sharpe_ratios if metric == 'sharpe' else self.total_returns
+        diff = values[strategy_a] - values[strategy_b]
+        p_not_better = (np.sum(diff <= 0) + 1) / (len(diff) + 1)
+        p_not_worse = (np.sum(diff >= 0) + 1) / (len(diff) + 1)
+        return {
+            'metric': metric,
+            'mean_difference': float(diff.mean()),
+            'prob_a_better': float((diff > 0).mean()),
+            'p_value_one_sided': float(p_not_better),
+            'p_value_two_sided': float(min(1.0, 2 * min(p_not_better, p_not_worse)))
+        }
+
+def run_bootstrap_study(series1, series2,
+                        n_reps=2000,
+                        method='block',
+                        mean_block=20,
+                        strategies=STRATEGIES,
+                        batch_size=250,
+                        n_jobs: Optional[int] = None,
+                        seed=0,
+                        window=30,
+                        entry_threshold=2.0,
+                        exit_threshold=0.0) -> BootstrapResult:
+    """
+    Bootstrap robustness study of the static and Kalman strategies on one pair.
+
+    Replications are simulated and backtested in batches of `batch_size` paths
+    as array operations, and batches are spread across `n_jobs` processes.
+    Each batch gets its own child seed, so results are reproducible for a given
+    seed regardless of n_jobs.
+
+    Args:
+        series1, series2: Historical prices of asset 1 and asset 2
+        n_reps: Number of replications
+        method: 'block' or 'synthetic' (see simulate_paths)
+        mean_block: Mean bootstrap block length
+        strategies: Strategies to backtest on every path
+        batch_size: Paths per batch
+        n_jobs: Worker processes (defaults to the CPU count; 1 runs in-process)
+        seed: Base random seed
+
+    Returns:
+        BootstrapResult
+    """
+    series1 = np.asarray(series1, dtype=float)
+    series2 = np.asarray(series2, dtype=float)
+    params = {'window': window, 'entry_threshold': entry_threshold, 'exit_threshold': exit_threshold}
+
+    sizes = [min(batch_size, n_reps - start) for start in range(0, n_reps, batch_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(series1, series2, size, method, mean_block, child, tuple(strategies), params)
+             for size, child in zip(sizes, seeds)]
+
+    n_jobs = n_jobs or os.cpu_count() or 1
+    if n_jobs == 1 or len(tasks) == 1:
+        batches = [_run_batch(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(n_jobs, len(tasks))) as pool:
+            batches = list(pool.map(_run_batch, tasks))
+
+    result = BootstrapResult(method=method, n_reps=n_reps)
+    for strategy in strategies:
+        result.total_returns[strategy] = np.concatenate([batch[strategy][0] for batch in batches])
+        result.sharpe_ratios[strategy] = np.concatenate([batch[strategy][1] for batch in batches])
+    return result
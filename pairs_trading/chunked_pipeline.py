@@ -0,0 +1,215 @@
+import os
+import numpy as np
+import pandas as pd
+from analysis import calculate_zscore
+from strategy import compute_positions
+from kalman import KalmanFilterReg
+
+class RollingZScoreState:
+    """
+    Rolling z-score that can be fed one chunk at a time.
+
+    Keeps the last window - 1 spread values between calls so the first bars of
+    a chunk see the same window they would in a single in-memory pass.
+    """
+    def __init__(self, window):
+        self.window = window
+        self.tail = np.empty(0)
+
+    def update(self, spread):
+        values = np.concatenate([self.tail, np.asarray(spread, dtype=float)])
+        zscore = calculate_zscore(pd.Series(values), self.window).values[len(self.tail):]
+        self.tail = values[max(len(values) - (self.window - 1), 0):] if self.window > 1 else np.empty(0)
+        return zscore
+
+class PositionState:
+    """Position state machine from generate_signals, carried across chunks."""
+    def __init__(self, entry_threshold=2.0, exit_threshold=0.0):
+        self.entry_threshold = entry_threshold
+        self.exit_threshold = exit_threshold
+        self.position = 0
+
+    def update(self, zscore):
+        positions, self.position = compute_positions(
+            zscore, self.entry_threshold, self.exit_threshold, initial_position=self.position
+        )
+        return positions
+
+class ReturnState:
+    """
+    Incremental version of backtest.calculate_returns.
+
+    Carries the previous bar's prices, position and cumulative return so that
+    Position(t-1) * (Asset1_Return - Asset2_Return) can be computed per chunk.
+    """
+    def __init__(self):
+        self.last_prices = None
+        self.last_position = np.nan
+        self.cumulative = 1.0
+
+    def update(self, prices1, prices2, positions):
+        prices1 = np.asarray(prices1, dtype=float)
+        prices2 = np.asarray(prices2, dtype=float)
+        if self.last_prices is None:
+            prev1 = np.concatenate([[np.nan], prices1[:-1]])
+            prev2 = np.concatenate([[np.nan], prices2[:-1]])
+        else:
+            prev1 = np.concatenate([[self.last_prices[0]], prices1[:-1]])
+            prev2 = np.concatenate([[self.last_prices[1]], prices2[:-1]])
+        prev_positions = np.concatenate([[self.last_position], positions[:-1]])
+
+        daily_returns = prev_positions * ((prices1 / prev1 - 1) - (prices2 / prev2 - 1))
+        # Matches pandas cumprod, which skips NaNs
+        growth = np.where(np.isnan(daily_returns), 1.0, 1 + daily_returns)
+        cumulative = self.cumulative * np.cumprod(growth)
+        cumulative[np.isnan(daily_returns)] = np.nan
+
+        if len(prices1) > 0:
+            self.last_prices = (prices1[-1], prices2[-1])
+            self.last_position = positions[-1]
+            self.cumulative = self.cumulative * growth.prod()
+        return daily_returns, cumulative
+
+class KalmanSpreadState:
+    """Runs KalmanFilterReg chunk by chunk, keeping the filter state between calls."""
+    def __init__(self, delta=1e-5, R=1e-3):
+        self.kf = KalmanFilterReg(delta=delta, R=R)
+
+    def update(self, series1, series2):
+        y_values = np.asarray(series1, dtype=float).tolist()
+        x_values = np.asarray(series2, dtype=float).tolist()
+        spreads = np.empty(len(y_values))
+        hedge_ratios = np.empty(len(y_values))
+        for i, (x, y) in enumerate(zip(x_values, y_values)):
+            beta, alpha = self.kf.update(x, y)
+            hedge_ratios[i] = beta
+            spreads[i] = y - (beta * x + alpha)
+        return spreads, hedge_ratios
+
+def iter_frame_chunks(data, chunk_size):
+    """Yields consecutive row windows of a DataFrame (views, not copies)."""
+    for start in range(0, len(data), chunk_size):
+        yield data.iloc[start:start + chunk_size]
+
+def fit_hedge_ratio_streaming(chunks, tickers=None):
+    """
+    OLS slope of asset1 on asset2 (with intercept) computed in one pass over chunks.
+
+    Per-chunk means and co-moments are merged with the pairwise update of
+    Chan et al., which stays accurate for long, high-priced series where naive
+    sums of x*y would lose precision. Equals calculate_hedge_ratio on the
+    concatenated data up to floating-point rounding.
+
+    Args:
+        chunks: Iterable of price DataFrames
+        tickers: [ticker1, ticker2] columns to use (defaults to the first two)
+    """
+    n = 0
+    mean_x = mean_y = 0.0
+    sxx = sxy = 0.0
+    for chunk in chunks:
+        if tickers is not None:
+            y, x = chunk[tickers[0]].values, chunk[tickers[1]].values
+        else:
+            y, x = chunk.iloc[:, 0].values, chunk.iloc[:, 1].values
+        m = len(x)
+        if m == 0:
+            continue
+        chunk_mean_x, chunk_mean_y = x.mean(), y.mean()
+        dx, dy = x - chunk_mean_x, y - chunk_mean_y
+        delta_x, delta_y = chunk_mean_x - mean_x, chunk_mean_y - mean_y
+        total = n + m
+        sxx += (dx * dx).sum() + delta_x * delta_x * n * m / total
+        sxy += (dx * dy).sum() + delta_x * delta_y * n * m / total
+        mean_x += delta_x * m / total
+        mean_y += delta_y * m / total
+        n = total
+    if n < 2 or sxx == 0:
+        raise ValueError("Not enough data to estimate a hedge ratio")
+    return float(sxy / sxx)
+
+class CsvResultWriter:
+    """on_chunk callback that appends each chunk's results to a CSV file."""
+    def __init__(self, path):
+        self.path = path
+        if os.path.exists(path):
+            os.remove(path)
+        self._header = True
+
+    def __call__(self, frame):
+        frame.to_csv(self.path, mode='a', header=self._header)
+        self._header = False
+
+def run_chunked_backtest(chunks,
+                         hedge_ratio=None,
+                         use_kalman=False,
+                         window=30,
+                         entry_threshold=2.0,
+                         exit_threshold=0.0,
+                         on_chunk=None,
+                         tickers=None):
+    """
+    Runs the spread, z-score, signal and backtest stages chunk by chunk.
+
+    Only one chunk plus a window-sized tail is held in memory at a time, so
+    this works over arbitrarily long histories, e.g. the memory-mapped minute
+    bars yielded by BarStore.iter_aligned_chunks.
+
+    Args:
+        chunks: Iterable of two-column price DataFrames [asset1, asset2], in time order.
+        hedge_ratio (float): Static hedge ratio (required unless use_kalman), usually
+                             estimated on a separate training window.
+        use_kalman (bool): Use the Kalman Filter for a dynamic hedge ratio instead.
+        window (int): Z-score rolling window, in bars.
+        entry_threshold, exit_threshold (float): Signal thresholds.
+        on_chunk (callable): Optional callback receiving each chunk's results DataFrame
+                             (spread, hedge_ratio, zscore, positions, daily_returns,
+                             cumulative_returns), e.g. a CsvResultWriter.
+        tickers (list): Optional [ticker1, ticker2] columns for the spread. Returns,
+                        like calculate_returns, always use the first two columns.
+
+    Returns:
+        dict: 'bars' processed and 'final_return' (cumulative growth of 1).
+    """
+    if hedge_ratio is None and not use_kalman:
+        raise ValueError("A static hedge_ratio is required when use_kalman=False")
+
+    zscore_state = RollingZScoreState(window)
+    position_state = PositionState(entry_threshold, exit_threshold)
+    return_state = ReturnState()
+    kalman_state = KalmanSpreadState() if use_kalman else None
+    bars = 0
+
+    for chunk in chunks:
+        if chunk.empty:
+            continue
+        if tickers is not None:
+            series1, series2 = chunk[tickers[0]].values, chunk[tickers[1]].values
+        else:
+            series1, series2 = chunk.iloc[:, 0].values, chunk.iloc[:, 1].values
+
+        if use_kalman:
+            spread, hedge_ratios = kalman_state.update(series1, series2)
+        else:
+            spread = series1 - hedge_ratio * series2
+            hedge_ratios = np.full(len(spread), hedge_ratio)
+
+        zscore = zscore_state.update(spread)
+        positions = position_state.update(zscore)
+        daily_returns, cumulative = return_state.update(chunk.iloc[:, 0].values, chunk.iloc[:, 1].values, positions)
+        bars += len(chunk)
+
+        if on_chunk is not None:
+            on_chunk(pd.DataFrame({
+                'spread': spread,
+                'hedge_ratio': hedge_ratios,
+                'zscore': zscore,
+                'positions': positions,
+                'daily_returns': daily_returns,
+                'cumulative_returns': cumulative
+            }, index=chunk.index))
+
+    return {
+        'bars': bars,
+        'final_return': float(return_state.cumulative)
+    }
@@ -0,0 +1,102 @@
+# Thin command-line client for the research daemon (daemon.py). Standard library only, so it starts instantly.
+import argparse
+import json
+import os
+import socket
+import sys
+import tempfile
+
+def socket_path():
+    """Daemon socket: $PAIRS_DAEMON_SOCKET, or a per-user file in the temp directory."""
+    default = os.path.join(tempfile.gettempdir(), f'pairs_trading_{os.getuid()}.sock')
+    return os.environ.get('PAIRS_DAEMON_SOCKET', default)
+
+def request(job, path=None, timeout=None, **params):
+    """
+    Sends one job to the daemon and waits for its reply.
+
+    Args:
+        job (str): Job name, e.g. 'experiment', 'discover', 'pair_stats', 'status'.
+        path (str): Socket path (defaults to socket_path()).
+        timeout (float): Seconds to wait for the reply (None waits forever).
+        **params: Job parameters (JSON-serializable).
+
+    Returns:
+        dict: The job result.
+
+    Raises:
+        ConnectionError: No daemon is listening.
+        RuntimeError: The job failed in the daemon.
+    """
+    path = path or socket_path()
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        try:
+            sock.connect(path)
+        except (FileNotFoundError, ConnectionRefusedError) as e:
+            raise ConnectionError(f"No daemon listening on {path}; start one with "
+                                  f"'python3 pairs_trading/daemon.py'") from e
+        sock.sendall(json.dumps({'job': job, 'params': params}).encode() + b'\n')
+        with sock.makefile('rb') as reader:
+            line = reader.readline()
+    if not line:
+        raise ConnectionError("The daemon closed the connection without replying")
+    reply = json.loads(line)
+    if reply['status'] != 'ok':
+        raise RuntimeError(reply.get('error', 'job failed'))
+    return reply['result']
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Submit jobs to a running pairs trading daemon.")
+    parser.add_argument('--socket', default=None, help="Daemon socket path")
+    sub = parser.add_subparsers(dest='job', required=True)
+
+    experiment = sub.add_parser('experiment', help="Backtest one pair")
+    experiment.add_argument('tickers', nargs=2)
+    experiment.add_argument('--start', default='2020-01-01')
+    experiment.add_argument('--end', default='2023-01-01')
+    experiment.add_argument('--kalman', action='store_true', help="Dynamic (Kalman) hedge ratio")
+    experiment.add_argument('--window', type=int, default=30)
+    experiment.add_argument('--entry', type=float, default=2.0)
+    experiment.add_argument('--exit', type=float, default=0.0)
+
+    discover = sub.add_parser('discover', help="Screen a universe for cointegrated pairs")
+    discover.add_argument('--tickers', nargs='+', default=None, help="Defaults to ASSET_UNIVERSE")
+    discover.add_argument('--start', default='2020-01-01')
+    discover.add_argument('--end', default='2022-01-01')
+    discover.add_argument('--prune', default=None, choices=['sector', 'correlation', 'pca'])
+    discover.add_argument('--top', type=int, default=10)
+    discover.add_argument('--align', default=None, choices=['intersection', 'union'],
+                          help="Test each pair on its own aligned calendar (mixed asset classes)")
+    discover.add_argument('--refresh', action='store_true', help="Ignore the daemon's memoized result")
+
+    stats = sub.add_parser('pair_stats', help="Hedge ratio, cointegration and quality metrics of a pair")
+    stats.add_argument('tickers', nargs=2)
+    stats.add_argument('--start', default='2020-01-01')
+    stats.add_argument('--end', default='2023-01-01')
+
+    for name in ('status', 'ping', 'clear_cache', 'shutdown'):
+        sub.add_parser(name)
+
+    args = parser.parse_args(argv)
+    if args.job == 'experiment':
+        params = dict(tickers=args.tickers, start=args.start, end=args.end, use_kalman=args.kalman,
+                      window=args.window, entry_threshold=args.entry, exit_threshold=args.exit)
+    elif args.job == 'discover':
+        params = dict(tickers=args.tickers, start=args.start, end=args.end, prune_method=args.prune,
+                      top_n=args.top, refresh=args.refresh, align=args.align)
+    elif args.job == 'pair_stats':
+        params = dict(tickers=args.tickers, start=args.start, end=args.end)
+    else:
+        params = {}
+
+    try:
+        result = request(args.job, path=args.socket, **params)
+    except (ConnectionError, RuntimeError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    print(json.dumps(result, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
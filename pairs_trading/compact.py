@@ -0,0 +1,189 @@
+import numpy as np
+import pandas as pd
+from dataclasses import dataclass
+from typing import List, Optional
+
+from strategy import compute_positions
+from analysis import RollingStats
+from kalman import run_kalman_batch
+from position_events import PositionEvents
+
+FLAG_BITS = {'long_entry': 1, 'short_entry': 2, 'long_exit': 4, 'short_exit': 8}
+
+def pack_flags(zscore, entry_threshold=2.0, exit_threshold=0.0):
+    """The four generate_signals flags of each bar packed into one uint8."""
+    zscore = np.asarray(zscore)
+    flags = np.zeros(zscore.shape, dtype=np.uint8)
+    with np.errstate(invalid='ignore'):
+        flags |= (zscore < -entry_threshold).astype(np.uint8) * FLAG_BITS['long_entry']
+        flags |= (zscore > entry_threshold).astype(np.uint8) * FLAG_BITS['short_entry']
+        flags |= (zscore >= -exit_threshold).astype(np.uint8) * FLAG_BITS['long_exit']
+        flags |= (zscore <= exit_threshold).astype(np.uint8) * FLAG_BITS['short_exit']
+    return flags
+
+def unpack_flag(flags, name):
+    """Boolean array of one flag from pack_flags output."""
+    return (flags & FLAG_BITS[name]) != 0
+
+@dataclass
+class CompactBacktest:
+    """
+    Outputs of run_pipeline_compact, one column per pair.
+
+    hedge_ratio is (n_pairs,) for static spreads, or (n_bars, n_pairs) with use_kalman.
+    spread is None when keep_spread=False. With position_storage='events',
+    positions is None and position_events holds the trades instead.
+    """
+    pairs: List[tuple]
+    index: Optional[pd.Index]
+    hedge_ratio: np.ndarray
+    spread: Optional[np.ndarray]
+    zscore: np.ndarray
+    flags: np.ndarray
+    positions: Optional[np.ndarray]
+    daily_returns: np.ndarray
+    position_events: Optional[PositionEvents] = None
+
+    @property
+    def nbytes(self):
+        arrays = (self.hedge_ratio, self.spread, self.zscore, self.flags, self.positions, self.daily_returns,
+                  self.position_events)
+        return sum(a.nbytes for a in arrays if a is not None)
+
+    def dense_positions(self):
+        """(bar x pair) int8 positions, expanded from the events if they were stored that way."""
+        return self.positions if self.positions is not None else self.position_events.to_dense()
+
+    def events(self):
+        """The trades as PositionEvents, encoded from the dense positions if needed."""
+        if self.position_events is not None:
+            return self.position_events
+        return PositionEvents.from_dense(self.positions, index=self.index, columns=self.names())
+
+    def names(self):
+        return [f"{a}/{b}" for a, b in self.pairs]
+
+    def signals_frame(self, j):
+        """generate_signals-style DataFrame for pair j."""
+        signals = pd.DataFrame({'zscore': self.zscore[:, j].astype(float)}, index=self.index)
+        for name in FLAG_BITS:
+            signals[name] = unpack_flag(self.flags[:, j], name)
+        if self.positions is not None:
+            signals['positions'] = self.positions[:, j].astype(np.int64)
+        else:
+            signals['positions'] = self.position_events.to_series(j).values
+        return signals
+
+    def returns_frame(self):
+        """Daily returns as a float64 (bar x pair) frame, e.g. for compute_performance."""
+        return pd.DataFrame(self.daily_returns.astype(float), index=self.index, columns=self.names())
+
+    def positions_frame(self):
+        return pd.DataFrame(self.dense_positions(), index=self.index, columns=self.names())
+
+def _hedge_ratios(y, x):
+    """OLS slope with intercept per column, as calculate_hedge_ratio."""
+    valid = np.isfinite(y) & np.isfinite(x)
+    n = valid.sum(axis=0)
+    x = np.where(valid, x, 0.0)
+    y = np.where(valid, y, 0.0)
+    mean_x = x.sum(axis=0) / n
+    mean_y = y.sum(axis=0) / n
+    dx = np.where(valid, x - mean_x, 0.0)
+    dy = np.where(valid, y - mean_y, 0.0)
+    return (dx * dy).sum(axis=0) / (dx * dx).sum(axis=0)
+
+def run_pipeline_compact(prices, pairs, window=30, entry_threshold=2.0, exit_threshold=0.0,
+                         use_kalman=False, delta=1e-5, R=1e-3, block_size=256, keep_spread=True,
+                         position_storage='dense'):
+    """
+    Compact-dtype version of run_pipeline for many pairs of one price panel.
+
+    Prices, spreads, z-scores and returns are stored as float32, positions as
+    int8 and the generate_signals flags bit-packed into one uint8 per bar
+    (FLAG_BITS): 14 bytes per pair per bar, 10 with keep_spread=False, against
+    about 40 for run_pipeline's float64 outputs (60 with a generate_signals
+    frame). Pairs are processed in blocks of block_size. Within a block the
+    hedge ratios, rolling sums and returns are computed in float64 from the
+    float32 prices, then stored as float32. The README lists the measured
+    accuracy against the float64 pipeline. The main error source is rounding
+    the prices to float32, about 7 significant digits.
+
+    Args:
+        prices (pd.DataFrame or np.ndarray): Prices, one column per ticker (stored as float32).
+        pairs (list): (ticker1, ticker2) tuples, or column-number tuples for an array;
+                      spread = ticker1 - hedge_ratio * ticker2 as in run_pipeline.
+        window, entry_threshold, exit_threshold: As for run_pipeline.
+        use_kalman (bool): Dynamic hedge ratio from run_kalman_batch.
+        block_size (int): Pairs processed together; bounds the float64 working set.
+        keep_spread (bool): Also keep the spreads.
+        position_storage (str): 'dense' keeps the int8 (bar x pair) positions;
+                                'events' keeps only the trades (PositionEvents),
+                                a few bytes per trade instead of one per bar.
+
+    Returns:
+        CompactBacktest
+    """
+    index = getattr(prices, 'index', None)
+    if isinstance(prices, pd.DataFrame):
+        column = {ticker: i for i, ticker in enumerate(prices.columns)}
+        legs = np.array([[column[a], column[b]] for a, b in pairs], dtype=np.int64).reshape(-1, 2)
+        values = prices.values.astype(np.float32, copy=False)
+    else:
+        legs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+        values = np.asarray(prices, dtype=np.float32)
+    n_bars, n_pairs = len(values), len(legs)
+
+    hedge_ratio = np.empty((n_bars, n_pairs) if use_kalman else n_pairs, dtype=np.float32)
+    spread = np.empty((n_bars, n_pairs), dtype=np.float32) if keep_spread else None
+    zscore = np.empty((n_bars, n_pairs), dtype=np.float32)
+    flags = np.empty((n_bars, n_pairs), dtype=np.uint8)
+    if position_storage not in ('dense', 'events'):
+        raise ValueError(f"Unknown position_storage '{position_storage}', expected 'dense' or 'events'")
+    positions = np.empty((n_bars, n_pairs), dtype=np.int8) if position_storage == 'dense' else None
+    event_blocks = []
+    daily_returns = np.empty((n_bars, n_pairs), dtype=np.float32)
+
+    for start in range(0, n_pairs, block_size):
+        block = slice(start, min(start + block_size, n_pairs))
+        first, second = legs[block, 0], legs[block, 1]
+        y = values[:, first].astype(float)
+        x = values[:, second].astype(float)
+
+        if use_kalman:
+            block_spread, beta = run_kalman_batch(y, x, delta=delta, R=R)
+        else:
+            beta = _hedge_ratios(y, x)
+            block_spread = y - beta * x
+        hedge_ratio[..., block] = beta
+        if keep_spread:
+            spread[:, block] = block_spread
+
+        z = RollingStats(block_spread).zscore(window)
+        zscore[:, block] = z
+        # From the float64 z-scores, like the positions, so flags and positions agree at the thresholds
+        flags[:, block] = pack_flags(z, entry_threshold, exit_threshold)
+        block_positions, _ = compute_positions(z, entry_threshold, exit_threshold, dtype=np.int8)
+        if positions is not None:
+            positions[:, block] = block_positions
+        else:
+            event_blocks.append(PositionEvents.from_dense(block_positions, index=index,
+                                                          columns=[f"{a}/{b}" for a, b in pairs[block]]))
+
+        # Strategy Return = Position(t-1) * (Asset1_Return - Asset2_Return), as calculate_returns
+        with np.errstate(divide='ignore', invalid='ignore'):
+            spread_return = (y[1:] / y[:-1]) - (x[1:] / x[:-1])
+        daily_returns[0, block] = np.nan
+        daily_returns[1:, block] = block_positions[:-1] * spread_return
+
+    return CompactBacktest(
+        pairs=[tuple(p) for p in pairs],
+        index=index,
+        hedge_ratio=hedge_ratio,
+        spread=spread,
+        zscore=zscore,
+        flags=flags,
+        positions=positions,
+        daily_returns=daily_returns,
+        position_events=PositionEvents.hstack(event_blocks) if event_blocks else None
+    )
@@ -0,0 +1,219 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import argparse
+import json
+import socket
+import socketserver
+import threading
+import time
+
+import numpy as np
+
+# Everything a job may need is imported once, when the daemon starts
+import data_loader
+from data_loader import fetch_data, LRUCache
+from analysis import calculate_hedge_ratio, check_cointegration, calculate_spread
+from advanced_metrics import score_pair_quality
+from main import run_pipeline
+from pair_discovery import discover_pairs
+from performance import compute_performance
+from client import socket_path
+import events
+
+def _jsonable(value):
+    """Converts NumPy scalars and arrays in job results to plain Python."""
+    if isinstance(value, dict):
+        return {str(k): _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    if isinstance(value, np.ndarray):
+        return _jsonable(value.tolist())
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+class ResearchDaemon:
+    """
+    Long-lived process that keeps the libraries, the fetch_data cache and
+    memoized statistics warm between research jobs. Both are LRU caches
+    capped at cache_entries and memo_entries.
+
+    Jobs arrive as one JSON line per connection on a Unix socket (see
+    client.request) and run one at a time; 'ping' and 'status' answer even
+    while a job is running.
+
+    Jobs:
+        experiment:  run_pipeline on one pair -> performance metrics
+        discover:    discover_pairs on a universe -> candidates (memoized)
+        pair_stats:  hedge ratio, cointegration and quality metrics of a pair (memoized)
+        status, ping, clear_cache, shutdown
+    """
+    def __init__(self, path=None, cache_entries=256, memo_entries=1024):
+        self.path = path or socket_path()
+        self.cache = data_loader.enable_cache(cache_entries)
+        self.memo = LRUCache(memo_entries)
+        self.started = time.time()
+        self.jobs_served = 0
+        self._job_lock = threading.Lock()
+        self.server = None
+        self.jobs = {
+            'experiment': self.experiment,
+            'discover': self.discover,
+            'pair_stats': self.pair_stats,
+            'status': self.status,
+            'ping': lambda: {'pong': True},
+            'clear_cache': self.clear_cache,
+            'shutdown': self.shutdown,
+        }
+
+    # Jobs
+
+    def experiment(self, tickers, start, end, use_kalman=False, window=30, entry_threshold=2.0, exit_threshold=0.0):
+        data = fetch_data(list(tickers), start, end, how='intersection')
+        if data.empty or any(t not in data.columns for t in tickers):
+            raise ValueError(f"No data for {tickers} from {start} to {end}")
+        result = run_pipeline(data, list(tickers), use_kalman=use_kalman, window=window,
+                              entry_threshold=entry_threshold, exit_threshold=exit_threshold)
+        metrics = compute_performance(result['metrics']['daily_returns'], result['positions']).iloc[0]
+        return {
+            'tickers': list(tickers),
+            'model': 'kalman' if use_kalman else 'static',
+            'final_return': float(metrics['total_return'] + 1),
+            'hedge_ratio': float(np.mean(result['hedge_ratio'])),
+            'n_bars': len(data),
+            **{k: float(v) for k, v in metrics.items()}
+        }
+
+    def discover(self, start, end, tickers=None, prune_method=None, p_value_threshold=0.05,
+                 correlation_threshold=0.7, top_n=10, refresh=False, align=None):
+        from run_discovery import ASSET_UNIVERSE, UNIVERSE_MEMBERSHIP
+        # The point-in-time membership only describes ASSET_UNIVERSE; explicit tickers are screened as given
+        membership = None
+        if tickers is None:
+            tickers = [t for sector in ASSET_UNIVERSE.values() for t in sector]
+            membership = UNIVERSE_MEMBERSHIP
+        key = ('discover', tuple(tickers), start, end, prune_method, p_value_threshold, correlation_threshold, align)
+        candidates = None if refresh else self.memo.get(key)
+        if candidates is None:
+            candidates = discover_pairs(tickers, start, end, p_value_threshold=p_value_threshold,
+                                        correlation_threshold=correlation_threshold,
+                                        prune_method=prune_method, sectors=ASSET_UNIVERSE, align=align,
+                                        membership=membership)
+            self.memo.put(key, candidates)
+        return {
+            'pairs_found': len(candidates),
+            'candidates': [{'ticker1': c.ticker1, 'ticker2': c.ticker2, 'p_value': c.p_value,
+                            'correlation': c.correlation, 'hedge_ratio': c.hedge_ratio}
+                           for c in candidates[:top_n]]
+        }
+
+    def pair_stats(self, tickers, start, end):
+        key = ('pair_stats', tuple(tickers), start, end)
+        stats = self.memo.get(key)
+        if stats is None:
+            data = fetch_data(list(tickers), start, end, how='intersection')
+            if data.empty or any(t not in data.columns for t in tickers):
+                raise ValueError(f"No data for {tickers} from {start} to {end}")
+            series1, series2 = data[tickers[0]], data[tickers[1]]
+            hedge_ratio = calculate_hedge_ratio(series1, series2)
+            _, p_value, _ = check_cointegration(series1, series2)
+            quality = score_pair_quality(calculate_spread(series1, series2, hedge_ratio), series1, series2)
+            stats = {'hedge_ratio': hedge_ratio, 'p_value': p_value, **quality}
+            self.memo.put(key, stats)
+        return stats
+
+    def status(self):
+        return {
+            'pid': os.getpid(),
+            'socket': self.path,
+            'uptime_seconds': time.time() - self.started,
+            'jobs_served': self.jobs_served,
+            'busy': self._job_lock.locked(),
+            'price_cache': self.cache.stats(),
+            'memoized': self.memo.stats()
+        }
+
+    def clear_cache(self):
+        self.cache.clear()
+        self.memo.clear()
+        return {'cleared': True}
+
+    def shutdown(self):
+        # shutdown() blocks until serve_forever returns, so it cannot run on a handler thread
+        threading.Thread(target=self.server.shutdown, daemon=True).start()
+        return {'stopping': True}
+
+    # Serving
+
+    def handle(self, message):
+        """Runs one request dict and returns the reply dict."""
+        job = message.get('job')
+        params = message.get('params') or {}
+        if job not in self.jobs:
+            return {'status': 'error', 'error': f"Unknown job '{job}', expected one of {sorted(self.jobs)}"}
+        started = time.perf_counter()
+        try:
+            if job in ('ping', 'status', 'shutdown'):
+                result = self.jobs[job](**params)
+            else:
+                with self._job_lock:
+                    result = self.jobs[job](**params)
+        except Exception as e:
+            events.warning('daemon_job_failed', f"Job {job} failed: {type(e).__name__}: {e}", job=job)
+            return {'status': 'error', 'error': f"{type(e).__name__}: {e}"}
+        self.jobs_served += 1
+        elapsed = time.perf_counter() - started
+        events.info('daemon_job', f"{job} done in {elapsed * 1000:.1f} ms", job=job, seconds=elapsed)
+        return {'status': 'ok', 'result': _jsonable(result), 'seconds': elapsed}
+
+    def start(self):
+        """Binds the socket (replacing a stale one) and returns the server; call serve_forever() on it."""
+        if os.path.exists(self.path):
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                try:
+                    probe.connect(self.path)
+                except (ConnectionRefusedError, FileNotFoundError):
+                    os.unlink(self.path)
+                else:
+                    raise RuntimeError(f"A daemon is already listening on {self.path}")
+
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                line = self.rfile.readline()
+                if not line:
+                    return
+                try:
+                    reply = daemon.handle(json.loads(line))
+                except json.JSONDecodeError as e:
+                    reply = {'status': 'error', 'error': f"Bad request: {e}"}
+                self.wfile.write(json.dumps(reply).encode() + b'\n')
+
+        self.server = socketserver.ThreadingUnixStreamServer(self.path, Handler)
+        self.server.daemon_threads = True
+        events.info('daemon_started', f"Pairs trading daemon listening on {self.path}", socket=self.path, pid=os.getpid())
+        return self.server
+
+    def serve_forever(self):
+        server = self.server or self.start()
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+            events.info('daemon_stopped', "Daemon stopped", jobs_served=self.jobs_served)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the pairs trading research daemon.")
+    parser.add_argument('--socket', default=None, help="Socket path (default: $PAIRS_DAEMON_SOCKET or a temp file)")
+    parser.add_argument('--cache-entries', type=int, default=256, help="Price frames kept in memory")
+    parser.add_argument('--memo-entries', type=int, default=1024, help="Memoized job results kept in memory")
+    args = parser.parse_args()
+    ResearchDaemon(args.socket, args.cache_entries, args.memo_entries).serve_forever()
+
+if __name__ == "__main__":
+    main()
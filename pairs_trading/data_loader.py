@@ -1,19 +1,147 @@
+import threading
+from collections import OrderedDict
+
 import yfinance as yf
 import pandas as pd
+import events
+from alignment import CalendarIndex
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache holding at most max_entries values.
+    
+    Every operation takes one lock, so handler threads (e.g. the research
+    daemon's status job) can read stats while another thread puts entries.
+    """
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def _copy(self, value):
+        return value
+    
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._copy(value)
+    
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = self._copy(value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+class PriceCache(LRUCache):
+    """
+    In-process LRU cache of fetch_data results, keyed by (tickers, start, end).
+    
+    Off by default; long-lived processes such as the research daemon turn it
+    on with enable_cache() so repeated jobs skip the download. Frames are
+    copied in and out so callers cannot mutate the cached ones.
+    """
+    def _copy(self, frame):
+        return frame.copy()
+    
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses,
+                    'bytes': int(sum(f.memory_usage(deep=True).sum() for f in self._entries.values()))}
+
+_cache = None
+
+def enable_cache(max_entries=256):
+    """Turns on the fetch_data cache for this process and returns it."""
+    global _cache
+    if _cache is None:
+        _cache = PriceCache(max_entries)
+    return _cache
+
+def disable_cache():
+    global _cache
+    _cache = None
 
-def fetch_data(tickers, start_date, end_date):
+def get_cache():
+    return _cache
+
+def fetch_data(tickers, start_date, end_date, how=None, fill='ffill', max_staleness=None):
     """
     Fetches adjusted close prices for the given tickers.
     
+    By default tickers with less than 80% coverage are dropped and then every
+    row with a missing price, which intersects the calendars of the whole
+    universe; a warning reports how much was dropped. Passing `how` instead
+    aligns the tickers' own calendars with alignment.CalendarIndex and drops
+    no ticker, which is what mixed asset classes need (e.g. 24/7 crypto
+    against a weekday ETF, which has under 80% coverage on the crypto
+    calendar).
+    
     Args:
         tickers (list): List of ticker symbols (e.g., ['PEP', 'KO']).
         start_date (str): Start date in 'YYYY-MM-DD' format.
         end_date (str): End date in 'YYYY-MM-DD' format.
+        how (str): Optional calendar: 'intersection', 'union' or a ticker
+                   (see CalendarIndex.align).
+        fill (str): Fill policy used with `how` ('ffill' or 'none').
+        max_staleness: Optional pandas offset limiting forward-filled values.
         
     Returns:
-        pd.DataFrame: DataFrame containing adjusted close prices.
+        pd.DataFrame: DataFrame containing adjusted close prices, columns in
+                      the order yfinance returns them on either path.
     """
-    print(f"Fetching data for {tickers} from {start_date} to {end_date}...")
+    key = (tuple(tickers) if not isinstance(tickers, str) else (tickers,), str(start_date), str(end_date))
+    if how is not None:
+        key += (how, fill, str(max_staleness))
+    if _cache is not None:
+        cached = _cache.get(key)
+        if cached is not None:
+            events.debug('fetch_cached', f"Using cached data for {tickers} from {start_date} to {end_date}",
+                         tickers=tickers, start=start_date, end=end_date)
+            return cached
+    
+    if how is not None:
+        unaligned = fetch_unaligned_data(tickers, start_date, end_date)
+        if unaligned.empty:
+            return pd.DataFrame()
+        index = CalendarIndex.from_frame(unaligned)
+        missing = [t for t in ([tickers] if isinstance(tickers, str) else tickers) if t not in index]
+        if missing:
+            events.warning('data_dropped', f"No data for {missing}", tickers=missing)
+        # Columns keep the download's order, as on the default path: backtest.calculate_returns
+        # takes the legs by position, so reordering them would flip the sign of the returns
+        requested = set([tickers] if isinstance(tickers, str) else tickers)
+        tickers = [t for t in index.tickers if t in requested]
+        data = index.align(tickers, how=how, fill=fill, max_staleness=max_staleness)
+        events.debug('aligned', f"Aligned {len(index.tickers)} tickers on the {how} calendar: "
+                     f"{len(data)}/{len(index.timeline)} bars",
+                     how=how, bars=len(data), timeline_bars=len(index.timeline))
+        if data.empty:
+            events.warning('empty_data', "Warning: Data is empty after processing!", tickers=tickers)
+        elif _cache is not None:
+            _cache.put(key, data)
+        return data
+    
+    events.info('fetch', f"Fetching data for {tickers} from {start_date} to {end_date}...",
+                tickers=tickers, start=start_date, end=end_date)
     # If only one ticker, yfinance returns a Series or a DataFrame with one column.
     # If multiple, it returns a DataFrame.
     # We want to ensure we have a DataFrame with columns matching tickers.
@@ -35,12 +163,100 @@ def fetch_data(tickers, start_date, end_date):
     
     # Drop columns (tickers) that have too much missing data
     threshold = len(data) * 0.8  # Require at least 80% of data
+    n_rows = len(data)
+    sparse = [ticker for ticker in data.columns if data[ticker].count() < threshold]
     data = data.dropna(axis=1, thresh=threshold)
         
     # Drop rows with any remaining missing values
     data.dropna(inplace=True)
     
+    if sparse or len(data) < n_rows:
+        events.warning('data_dropped',
+                       f"Dropped {len(sparse)} tickers with <80% coverage{f' ({sparse})' if sparse else ''} "
+                       f"and {n_rows - len(data)}/{n_rows} rows with missing prices; "
+                       f"pass how='intersection' to align each ticker's own calendar instead",
+                       tickers=sparse, rows_dropped=n_rows - len(data), rows=n_rows)
+    
     if data.empty:
-        print("Warning: Data is empty after processing!")
+        events.warning('empty_data', "Warning: Data is empty after processing!", tickers=tickers)
+    elif _cache is not None:
+        _cache.put(key, data)
     
     return data
+
+def fetch_unaligned_data(tickers, start_date, end_date, interval='1d'):
+    """
+    Fetches close prices without dropping partially-missing rows.
+    
+    Rows where only some tickers have a bar are kept (as NaN) so each ticker's
+    own calendar survives for an as-of join, e.g. with alignment.CalendarIndex
+    or after writing the bars to a BarStore.
+    
+    Args:
+        tickers (list): List of ticker symbols.
+        start_date (str): Start date in 'YYYY-MM-DD' format.
+        end_date (str): End date in 'YYYY-MM-DD' format.
+        interval (str): Bar size understood by yfinance (e.g. '1d', '1m', '1h').
+        
+    Returns:
+        pd.DataFrame: Close prices indexed by bar timestamp.
+    """
+    if isinstance(tickers, str):
+        tickers = [tickers]
+    events.info('fetch', f"Fetching {interval} bars for {tickers} from {start_date} to {end_date}...",
+                tickers=tickers, start=start_date, end=end_date, interval=interval)
+    data = yf.download(tickers, start=start_date, end=end_date, interval=interval,
+                       auto_adjust=True, progress=False)
+    
+    if isinstance(data.columns, pd.MultiIndex):
+        if 'Close' in data.columns.get_level_values(0):
+            data = data['Close']
+    elif 'Close' in data.columns:
+        data = data[['Close']].rename(columns={'Close': tickers[0]})
+        
+    if isinstance(data, pd.Series):
+        data = data.to_frame()
+    
+    # Only drop bars where no ticker printed at all
+    data = data.dropna(how='all')
+    
+    if data.empty:
+        events.warning('empty_data', "Warning: Data is empty after processing!", tickers=tickers)
+    
+    return data
+
+def fetch_intraday_data(tickers, start_date, end_date, interval='1m'):
+    """
+    Fetches intraday close prices without dropping partially-missing rows.
+    
+    See fetch_unaligned_data. Note that Yahoo Finance only serves 1-minute
+    bars for roughly the last 30 days.
+    """
+    return fetch_unaligned_data(tickers, start_date, end_date, interval=interval)
+
+def download_to_store(store, tickers, start_date, end_date, window='365D', interval='1d'):
+    """
+    Downloads close prices into a BarStore one date window at a time.
+    
+    Only one window of bars is in memory at once, so long histories can be
+    streamed back from the store without ever holding them whole.
+    
+    Args:
+        store (BarStore): Destination store.
+        tickers (list): Ticker symbols.
+        start_date, end_date (str): [start, end) date range.
+        window (str): Pandas offset covered by each download.
+        interval (str): Bar size understood by yfinance.
+        
+    Returns:
+        int: Number of rows written.
+    """
+    rows = 0
+    bounds = list(pd.date_range(start_date, end_date, freq=window)) + [pd.Timestamp(end_date)]
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        if lo >= hi:
+            continue
+        data = fetch_unaligned_data(tickers, lo.strftime('%Y-%m-%d'), hi.strftime('%Y-%m-%d'), interval=interval)
+        store.write_frame(data)
+        rows += len(data)
+    return rows
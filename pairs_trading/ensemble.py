@@ -0,0 +1,160 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pandas as pd
+
+from data_loader import fetch_data
+from analysis import calculate_hedge_ratio, calculate_zscore
+from strategy import compute_positions
+from kalman import run_kalman_batch
+from profiling import span, profiled
+import events
+
+SLEEVES = ('static', 'kalman')
+WEIGHTINGS = ('fixed', 'rolling_sharpe')
+
+def compute_sleeves(data, tickers, window=30, entry_threshold=2.0, exit_threshold=0.0, delta=1e-5, R=1e-3):
+    """
+    Static and Kalman spreads, z-scores, positions and returns in one shared pass.
+
+    Both spreads are stacked as the columns of one array, so the rolling
+    z-score and the position state machine each run once for both sleeves,
+    and the asset returns are computed once. Each sleeve matches run_pipeline
+    with the same settings.
+
+    Args:
+        data (pd.DataFrame): Aligned prices of the two tickers, column order as for calculate_returns.
+        tickers (list): [ticker1, ticker2]; spread = ticker1 - hedge_ratio * ticker2.
+
+    Returns:
+        dict: 'spreads', 'zscores', 'positions', 'returns' (DataFrames with one
+              column per sleeve), 'hedge_ratio' (static, float) and
+              'kalman_hedge_ratio' (pd.Series).
+    """
+    series1 = data[tickers[0]]
+    series2 = data[tickers[1]]
+    y = series1.values.astype(float)
+    x = series2.values.astype(float)
+
+    with span('hedge_ratio'):
+        hedge_ratio = calculate_hedge_ratio(series1, series2)
+    with span('kalman_filter'):
+        kalman_spread, kalman_beta = run_kalman_batch(y[:, None], x[:, None], delta=delta, R=R)
+
+    spreads = pd.DataFrame({'static': y - hedge_ratio * x, 'kalman': kalman_spread[:, 0]}, index=data.index)
+
+    with span('zscore'):
+        zscores = calculate_zscore(spreads, window)
+    with span('signals'):
+        positions, _ = compute_positions(zscores.values, entry_threshold, exit_threshold)
+        positions = pd.DataFrame(positions, index=data.index, columns=list(SLEEVES))
+
+    with span('backtest'):
+        asset_returns = data.pct_change()
+        spread_return = asset_returns.iloc[:, 0] - asset_returns.iloc[:, 1]
+        returns = positions.shift(1).mul(spread_return, axis=0)
+
+    return {
+        'spreads': spreads,
+        'zscores': zscores,
+        'positions': positions,
+        'returns': returns,
+        'hedge_ratio': hedge_ratio,
+        'kalman_hedge_ratio': pd.Series(kalman_beta[:, 0], index=data.index)
+    }
+
+def ensemble_weights(returns, weighting='fixed', static_weight=0.5, lookback=60):
+    """
+    Capital weight of each sleeve per bar.
+
+    Args:
+        returns (pd.DataFrame): Daily returns per sleeve.
+        weighting (str): 'fixed' keeps static_weight / 1 - static_weight throughout.
+                         'rolling_sharpe' weights each sleeve by its trailing Sharpe
+                         ratio over `lookback` bars (negative Sharpe counts as zero),
+                         using only returns up to the previous bar. It falls back to
+                         static_weight until there is enough history, or when
+                         neither sleeve has a positive Sharpe.
+        static_weight (float): Weight of the static sleeve for 'fixed' and the fallback.
+        lookback (int): Trailing window for 'rolling_sharpe'.
+
+    Returns:
+        pd.DataFrame: Weights per sleeve, rows summing to 1.
+    """
+    fixed = pd.DataFrame({'static': static_weight, 'kalman': 1 - static_weight}, index=returns.index)
+    if weighting == 'fixed':
+        return fixed
+    if weighting != 'rolling_sharpe':
+        raise ValueError(f"Unknown weighting '{weighting}', expected one of {WEIGHTINGS}")
+
+    filled = returns.fillna(0.0)
+    mean = filled.rolling(lookback).mean()
+    std = filled.rolling(lookback).std()
+    # A flat sleeve (zero std) scores zero, like a losing one
+    score = (mean / std.where(std > 0)).clip(lower=0).shift(1).fillna(0.0)
+
+    total = score.sum(axis=1)
+    weights = score.div(total.where(total > 0), axis=0)
+    return weights.fillna(fixed)
+
+@profiled('run_ensemble')
+def run_ensemble(data, tickers, weighting='fixed', static_weight=0.5, lookback=60,
+                 window=30, entry_threshold=2.0, exit_threshold=0.0):
+    """
+    Backtests a blended book of the static and Kalman strategies.
+
+    The sleeves come from compute_sleeves; the ensemble return of a bar is the
+    weighted sum of the sleeve returns, and its net position is the weighted
+    sum of the sleeve positions (e.g. 0.5 when only one sleeve is in a trade).
+
+    Returns:
+        dict: compute_sleeves output plus 'weights', with an 'ensemble' column
+              added to 'positions' and 'returns', and 'cumulative_returns'.
+    """
+    result = compute_sleeves(data, tickers, window, entry_threshold, exit_threshold)
+    weights = ensemble_weights(result['returns'], weighting, static_weight, lookback)
+
+    sleeve_returns = result['returns'][list(SLEEVES)]
+    result['returns']['ensemble'] = (sleeve_returns * weights).sum(axis=1, min_count=1)
+    result['positions']['ensemble'] = (result['positions'][list(SLEEVES)] * weights).sum(axis=1)
+    result['weights'] = weights
+    result['cumulative_returns'] = (1 + result['returns']).cumprod()
+    return result
+
+def run_ensemble_backtest(tickers, start_date, end_date, name, weighting='fixed', static_weight=0.5, lookback=60):
+    """
+    Fetches a pair and reports the static, Kalman and ensemble final returns.
+
+    Returns:
+        dict: 'name', final cumulative 'static_return', 'kalman_return' and
+              'ensemble_return', and the ensemble's improvement over each sleeve;
+              None if no data was fetched.
+    """
+    events.info('ensemble_started', f"\n--- Ensemble Strategy: {name} ({tickers[0]} vs {tickers[1]}) ---",
+                name=name, tickers=tickers, weighting=weighting)
+
+    with span('fetch_data'):
+        data = fetch_data(tickers, start_date, end_date, how='intersection')
+    if data.empty:
+        events.warning('no_data', "No data fetched. Skipping.", name=name)
+        return None
+
+    result = run_ensemble(data, tickers, weighting=weighting, static_weight=static_weight, lookback=lookback)
+    final = result['cumulative_returns'].ffill().iloc[-1].fillna(1.0)
+
+    summary = {
+        'name': name,
+        'static_return': float(final['static']),
+        'kalman_return': float(final['kalman']),
+        'ensemble_return': float(final['ensemble']),
+        'improvement_vs_static': float(final['ensemble'] - final['static']),
+        'improvement_vs_kalman': float(final['ensemble'] - final['kalman'])
+    }
+    events.info('ensemble_finished',
+                f"Static: {(summary['static_return']-1)*100:.2f}%  "
+                f"Kalman: {(summary['kalman_return']-1)*100:.2f}%  "
+                f"Ensemble ({weighting}): {(summary['ensemble_return']-1)*100:.2f}%",
+                **summary)
+    events.incr('experiments')
+    return summary
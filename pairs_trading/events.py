@@ -0,0 +1,168 @@
+import json
+import os
+import sys
+import time
+import warnings
+
+LEVELS = {'debug': 10, 'info': 20, 'warning': 30, 'error': 40, 'quiet': 100}
+
+class ConsoleSink:
+    """Prints the human-readable message of each event, like the old print calls."""
+    def __init__(self, stream=None):
+        self.stream = stream
+
+    def __call__(self, record):
+        message = record['message'] if record['message'] is not None else record['event']
+        print(message, file=self.stream or sys.stdout)
+
+class JsonLinesSink:
+    """Appends every event as one JSON object per line, for log shippers and batch runners."""
+    def __init__(self, path):
+        self.path = path
+
+    def __call__(self, record):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(record, default=str) + '\n')
+
+class MemorySink:
+    """Keeps events in a list, e.g. to ship them back from a worker process."""
+    def __init__(self):
+        self.records = []
+
+    def __call__(self, record):
+        self.records.append(record)
+
+class EventStream:
+    """
+    Structured events with levels, rate-limited progress and counters.
+
+    Events below the stream's level are dropped after a single integer
+    comparison; hot loops can check enabled() before building a message at
+    all. Progress events are emitted at
+    most once per `progress_interval` seconds per task and carry a throughput
+    figure. Counters are plain in-process sums; worker processes can return
+    snapshot() to a parent that merge()s them.
+    """
+    def __init__(self, level='info', sinks=None, progress_interval=2.0):
+        self.level = LEVELS[level]
+        self.sinks = [ConsoleSink()] if sinks is None else list(sinks)
+        self.progress_interval = progress_interval
+        self.counters = {}
+        self._progress = {}
+
+    def enabled(self, level):
+        return LEVELS[level] >= self.level
+
+    def emit(self, level, event, message=None, **fields):
+        if LEVELS[level] < self.level:
+            return
+        record = {
+            'ts': time.time(),
+            'level': level,
+            'event': event,
+            'pid': os.getpid(),
+            'message': message,
+            **fields
+        }
+        for sink in self.sinks:
+            sink(record)
+
+    def debug(self, event, message=None, **fields):
+        self.emit('debug', event, message, **fields)
+
+    def info(self, event, message=None, **fields):
+        self.emit('info', event, message, **fields)
+
+    def warning(self, event, message=None, **fields):
+        self.emit('warning', event, message, **fields)
+
+    def error(self, event, message=None, **fields):
+        self.emit('error', event, message, **fields)
+
+    def progress(self, task, done, total=None, level='info', **fields):
+        """
+        Reports progress on `task`, rate-limited to one event per interval.
+        The final update (done == total) is always emitted.
+        """
+        if LEVELS[level] < self.level:
+            return
+        now = time.perf_counter()
+        state = self._progress.get(task)
+        if state is None or done < state['done']:
+            state = self._progress[task] = {'start': now, 'last': now, 'done': done}
+        state['done'] = done
+        finished = total is not None and done >= total
+        if not finished and now - state['last'] < self.progress_interval:
+            return
+        state['last'] = now
+        elapsed = now - state['start']
+        rate = done / elapsed if elapsed > 0 else None
+        of_total = f"/{total}" if total is not None else ""
+        rate_text = f" ({rate:,.0f}/s)" if rate is not None else ""
+        self.emit(level, 'progress', f"{task}: {done}{of_total}{rate_text}",
+                  task=task, done=done, total=total, rate=rate, **fields)
+        if finished:
+            del self._progress[task]
+
+    def incr(self, counter, n=1):
+        self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def snapshot(self):
+        """Counters in a picklable form, for returning from worker processes."""
+        return {'pid': os.getpid(), 'counters': dict(self.counters)}
+
+    def merge(self, snapshot):
+        """Adds a worker's snapshot() counters into this stream."""
+        for counter, value in snapshot['counters'].items():
+            self.incr(counter, value)
+
+def _initial_level():
+    """The PAIRS_LOG_LEVEL environment variable, or 'info' (with a warning) if it is not a known level."""
+    level = os.environ.get('PAIRS_LOG_LEVEL', 'info').lower()
+    if level not in LEVELS:
+        warnings.warn(f"Unknown PAIRS_LOG_LEVEL '{level}', expected one of {list(LEVELS)}; using 'info'")
+        return 'info'
+    return level
+
+_stream = EventStream(level=_initial_level())
+
+def get_stream():
+    return _stream
+
+def configure(level=None, sinks=None, progress_interval=None):
+    """
+    Adjusts the global event stream, e.g. configure(level='warning') for quiet
+    production runs or configure(sinks=[JsonLinesSink('run.jsonl')]).
+    The initial level comes from the PAIRS_LOG_LEVEL environment variable.
+    """
+    if level is not None:
+        _stream.level = LEVELS[level]
+    if sinks is not None:
+        _stream.sinks = list(sinks)
+    if progress_interval is not None:
+        _stream.progress_interval = progress_interval
+    return _stream
+
+def enabled(level):
+    return _stream.enabled(level)
+
+def emit(level, event, message=None, **fields):
+    _stream.emit(level, event, message, **fields)
+
+def debug(event, message=None, **fields):
+    _stream.emit('debug', event, message, **fields)
+
+def info(event, message=None, **fields):
+    _stream.emit('info', event, message, **fields)
+
+def warning(event, message=None, **fields):
+    _stream.emit('warning', event, message, **fields)
+
+def error(event, message=None, **fields):
+    _stream.emit('error', event, message, **fields)
+
+def progress(task, done, total=None, level='info', **fields):
+    _stream.progress(task, done, total, level=level, **fields)
+
+def incr(counter, n=1):
+    _stream.incr(counter, n)
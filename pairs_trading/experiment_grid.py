@@ -0,0 +1,227 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import itertools
+import json
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from data_loader import fetch_data
+from main import run_pipeline
+from performance import compute_performance
+import events
+
+MODELS = ('static', 'kalman')
+
+@dataclass
+class ExperimentGrid:
+    """
+    Declarative pair x period x model x parameter grid.
+
+    pairs:   [{'tickers': ['NKE', 'TMO'], 'name': 'NKE_TMO'}, ...]
+    periods: [{'name': 'COVID_2020', 'start': '2020-01-01', 'end': '2021-01-01'}, ...]
+    models:  subset of MODELS
+    params:  run_pipeline keyword -> list of values, e.g. {'window': [20, 30]};
+             every combination becomes its own cell.
+    """
+    pairs: List[dict]
+    periods: List[dict]
+    models: List[str] = field(default_factory=lambda: list(MODELS))
+    params: Dict[str, list] = field(default_factory=dict)
+
+    def cells(self):
+        """Every cell of the grid as a dict with a stable 'cell_id'."""
+        param_names = sorted(self.params)
+        cells = []
+        for period in self.periods:
+            for pair in self.pairs:
+                for model in self.models:
+                    if model not in MODELS:
+                        raise ValueError(f"Unknown model '{model}', expected one of {MODELS}")
+                    for values in itertools.product(*(self.params[p] for p in param_names)):
+                        params = dict(zip(param_names, values))
+                        param_text = ",".join(f"{k}={v}" for k, v in params.items())
+                        cells.append({
+                            'cell_id': f"{period['name']}|{pair['name']}|{model}|{param_text}",
+                            'period': period['name'],
+                            'start': period['start'],
+                            'end': period['end'],
+                            'pair': pair['name'],
+                            'tickers': list(pair['tickers']),
+                            'model': model,
+                            'params': params
+                        })
+        return cells
+
+def load_completed(results_path):
+    """
+    Reads the rows already written to a JSON-lines results file.
+
+    A truncated last line (e.g. from a crash mid-write) is ignored, so that
+    cell is simply run again.
+
+    Returns:
+        dict: cell_id -> row
+    """
+    completed = {}
+    if results_path is None or not os.path.exists(results_path):
+        return completed
+    with open(results_path) as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            completed[row['cell_id']] = row
+    return completed
+
+def summarize_cell(result, periods_per_year=252):
+    """Flat metrics for one run_pipeline result (see performance.compute_performance)."""
+    metrics = result['metrics']
+    perf = compute_performance(metrics['daily_returns'], result['positions'], periods_per_year).iloc[0]
+    final_return = float(perf['total_return'] + 1)
+
+    return {
+        'final_return': final_return,
+        'total_return_pct': (final_return - 1) * 100,
+        'sharpe': float(perf['sharpe']),
+        'sortino': float(perf['sortino']),
+        'max_drawdown': float(perf['max_drawdown']),
+        'max_drawdown_duration': int(perf['max_drawdown_duration']),
+        'n_trades': int(perf['n_trades']),
+        'hit_rate': float(perf['hit_rate']),
+        'avg_holding_period': float(perf['avg_holding_period']),
+        'turnover': float(perf['turnover']),
+        'hedge_ratio': float(np.mean(result['hedge_ratio'])),
+        'n_bars': len(result['positions'])
+    }
+
+def _run_load_group(cells):
+    """
+    Worker: fetch the prices shared by a group of cells once, then run each cell.
+
+    Returns:
+        tuple: (rows, events snapshot)
+    """
+    stream = events.get_stream()
+    before = dict(stream.counters)
+    first = cells[0]
+    data = fetch_data(first['tickers'], first['start'], first['end'], how='intersection')
+
+    rows = []
+    for cell in cells:
+        row = {k: v for k, v in cell.items() if k != 'params'}
+        row.update(cell['params'])
+        if data.empty or any(t not in data.columns for t in cell['tickers']):
+            row['status'] = 'no_data'
+        else:
+            try:
+                result = run_pipeline(data, cell['tickers'], use_kalman=cell['model'] == 'kalman', **cell['params'])
+                row.update(summarize_cell(result))
+                row['status'] = 'ok'
+            except Exception as e:
+                row['status'] = 'error'
+                row['error'] = f"{type(e).__name__}: {e}"
+        events.incr('grid_cells')
+        rows.append(row)
+    # Only this group's counts, since a pool worker's stream outlives one task
+    snapshot = stream.snapshot()
+    snapshot['counters'] = {k: v - before.get(k, 0) for k, v in snapshot['counters'].items()}
+    return rows, snapshot
+
+def run_grid(grid, results_path='grid_results.jsonl', n_jobs=None, store=None):
+    """
+    Runs every cell of an ExperimentGrid and returns one results table.
+
+    Cells sharing tickers and dates share a single data load: they are grouped
+    and each group is one task on a pool of at most `n_jobs` worker processes.
+    Rows are appended to `results_path` (JSON lines) as each group finishes, and
+    cells already present there are skipped, so an interrupted run resumes
+    where it stopped. Cells whose download came back empty are not stored, so
+    they are retried on the next run.
+
+    Args:
+        grid (ExperimentGrid): The experiments to run.
+        results_path (str): JSON-lines results store, or None to keep results in memory only.
+        n_jobs (int): Maximum worker processes (defaults to the CPU count; 1 runs in-process).
+        store (ResultsStore): Optional results database; successful rows are
+                              bulk-inserted there as well, one run per call.
+
+    Returns:
+        pd.DataFrame: One row per cell, in grid order.
+    """
+    cells = grid.cells()
+    completed = load_completed(results_path)
+    pending = [cell for cell in cells if cell['cell_id'] not in completed]
+
+    groups = {}
+    for cell in pending:
+        key = (tuple(cell['tickers']), cell['start'], cell['end'])
+        groups.setdefault(key, []).append(cell)
+    tasks = list(groups.values())
+
+    events.info('grid_started', f"Experiment grid: {len(cells)} cells, {len(completed)} already done, "
+                f"{len(pending)} to run across {len(tasks)} data loads",
+                cells=len(cells), completed=len(completed), pending=len(pending), loads=len(tasks))
+
+    run_id = store.start_run('grid', results_path, cells=len(cells), pending=len(pending)) if store else None
+
+    def record(rows, snapshot):
+        if store is not None:
+            store.record_backtests([row for row in rows if row['status'] == 'ok'], run_id=run_id)
+        if results_path is not None:
+            with open(results_path, 'a') as f:
+                for row in rows:
+                    if row['status'] != 'no_data':
+                        f.write(json.dumps(row) + '\n')
+        for row in rows:
+            completed[row['cell_id']] = row
+        events.get_stream().merge(snapshot)
+        events.progress('grid cells', len(completed), len(cells))
+
+    n_jobs = n_jobs or os.cpu_count() or 1
+    if n_jobs == 1 or len(tasks) <= 1:
+        for task in tasks:
+            # Counters already land in the global stream in-process
+            rows, _ = _run_load_group(task)
+            record(rows, {'counters': {}})
+    else:
+        with ProcessPoolExecutor(max_workers=min(n_jobs, len(tasks))) as pool:
+            futures = [pool.submit(_run_load_group, task) for task in tasks]
+            for future in as_completed(futures):
+                record(*future.result())
+
+    return pd.DataFrame([completed[cell['cell_id']] for cell in cells if cell['cell_id'] in completed])
+
+def main():
+    # The regime study from archive/test_market_regimes.py as one grid
+    grid = ExperimentGrid(
+        pairs=[
+            {'tickers': ['NKE', 'TMO'], 'name': 'NKE_TMO'},
+            {'tickers': ['INTC', 'AMGN'], 'name': 'INTC_AMGN'},
+            {'tickers': ['NVDA', 'PFE'], 'name': 'NVDA_PFE'},
+        ],
+        periods=[
+            {'name': 'Bull_2017', 'start': '2017-01-01', 'end': '2018-01-01'},
+            {'name': 'Crash_2019', 'start': '2019-01-01', 'end': '2020-01-01'},
+            {'name': 'COVID_2020', 'start': '2020-01-01', 'end': '2021-01-01'},
+            {'name': 'Recovery_2021', 'start': '2021-01-01', 'end': '2022-01-01'},
+            {'name': 'Volatile_2022', 'start': '2022-01-01', 'end': '2023-01-01'},
+        ],
+        models=['static', 'kalman'],
+        params={'window': [30]}
+    )
+    results_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'grid_results.jsonl')
+    results = run_grid(grid, results_path)
+
+    if 'total_return_pct' in results:
+        table = results.pivot_table(index=['period', 'pair'], columns='model', values='total_return_pct')
+        print(table.round(2).to_string())
+
+if __name__ == "__main__":
+    main()
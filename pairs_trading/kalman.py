@@ -1,5 +1,9 @@
+import os
 import numpy as np
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+LOG_2PI = np.log(2 * np.pi)
 
 class KalmanFilterReg:
     """
@@ -24,6 +28,10 @@ class KalmanFilterReg:
         # Measurement noise covariance
         self.R = R
         
+        # Gaussian log-likelihood of the innovations seen so far
+        self.log_likelihood = 0.0
+        self.n_updates = 0
+        
     def update(self, x, y):
         """
         Update the state estimate with a new observation.
@@ -44,6 +52,9 @@ class KalmanFilterReg:
         # Residual covariance
         S = H.dot(self.state_cov).dot(H.T) + self.R
         
+        self.log_likelihood -= 0.5 * (LOG_2PI + np.log(S) + residual ** 2 / S)
+        self.n_updates += 1
+        
         # Kalman Gain
         K = self.state_cov.dot(H.T) / S
         
@@ -55,15 +66,19 @@ class KalmanFilterReg:
         
         return self.state_mean
 
-def run_kalman_strategy(series1, series2):
+def run_kalman_strategy(series1, series2, delta=1e-5, R=1e-3):
     """
     Runs the Kalman Filter on the pair to get dynamic hedge ratios and spread.
     
+    Args:
+        series1, series2 (pd.Series): Dependent and independent prices.
+        delta, R (float): Process and measurement noise, e.g. from calibrate_kalman.
+    
     Returns:
         pd.Series: Spread calculated using dynamic hedge ratio.
         pd.Series: Dynamic hedge ratio (beta).
     """
-    kf = KalmanFilterReg(delta=1e-5, R=1e-3)
+    kf = KalmanFilterReg(delta=delta, R=R)
     
     hedge_ratios = []
     intercepts = []
@@ -91,3 +106,437 @@ def run_kalman_strategy(series1, series2):
         spreads.append(spread)
         
     return pd.Series(spreads, index=series1.index), pd.Series(hedge_ratios, index=series1.index)
+
+def run_kalman_batch(series1, series2, delta=1e-5, R=1e-3):
+    """
+    Runs independent KalmanFilterReg passes over many paths at once.
+    
+    Args:
+        series1 (np.ndarray): Dependent prices, shape (n_obs, n_paths).
+        series2 (np.ndarray): Independent prices, shape (n_obs, n_paths).
+        
+    Returns:
+        tuple: (spreads, hedge_ratios), each of shape (n_obs, n_paths).
+    """
+    y = np.asarray(series1, dtype=float)
+    x = np.asarray(series2, dtype=float)
+    n_obs, n_paths = y.shape
+    
+    state_mean = np.zeros((n_paths, 2))
+    state_cov = np.zeros((n_paths, 2, 2))
+    Q = delta / (1 - delta) * np.eye(2)
+    H = np.ones((n_paths, 2))
+    
+    spreads = np.empty((n_obs, n_paths))
+    hedge_ratios = np.empty((n_obs, n_paths))
+    
+    for t in range(n_obs):
+        H[:, 0] = x[t]
+        state_cov += Q
+        
+        residual = y[t] - np.einsum('bi,bi->b', H, state_mean)
+        PH = np.einsum('bij,bj->bi', state_cov, H)
+        S = np.einsum('bi,bi->b', H, PH) + R
+        K = PH / S[:, None]
+        
+        state_mean += K * residual[:, None]
+        HP = np.einsum('bi,bij->bj', H, state_cov)
+        state_cov -= K[:, :, None] * HP[:, None, :]
+        
+        hedge_ratios[t] = state_mean[:, 0]
+        spreads[t] = y[t] - (state_mean[:, 0] * x[t] + state_mean[:, 1])
+    
+    return spreads, hedge_ratios
+
+def _innovation_sums(y, x, q, R, burn_in=0):
+    """
+    Runs KalmanFilterReg passes over many paths at once, keeping only the
+    innovation statistics the likelihood needs.
+    
+    The 2x2 covariance algebra is written out on the three distinct entries
+    of the symmetric state covariance, so a step is a dozen array operations
+    over all paths. NaN observations (e.g. before a ticker listed) are
+    skipped entirely, so each path matches a filter run on its own rows.
+    
+    Args:
+        y, x (np.ndarray): Dependent and independent prices, shape (n_obs, n_paths).
+        q, R (np.ndarray): Process noise variance per state and measurement noise, per path.
+        burn_in (int): Valid observations per path left out of the sums.
+        
+    Returns:
+        tuple: (sum of log S, sum of residual^2 / S, observations counted), each per path.
+    """
+    n_obs, n_paths = y.shape
+    beta = np.zeros(n_paths)
+    alpha = np.zeros(n_paths)
+    p00 = np.zeros(n_paths)
+    p01 = np.zeros(n_paths)
+    p11 = np.zeros(n_paths)
+    sum_log_s = np.zeros(n_paths)
+    sum_scaled = np.zeros(n_paths)
+    seen = np.zeros(n_paths, dtype=np.int64)
+    
+    for t in range(n_obs):
+        xt = x[t]
+        valid = ~(np.isnan(xt) | np.isnan(y[t]))
+        if not valid.any():
+            continue
+        qt = np.where(valid, q, 0.0)
+        xt = np.where(valid, xt, 0.0)
+        p00 += qt
+        p11 += qt
+        
+        residual = np.where(valid, y[t] - (beta * xt + alpha), 0.0)
+        ph0 = p00 * xt + p01
+        ph1 = p01 * xt + p11
+        S = ph0 * xt + ph1 + R
+        
+        counted = valid & (seen >= burn_in)
+        sum_log_s += np.where(counted, np.log(S), 0.0)
+        sum_scaled += np.where(counted, residual * residual / S, 0.0)
+        seen += valid
+        
+        # Invalid paths have a zero residual and zero gain, so their state is unchanged
+        k0 = np.where(valid, ph0 / S, 0.0)
+        k1 = np.where(valid, ph1 / S, 0.0)
+        beta += k0 * residual
+        alpha += k1 * residual
+        p00 -= k0 * ph0
+        p01 -= k0 * ph1
+        p11 -= k1 * ph1
+    
+    return sum_log_s, sum_scaled, np.maximum(seen - burn_in, 0)
+
+def kalman_log_likelihood(series1, series2, delta=1e-5, R=1e-3, burn_in=0):
+    """
+    Gaussian log-likelihood of the KalmanFilterReg innovations, for many
+    paths and parameter sets in one vectorized pass.
+    
+    With burn_in=0 this equals KalmanFilterReg(delta, R).log_likelihood after
+    updating on every bar.
+    
+    Args:
+        series1 (np.ndarray): Dependent prices, shape (n_obs,) or (n_obs, n_paths).
+        series2 (np.ndarray): Independent prices, same shape.
+        delta, R (float or np.ndarray): Noise parameters, scalars or one per path.
+        burn_in (int): First observations left out, while the filter is still
+                       converging from its zero initial state.
+        
+    Returns:
+        float or np.ndarray: Log-likelihood (one per path for 2-D input).
+    """
+    y = np.asarray(series1, dtype=float)
+    x = np.asarray(series2, dtype=float)
+    single = y.ndim == 1
+    if single:
+        y, x = y[:, None], x[:, None]
+    delta = np.broadcast_to(np.asarray(delta, dtype=float), y.shape[1:])
+    R = np.broadcast_to(np.asarray(R, dtype=float), y.shape[1:])
+    
+    sum_log_s, sum_scaled, n = _innovation_sums(y, x, delta / (1 - delta), R, burn_in)
+    log_likelihood = -0.5 * (n * LOG_2PI + sum_log_s + sum_scaled)
+    return float(log_likelihood[0]) if single else log_likelihood
+
+def _profile_likelihood(y, x, ratio, burn_in):
+    """
+    Log-likelihood maximised over the noise scale, per path, at fixed q / R.
+    
+    The filter starts from a zero state covariance, so scaling Q and R by the
+    same factor c leaves every state estimate and innovation unchanged and
+    multiplies S by c. One pass at (q, R) = (ratio, 1) therefore gives the
+    best R in closed form, R = mean(residual^2 / S), and the calibration
+    is a search over the single parameter q / R.
+    
+    Returns:
+        tuple: (log-likelihood, R) per path.
+    """
+    sum_log_s, sum_scaled, n = _innovation_sums(y, x, ratio, np.ones_like(ratio), burn_in)
+    n = np.maximum(n, 1)
+    R = np.maximum(sum_scaled / n, np.finfo(float).tiny)
+    return -0.5 * (n * (LOG_2PI + np.log(R) + 1) + sum_log_s), R
+
+DEFAULT_RATIOS = np.logspace(-14, 2, 33)
+
+def calibrate_kalman_batch(series1, series2, ratios=DEFAULT_RATIOS, burn_in=20, refine_steps=20, block_size=4096):
+    """
+    Maximum-likelihood delta and R for many pairs at once.
+    
+    Every pair is evaluated on a log grid of q / R in one vectorized pass over
+    pairs x grid points; each pair's best grid point is then refined by a
+    golden-section search on log(q / R) between its neighbours, all pairs
+    stepping together. R itself is solved in closed form (see
+    _profile_likelihood), so each pair is one (n_obs,) filter pass per grid
+    point and per refinement step.
+    
+    Args:
+        series1 (np.ndarray): Dependent prices, shape (n_obs, n_pairs); NaN rows are skipped per pair.
+        series2 (np.ndarray): Independent prices, same shape.
+        ratios (array): Grid of q / R to search, increasing.
+        burn_in (int): First observations of each pair left out of the likelihood.
+        refine_steps (int): Golden-section steps after the grid (0 keeps the grid optimum).
+        block_size (int): Maximum filter paths per pass, bounding memory.
+        
+    Returns:
+        dict: 'delta', 'R' and 'log_likelihood', arrays of length n_pairs.
+    """
+    y = np.asarray(series1, dtype=float)
+    x = np.asarray(series2, dtype=float)
+    if y.ndim == 1:
+        y, x = y[:, None], x[:, None]
+    n_pairs = y.shape[1]
+    log_ratios = np.log(np.asarray(ratios, dtype=float))
+    n_grid = len(log_ratios)
+    
+    # Coarse grid: every (pair, ratio) is one path; pairs are batched so a pass stays under block_size paths
+    grid = np.empty((n_pairs, n_grid))
+    per_block = max(1, block_size // n_grid)
+    for start in range(0, n_pairs, per_block):
+        cols = np.arange(start, min(start + per_block, n_pairs))
+        paths = np.repeat(cols, n_grid)
+        ratio = np.tile(np.exp(log_ratios), len(cols))
+        grid[cols] = _profile_likelihood(y[:, paths], x[:, paths], ratio, burn_in)[0].reshape(len(cols), n_grid)
+    grid = np.where(np.isnan(grid), -np.inf, grid)
+    best = grid.argmax(axis=1)
+    
+    def evaluate(log_ratio):
+        log_likelihood, R = _profile_likelihood(y, x, np.exp(log_ratio), burn_in)
+        return np.where(np.isnan(log_likelihood), -np.inf, log_likelihood), R
+    
+    # Golden-section search on [grid[best - 1], grid[best + 1]], one new evaluation per pair per step
+    log_ratio = log_ratios[best]
+    if refine_steps:
+        lo = log_ratios[np.maximum(best - 1, 0)]
+        hi = log_ratios[np.minimum(best + 1, n_grid - 1)]
+        golden = (np.sqrt(5) - 1) / 2
+        c = hi - golden * (hi - lo)
+        d = lo + golden * (hi - lo)
+        fc, fd = evaluate(c)[0], evaluate(d)[0]
+        for _ in range(refine_steps - 1):
+            left = fc >= fd
+            hi = np.where(left, d, hi)
+            lo = np.where(left, lo, c)
+            new = np.where(left, hi - golden * (hi - lo), lo + golden * (hi - lo))
+            f_new = evaluate(new)[0]
+            c, d, fc, fd = (np.where(left, new, d), np.where(left, c, new),
+                            np.where(left, f_new, fd), np.where(left, fc, f_new))
+        # Keep the refined point only where it beats the grid
+        refined = np.where(fc >= fd, c, d)
+        log_ratio = np.where(np.maximum(fc, fd) > grid[np.arange(n_pairs), best], refined, log_ratio)
+    log_likelihood, R = evaluate(log_ratio)
+    q = np.exp(log_ratio) * R
+    return {'delta': q / (1 + q), 'R': R, 'log_likelihood': log_likelihood}
+
+def calibrate_kalman(series1, series2, **kwargs):
+    """
+    Maximum-likelihood delta and R of KalmanFilterReg for one pair.
+    
+    Args:
+        series1, series2 (pd.Series or np.ndarray): Dependent and independent prices.
+        **kwargs: Passed to calibrate_kalman_batch (ratios, burn_in, refine_steps).
+        
+    Returns:
+        dict: 'delta', 'R' and 'log_likelihood', ready for run_kalman_strategy(series1, series2, delta, R).
+    """
+    fit = calibrate_kalman_batch(np.asarray(series1, dtype=float), np.asarray(series2, dtype=float), **kwargs)
+    return {key: float(value[0]) for key, value in fit.items()}
+
+def _calibrate_block(args):
+    y, x, kwargs = args
+    return calibrate_kalman_batch(y, x, **kwargs)
+
+def calibrate_pairs(prices, pairs, n_jobs=1, pairs_per_task=256, **kwargs):
+    """
+    Calibrates the Kalman filter of every pair in a book, e.g. the discovered pairs.
+    
+    Each pair uses the rows where both of its legs have a price. Pairs are
+    calibrated together in vectorized blocks; with n_jobs > 1 the blocks are
+    spread across worker processes.
+    
+    Args:
+        prices (pd.DataFrame): Prices, one column per ticker.
+        pairs (list): (ticker1, ticker2) tuples or PairCandidates; ticker1 is the dependent leg.
+        n_jobs (int): Worker processes (None for the CPU count; 1 runs in-process).
+        pairs_per_task (int): Pairs per worker task.
+        **kwargs: Passed to calibrate_kalman_batch (ratios, burn_in, refine_steps, block_size).
+        
+    Returns:
+        pd.DataFrame: One row per pair with 'ticker1', 'ticker2', 'delta', 'R',
+            'log_likelihood', and 'default_log_likelihood' at the hard-coded
+            delta=1e-5, R=1e-3 for comparison.
+    """
+    pairs = [(p.ticker1, p.ticker2) if hasattr(p, 'ticker1') else tuple(p) for p in pairs]
+    columns = ['ticker1', 'ticker2', 'delta', 'R', 'log_likelihood', 'default_log_likelihood']
+    if not pairs:
+        return pd.DataFrame(columns=columns)
+    y = prices[[p[0] for p in pairs]].to_numpy(dtype=float)
+    x = prices[[p[1] for p in pairs]].to_numpy(dtype=float)
+    
+    tasks = [(y[:, start:start + pairs_per_task], x[:, start:start + pairs_per_task], kwargs)
+             for start in range(0, len(pairs), pairs_per_task)]
+    n_jobs = n_jobs or os.cpu_count() or 1
+    if n_jobs == 1 or len(tasks) <= 1:
+        fits = list(map(_calibrate_block, tasks))
+    else:
+        with ProcessPoolExecutor(max_workers=min(n_jobs, len(tasks))) as pool:
+            fits = list(pool.map(_calibrate_block, tasks))
+    
+    burn_in = kwargs.get('burn_in', 20)
+    table = pd.DataFrame({
+        'ticker1': [p[0] for p in pairs],
+        'ticker2': [p[1] for p in pairs],
+        **{key: np.concatenate([fit[key] for fit in fits]) for key in ('delta', 'R', 'log_likelihood')},
+        'default_log_likelihood': kalman_log_likelihood(y, x, 1e-5, 1e-3, burn_in=burn_in)
+    })
+    return table[columns]
+
+class KalmanFilterMulti:
+    """
+    Kalman Filter for online regression on any number of legs.
+    Estimates the state vector [beta_1, ..., beta_m, alpha] where
+    y = beta_1 * x_1 + ... + beta_m * x_m + alpha + noise.
+    
+    With one regressor this is KalmanFilterReg. update() works in place on
+    preallocated buffers, so a live feed does not allocate per bar. With
+    smoothing_lag > 0 the last filtered states are kept in a ring buffer
+    and smoothed_state() gives the fixed-lag (RTS) estimate for the bar
+    `smoothing_lag` steps back. That estimate uses later bars, so it is for
+    research, not for trading decisions.
+    """
+    def __init__(self, n_regressors=1, delta=1e-5, R=1e-3, smoothing_lag=0):
+        self.n_states = n_regressors + 1
+        k = self.n_states
+        
+        self.state_mean = np.zeros(k)
+        self.state_cov = np.zeros((k, k))
+        self.q = delta / (1 - delta)
+        self.Q = self.q * np.eye(k)
+        self.R = R
+        
+        # Scratch buffers reused by every update
+        self._H = np.ones(k)
+        self._PH = np.empty(k)
+        self._HP = np.empty(k)
+        self._K = np.empty(k)
+        self._step = np.empty(k)
+        self._KHP = np.empty((k, k))
+        self._diagonal = np.arange(k) * (k + 1)
+        
+        self.smoothing_lag = smoothing_lag
+        self.n_updates = 0
+        self.log_likelihood = 0.0
+        if smoothing_lag:
+            self._means = np.zeros((smoothing_lag + 1, k))
+            self._covs = np.zeros((smoothing_lag + 1, k, k))
+    
+    def update(self, x, y):
+        """
+        Update the state estimate with a new observation.
+        x: regressors (scalar or array of m prices, e.g. the other legs)
+        y: dependent variable (e.g. price of the first leg)
+        
+        Returns the state mean array itself (updated in place); copy it to keep it.
+        """
+        H, PH, HP, K = self._H, self._PH, self._HP, self._K
+        m, P = self.state_mean, self.state_cov
+        H[:-1] = x
+        
+        # Prediction step (random walk): P_t|t-1 = P_t-1|t-1 + Q
+        P.flat[self._diagonal] += self.q
+        
+        residual = y - H.dot(m)
+        np.dot(P, H, out=PH)
+        S = H.dot(PH) + self.R
+        self.log_likelihood -= 0.5 * (LOG_2PI + np.log(S) + residual * residual / S)
+        np.divide(PH, S, out=K)
+        
+        np.multiply(K, residual, out=self._step)
+        m += self._step
+        # P = (I - K H) P
+        np.dot(H, P, out=HP)
+        np.outer(K, HP, out=self._KHP)
+        P -= self._KHP
+        
+        if self.smoothing_lag:
+            slot = self.n_updates % (self.smoothing_lag + 1)
+            self._means[slot] = m
+            self._covs[slot] = P
+        self.n_updates += 1
+        return m
+    
+    def smoothed_state(self):
+        """
+        Fixed-lag smoothed state of the bar `smoothing_lag` updates ago, given
+        every update since (or of the oldest bar seen, early on).
+        """
+        if not self.smoothing_lag:
+            raise ValueError("smoothing_lag must be > 0 to smooth")
+        size = self.smoothing_lag + 1
+        n_stored = min(self.n_updates, size)
+        order = [(self.n_updates - n_stored + i) % size for i in range(n_stored)]
+        smoothed = fixed_lag_smooth(self._means[order], self._covs[order], self.q, self.smoothing_lag)
+        return smoothed[0]
+
+def fixed_lag_smooth(means, covs, q, lag):
+    """
+    Fixed-lag Rauch-Tung-Striebel smoothing of random-walk Kalman states.
+    
+    The estimate for bar t uses every bar up to t + lag: the backward pass
+    starts from the filtered state at t + lag and runs down to t. All bars
+    are processed together, one lag step at a time.
+    
+    Args:
+        means (np.ndarray): Filtered state means, shape (n_obs, n_states).
+        covs (np.ndarray): Filtered state covariances, shape (n_obs, n_states, n_states).
+        q (float): Process noise variance per state (delta / (1 - delta)).
+        lag (int): Number of later bars used for each estimate.
+        
+    Returns:
+        np.ndarray: Smoothed state means, shape (n_obs, n_states).
+    """
+    n_obs, k = means.shape
+    # Smoother gains G_s = P_s (P_s + Q)^-1 (the random walk transition is the identity)
+    gains = np.linalg.solve(covs + q * np.eye(k), covs).transpose(0, 2, 1)
+    
+    t = np.arange(n_obs)
+    smoothed = means[np.minimum(t + lag, n_obs - 1)].copy()
+    for j in range(lag - 1, -1, -1):
+        rows = t[t + j + 1 <= n_obs - 1]
+        s = rows + j
+        smoothed[rows] = means[s] + np.einsum('bij,bj->bi', gains[s], smoothed[rows] - means[s])
+    return smoothed
+
+def run_kalman_basket(prices, delta=1e-5, R=1e-3, smoothing_lag=0):
+    """
+    Runs KalmanFilterMulti over a basket to get dynamic hedge weights and the spread.
+    
+    Args:
+        prices (pd.DataFrame): Leg prices; the first column is regressed on the others.
+        delta, R (float): Process and measurement noise, as in KalmanFilterReg.
+        smoothing_lag (int): If > 0, report fixed-lag smoothed states instead of
+                             filtered ones (uses later bars; research only).
+        
+    Returns:
+        pd.Series: Spread y - (betas . x + alpha).
+        pd.DataFrame: Betas per regressor leg plus 'intercept'.
+    """
+    values = np.asarray(prices, dtype=float)
+    y = values[:, 0]
+    x = values[:, 1:]
+    n_obs, n_regressors = x.shape
+    
+    kf = KalmanFilterMulti(n_regressors, delta=delta, R=R)
+    means = np.empty((n_obs, kf.n_states))
+    covs = np.empty((n_obs, kf.n_states, kf.n_states)) if smoothing_lag else None
+    
+    for t in range(n_obs):
+        means[t] = kf.update(x[t], y[t])
+        if smoothing_lag:
+            covs[t] = kf.state_cov
+    
+    if smoothing_lag:
+        means = fixed_lag_smooth(means, covs, kf.q, smoothing_lag)
+    
+    spread = y - (np.einsum('ij,ij->i', x, means[:, :-1]) + means[:, -1])
+    columns = list(prices.columns[1:]) + ['intercept'] if hasattr(prices, 'columns') else None
+    index = getattr(prices, 'index', None)
+    return pd.Series(spread, index=index), pd.DataFrame(means, index=index, columns=columns)
@@ -1,99 +1,299 @@
 import sys
 import os
+import itertools
+import tempfile
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
 
-print("DEBUG: main.py loaded")
-
 # Add the current directory to path so we can import modules
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from data_loader import fetch_data
-from analysis import check_cointegration, calculate_hedge_ratio, calculate_spread, calculate_zscore
-from strategy import generate_signals
+from data_loader import fetch_data, download_to_store
+from bar_store import BarStore
+from analysis import check_cointegration, calculate_hedge_ratio, calculate_spread, calculate_zscore, RollingStats
+from strategy import compute_positions
 from backtest import calculate_returns
 
 from kalman import run_kalman_strategy
+from profiling import span, profiled
+import events
+from chunked_pipeline import run_chunked_backtest, fit_hedge_ratio_streaming, CsvResultWriter
+
+def run_pipeline(data, tickers, use_kalman=False, window=30, entry_threshold=2.0, exit_threshold=0.0,
+                 kalman_params=None):
+    """
+    Runs the spread, z-score, signal and backtest stages on an in-memory price frame.
+    
+    Args:
+        data (pd.DataFrame): Aligned prices of the two tickers, passed to calculate_returns as is.
+        tickers (list): [ticker1, ticker2]; spread = ticker1 - hedge_ratio * ticker2.
+        use_kalman (bool): Use the Kalman Filter for a dynamic hedge ratio.
+        window (int): Z-score rolling window.
+        entry_threshold, exit_threshold (float): Signal thresholds.
+        kalman_params (dict): Optional 'delta' and 'R' of the Kalman filter,
+                              e.g. from kalman.calibrate_kalman (other keys are ignored).
+        
+    Returns:
+        dict: 'spread', 'hedge_ratio' (float, or pd.Series when use_kalman),
+              'zscore', 'positions' and 'metrics' (calculate_returns output).
+    """
+    series1 = data[tickers[0]]
+    series2 = data[tickers[1]]
+    
+    if not use_kalman:
+        with span('hedge_ratio'):
+            hedge_ratio = calculate_hedge_ratio(series1, series2)
+            spread = calculate_spread(series1, series2, hedge_ratio)
+    else:
+        params = {key: kalman_params[key] for key in ('delta', 'R') if key in kalman_params} if kalman_params else {}
+        with span('kalman_filter'):
+            spread, hedge_ratio = run_kalman_strategy(series1, series2, **params)
+    
+    with span('zscore'):
+        zscore = calculate_zscore(spread, window)
+    
+    # Only the positions are needed downstream, so skip the full signals frame
+    with span('signals'):
+        positions, _ = compute_positions(zscore.values, entry_threshold, exit_threshold)
+        positions = pd.Series(positions, index=zscore.index, name='positions')
+    
+    with span('backtest'):
+        metrics = calculate_returns(data, positions.to_frame())
+    
+    return {
+        'spread': spread,
+        'hedge_ratio': hedge_ratio,
+        'zscore': zscore,
+        'positions': positions,
+        'metrics': metrics
+    }
 
-def run_experiment(tickers, start_date, end_date, name, use_kalman=False):
-    print(f"\n--- Pairs Trading Strategy: {name} ({tickers[0]} vs {tickers[1]}) ---")
+@profiled('run_parameter_sweep')
+def run_parameter_sweep(data, tickers, windows=(10, 20, 30, 60), entry_thresholds=(1.5, 2.0, 2.5),
+                        exit_thresholds=(0.0, 0.5), use_kalman=False):
+    """
+    Compares z-score windows and signal thresholds on one spread.
+    
+    The spread, its RollingStats index and the asset returns are computed once;
+    each window then costs one O(n) z-score query and each threshold pair one
+    pass of the position state machine. Every row matches run_pipeline with
+    the same settings.
+    
+    Returns:
+        pd.DataFrame: One row per (window, entry_threshold, exit_threshold) with
+                      'final_return', 'sharpe' and 'n_trades'.
+    """
+    series1 = data[tickers[0]]
+    series2 = data[tickers[1]]
+    if not use_kalman:
+        spread = calculate_spread(series1, series2, calculate_hedge_ratio(series1, series2))
+    else:
+        spread, _ = run_kalman_strategy(series1, series2)
+    
+    stats = RollingStats(spread)
+    asset_returns = data.pct_change()
+    spread_return = (asset_returns.iloc[:, 0] - asset_returns.iloc[:, 1]).values
+    
+    rows = []
+    for window in windows:
+        with span('zscore'):
+            zscore = stats.zscore(window).values
+        for entry, exit in itertools.product(entry_thresholds, exit_thresholds):
+            with span('signals'):
+                positions, _ = compute_positions(zscore, entry, exit)
+            daily = positions[:-1] * spread_return[1:]
+            daily = daily[~np.isnan(daily)]
+            std = daily.std(ddof=1) if len(daily) > 1 else 0.0
+            rows.append({
+                'window': window,
+                'entry_threshold': entry,
+                'exit_threshold': exit,
+                'final_return': float(np.prod(1 + daily)),
+                'sharpe': float(daily.mean() / std * np.sqrt(252)) if std > 0 else 0.0,
+                'n_trades': int(np.count_nonzero(np.diff(positions)))
+            })
+    return pd.DataFrame(rows)
+
+@profiled('run_experiment')
+def run_experiment(tickers, start_date, end_date, name, use_kalman=False,
+                   store=None, run_id=None, period=None, sample=None, report=None,
+                   kalman_params=None):
+    """
+    Fetches a pair, backtests it, logs the result and saves a performance plot.
+
+    Args:
+        store (ResultsStore): Optional results database; the backtest's
+                              metrics and return series are recorded there.
+        run_id, period, sample: Labels for the stored backtest (sample is
+                                'in' or 'out' of sample).
+        report (ReportBuilder): Optional study report; the experiment is added
+                                there (grouped by period) instead of saving a PNG.
+        kalman_params (dict): Optional Kalman 'delta' and 'R', e.g. calibrated on
+                              the training period with kalman.calibrate_pairs.
+    """
+    events.info('experiment_started', f"\n--- Pairs Trading Strategy: {name} ({tickers[0]} vs {tickers[1]}) ---",
+                name=name, tickers=tickers, use_kalman=use_kalman)
     if use_kalman:
-        print("Using Kalman Filter for dynamic hedge ratio.")
+        events.info('model', "Using Kalman Filter for dynamic hedge ratio.")
     
     # 1. Fetch Data
-    data = fetch_data(tickers, start_date, end_date)
+    with span('fetch_data'):
+        data = fetch_data(tickers, start_date, end_date, how='intersection')
     if data.empty:
-        print("No data fetched. Skipping.")
+        events.warning('no_data', "No data fetched. Skipping.", name=name)
         return
 
     series1 = data[tickers[0]]
     series2 = data[tickers[1]]
     
-    # 2. Analyze (Cointegration & Spread)
+    # 2. Analyze (Cointegration)
     if not use_kalman:
-        t_stat, p_value, crit_values = check_cointegration(series1, series2)
-        print(f"Cointegration Test p-value: {p_value:.4f}")
+        with span('cointegration'):
+            t_stat, p_value, crit_values = check_cointegration(series1, series2)
+        events.info('cointegration', f"Cointegration Test p-value: {p_value:.4f}", p_value=p_value)
         if p_value > 0.05:
-            print("Warning: p-value > 0.05. The pair might not be cointegrated.")
+            events.warning('not_cointegrated', "Warning: p-value > 0.05. The pair might not be cointegrated.",
+                           p_value=p_value)
         else:
-            print("The pair is likely cointegrated.")
-            
-        hedge_ratio = calculate_hedge_ratio(series1, series2)
-        print(f"Hedge Ratio: {hedge_ratio:.4f}")
-        
-        spread = calculate_spread(series1, series2, hedge_ratio)
+            events.info('cointegrated', "The pair is likely cointegrated.")
+    
+    # 3. Spread, Signals & Backtest
+    with span('pipeline'):
+        result = run_pipeline(data, tickers, use_kalman=use_kalman, kalman_params=kalman_params)
+    zscore = result['zscore']
+    metrics = result['metrics']
+    if not use_kalman:
+        events.info('hedge_ratio', f"Hedge Ratio: {result['hedge_ratio']:.4f}", hedge_ratio=result['hedge_ratio'])
     else:
-        spread, hedge_ratios = run_kalman_strategy(series1, series2)
-        print(f"Average Dynamic Hedge Ratio: {hedge_ratios.mean():.4f}")
+        hedge_ratios = result['hedge_ratio']
+        events.info('hedge_ratio', f"Average Dynamic Hedge Ratio: {hedge_ratios.mean():.4f}",
+                    hedge_ratio=hedge_ratios.mean())
+    
+    final_return = metrics['cumulative_returns'].iloc[-1]
+    events.info('experiment_finished', f"Final Cumulative Return: {final_return:.4f} ({(final_return-1)*100:.2f}%)",
+                name=name, final_return=final_return)
+    events.incr('experiments')
+    if store is not None:
+        store.record_backtest(result, tickers, run_id=run_id, name=name, period=period,
+                              model='kalman' if use_kalman else 'static', sample=sample,
+                              start=start_date, end=end_date)
     
-    window = 30
-    zscore = calculate_zscore(spread, window)
+    if report is not None:
+        report.add(name, data, result, tickers, use_kalman=use_kalman, group=period)
+        return
     
-    # 3. Generate Signals
-    signals = generate_signals(zscore)
+    # 5. Visualize
+    with span('plot'):
+        plt.figure(figsize=(12, 10))
+        
+        plt.subplot(4 if use_kalman else 3, 1, 1)
+        plt.plot(data[tickers[0]], label=tickers[0])
+        plt.plot(data[tickers[1]], label=tickers[1])
+        plt.title(f'{name} - Asset Prices')
+        plt.legend()
+        
+        if use_kalman:
+            plt.subplot(4, 1, 2)
+            plt.plot(hedge_ratios, label='Dynamic Hedge Ratio')
+            plt.title(f'{name} - Kalman Hedge Ratio')
+            plt.legend()
+        
+        plt.subplot(4 if use_kalman else 3, 1, 3 if use_kalman else 2)
+        plt.plot(zscore, label='Z-Score')
+        plt.axhline(2.0, color='red', linestyle='--')
+        plt.axhline(-2.0, color='green', linestyle='--')
+        plt.axhline(0, color='black', linestyle='-')
+        plt.title(f'{name} - Spread Z-Score')
+        plt.legend()
+        
+        plt.subplot(4 if use_kalman else 3, 1, 4 if use_kalman else 3)
+        plt.plot(metrics['cumulative_returns'], label='Strategy Returns')
+        plt.title(f'{name} - Cumulative Returns')
+        plt.legend()
+        
+        plt.tight_layout()
+        output_filename = f'performance_{name.replace(" ", "_")}.png'
+        output_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), output_filename)
+        plt.savefig(output_path)
+        plt.close()
+        events.info('plot_saved', f"Performance plot saved to {output_path}", path=output_path)
+
+def run_experiment_chunked(tickers, start_date, end_date, name, use_kalman=False,
+                           window=30, store=None, download_window='365D'):
+    """
+    Out-of-core variant of run_experiment.
     
-    # 4. Backtest
-    metrics = calculate_returns(data, signals)
+    Streams the prices window by window through the chunked pipeline, carrying
+    the rolling-window tail, Kalman state and position between chunks, and
+    appends each chunk's results to results_<name>.csv instead of holding them
+    in memory or plotting. The static hedge ratio is fitted in a first
+    streaming pass over the full history, so results match run_pipeline.
     
-    final_return = metrics['cumulative_returns'].iloc[-1]
-    print(f"Final Cumulative Return: {final_return:.4f} ({(final_return-1)*100:.2f}%)")
+    Without a store, the history is downloaded `download_window` at a time
+    into a temporary month-partitioned BarStore and streamed back on the
+    bars both tickers printed (as fetch_data(how='intersection')), so peak
+    memory is one download window plus one partition, not the whole history.
     
-    # 5. Visualize
-    plt.figure(figsize=(12, 10))
+    Args:
+        tickers (list): [ticker1, ticker2]
+        start_date, end_date (str): Date range
+        name (str): Experiment name, used for the output file
+        use_kalman (bool): Use the Kalman Filter for a dynamic hedge ratio
+        window (int): Z-score rolling window
+        store (BarStore): Optional memory-mapped bar store to read from instead of
+                          downloading; chunks then follow its partitions.
+        download_window (str): Pandas offset fetched per download when there is no store.
+        
+    Returns:
+        dict: 'bars', 'final_return', 'hedge_ratio' (static only) and 'output_path'
+    """
+    events.info('experiment_started', f"\n--- Pairs Trading Strategy (chunked): {name} ({tickers[0]} vs {tickers[1]}) ---",
+                name=name, tickers=tickers, use_kalman=use_kalman)
     
-    plt.subplot(4 if use_kalman else 3, 1, 1)
-    plt.plot(data[tickers[0]], label=tickers[0])
-    plt.plot(data[tickers[1]], label=tickers[1])
-    plt.title(f'{name} - Asset Prices')
-    plt.legend()
+    if store is not None:
+        make_chunks = lambda: store.iter_aligned_chunks(tickers, start=start_date, end=end_date)
+        return _stream_experiment(make_chunks, tickers, name, use_kalman, window)
     
-    if use_kalman:
-        plt.subplot(4, 1, 2)
-        plt.plot(hedge_ratios, label='Dynamic Hedge Ratio')
-        plt.title(f'{name} - Kalman Hedge Ratio')
-        plt.legend()
+    with tempfile.TemporaryDirectory() as root:
+        store = BarStore(root, partition='month')
+        if not download_to_store(store, tickers, start_date, end_date, window=download_window):
+            events.warning('no_data', "No data fetched. Skipping.", name=name)
+            return
+        make_chunks = lambda: store.iter_aligned_chunks(tickers, start=start_date, end=end_date, fill='none')
+        return _stream_experiment(make_chunks, tickers, name, use_kalman, window)
+
+def _stream_experiment(make_chunks, tickers, name, use_kalman, window):
+    """Runs the two streaming passes of run_experiment_chunked over a chunk source."""
+    hedge_ratio = None
+    if not use_kalman:
+        hedge_ratio = fit_hedge_ratio_streaming(make_chunks(), tickers)
+        events.info('hedge_ratio', f"Hedge Ratio: {hedge_ratio:.4f}", hedge_ratio=hedge_ratio)
     
-    plt.subplot(4 if use_kalman else 3, 1, 3 if use_kalman else 2)
-    plt.plot(zscore, label='Z-Score')
-    plt.axhline(2.0, color='red', linestyle='--')
-    plt.axhline(-2.0, color='green', linestyle='--')
-    plt.axhline(0, color='black', linestyle='-')
-    plt.title(f'{name} - Spread Z-Score')
-    plt.legend()
-    
-    plt.subplot(4 if use_kalman else 3, 1, 4 if use_kalman else 3)
-    plt.plot(metrics['cumulative_returns'], label='Strategy Returns')
-    plt.title(f'{name} - Cumulative Returns')
-    plt.legend()
-    
-    plt.tight_layout()
-    output_filename = f'performance_{name.replace(" ", "_")}.png'
+    output_filename = f'results_{name.replace(" ", "_")}.csv'
     output_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), output_filename)
-    plt.savefig(output_path)
-    print(f"Performance plot saved to {output_path}")
+    
+    summary = run_chunked_backtest(
+        make_chunks(),
+        hedge_ratio=hedge_ratio,
+        use_kalman=use_kalman,
+        window=window,
+        on_chunk=CsvResultWriter(output_path),
+        tickers=tickers
+    )
+    
+    final_return = summary['final_return']
+    events.info('experiment_finished', f"Final Cumulative Return: {final_return:.4f} ({(final_return-1)*100:.2f}%)",
+                name=name, final_return=final_return)
+    events.info('results_saved', f"Results for {summary['bars']} bars written to {output_path}",
+                bars=summary['bars'], path=output_path)
+    events.incr('experiments')
+    
+    summary['hedge_ratio'] = hedge_ratio
+    summary['output_path'] = output_path
+    return summary
 
 def main():
-    print("DEBUG: main() started")
     # Experiment 1: Classic (PEP vs KO)
     # run_experiment(['PEP', 'KO'], '2020-01-01', '2023-01-01', 'Classic_Consumer')
     
@@ -1,10 +1,15 @@
+import heapq
+import time
 import pandas as pd
 import numpy as np
 from dataclasses import dataclass
-from typing import List, Tuple
-from itertools import combinations
-from data_loader import fetch_data
-from analysis import check_cointegration, calculate_hedge_ratio
+from typing import Dict, Iterator, List, Optional, Tuple
+from itertools import combinations, islice
+from data_loader import fetch_data, fetch_unaligned_data
+from alignment import CalendarIndex
+from analysis import check_cointegration, calculate_hedge_ratio, calculate_spread
+from profiling import span, count, profiled
+import events
 
 @dataclass
 class PairCandidate:
@@ -14,15 +19,88 @@ class PairCandidate:
     p_value: float
     correlation: float
     hedge_ratio: float
+    quality_score: Optional[float] = None
     
     def __repr__(self):
         return f"{self.ticker1}/{self.ticker2}: p={self.p_value:.4f}, corr={self.correlation:.4f}, hedge={self.hedge_ratio:.4f}"
 
+def _test_pair(data: pd.DataFrame,
+               ticker1: str,
+               ticker2: str,
+               p_value_threshold: float,
+               correlation_threshold: float) -> Optional[PairCandidate]:
+    """
+    Runs the correlation and cointegration screens on a single pair.
+    
+    Returns:
+        PairCandidate if the pair passes both screens, otherwise None
+    """
+    series1 = data[ticker1]
+    series2 = data[ticker2]
+    
+    # Calculate correlation
+    with span('correlation'):
+        correlation = series1.corr(series2)
+    
+    # Skip if correlation is too low
+    if correlation < correlation_threshold:
+        count('pairs_rejected_correlation')
+        return None
+    
+    # Test for cointegration
+    try:
+        with span('cointegration'):
+            t_stat, p_value, crit_values = check_cointegration(series1, series2)
+        
+        # Skip if not cointegrated
+        if p_value > p_value_threshold:
+            count('pairs_rejected_cointegration')
+            return None
+        
+        # Calculate hedge ratio
+        with span('hedge_ratio'):
+            hedge_ratio = calculate_hedge_ratio(series1, series2)
+        
+    except Exception as e:
+        # Skip pairs that cause errors (e.g., insufficient data variance)
+        count('pairs_failed')
+        return None
+    
+    count('pairs_accepted')
+    return PairCandidate(
+        ticker1=ticker1,
+        ticker2=ticker2,
+        p_value=p_value,
+        correlation=correlation,
+        hedge_ratio=hedge_ratio
+    )
+
+def point_in_time_tickers(tickers: List[str], membership, start_date: str, end_date: str, how: str = 'all') -> List[str]:
+    """
+    Restricts tickers to those tradable in [start_date, end_date) according to a
+    universe.UniverseMembership, so delisted or not-yet-listed names are never fetched.
+    """
+    tradable = set(membership.members_during(start_date, end_date, how=how))
+    kept = [ticker for ticker in tickers if ticker in tradable]
+    skipped = [ticker for ticker in tickers if ticker not in tradable]
+    events.info('point_in_time_universe',
+                f"Point-in-time universe: {len(kept)}/{len(tickers)} tickers tradable from {start_date} to {end_date}"
+                + (f" (skipped {', '.join(skipped)})" if skipped else ""),
+                n_tradable=len(kept), skipped=skipped)
+    return kept
+
+@profiled('discover_pairs')
 def discover_pairs(tickers: List[str], 
                    start_date: str, 
                    end_date: str,
                    p_value_threshold: float = 0.05,
-                   correlation_threshold: float = 0.7) -> List[PairCandidate]:
+                   correlation_threshold: float = 0.7,
+                   prune_method: Optional[str] = None,
+                   sectors: Optional[Dict[str, List[str]]] = None,
+                   n_neighbors: int = 2,
+                   report_recall: bool = False,
+                   align: Optional[str] = None,
+                   membership=None) -> List[PairCandidate]:
     """
     Discovers cointegrated pairs from a universe of tickers.
     
@@ -32,80 +110,258 @@ def discover_pairs(tickers: List[str],
         end_date: End date for historical data
         p_value_threshold: Maximum p-value for cointegration test
         correlation_threshold: Minimum correlation coefficient
+        prune_method: Optional clustering pre-stage ('sector', 'correlation' or 'pca').
+                      Only within-cluster and near-neighbour pairs are tested.
+        sectors: Sector mapping used by prune_method='sector'
+        n_neighbors: Cross-cluster neighbours kept per ticker when pruning
+        report_recall: Also run the exhaustive search and report how many of its
+                       pairs the pruned search recovered (evaluation only)
+        align: Optional calendar ('intersection', 'union') to test every pair on
+               its own aligned prices instead of the universe-wide intersection,
+               so mixed asset classes (e.g. crypto and ETFs) keep their data.
+               Pruning then clusters the forward-filled union of the universe.
+        membership: Optional universe.UniverseMembership; only tickers tradable
+                    throughout the window (at any point of it with `align`)
+                    are fetched and screened.
         
     Returns:
         List of PairCandidate objects, sorted by p-value (best first)
     """
-    print(f"\n=== Pair Discovery ===")
-    print(f"Screening {len(tickers)} assets for cointegrated pairs...")
-    print(f"Criteria: p-value < {p_value_threshold}, correlation > {correlation_threshold}")
+    if membership is not None:
+        tickers = point_in_time_tickers(tickers, membership, start_date, end_date,
+                                        how='all' if align is None else 'any')
+    
+    events.info('discovery_started',
+                f"\n=== Pair Discovery ===\n"
+                f"Screening {len(tickers)} assets for cointegrated pairs...\n"
+                f"Criteria: p-value < {p_value_threshold}, correlation > {correlation_threshold}",
+                n_tickers=len(tickers), p_value_threshold=p_value_threshold,
+                correlation_threshold=correlation_threshold)
     
     # Fetch data for all tickers
-    print(f"\nFetching data from {start_date} to {end_date}...")
-    data = fetch_data(tickers, start_date, end_date)
+    calendars = None
+    with span('fetch_data'):
+        if align is None:
+            data = fetch_data(tickers, start_date, end_date)
+            available = set() if data.empty else set(data.columns)
+        else:
+            calendars = CalendarIndex.from_frame(fetch_unaligned_data(tickers, start_date, end_date))
+            data = calendars.align(calendars.tickers, how='union')
+            available = set(calendars.tickers)
     
-    if data.empty:
-        print("No data fetched. Aborting discovery.")
+    if not available:
+        events.warning('no_data', "No data fetched. Aborting discovery.")
         return []
     
     # Filter out tickers with insufficient data
-    valid_tickers = [ticker for ticker in tickers if ticker in data.columns]
-    print(f"Valid tickers with data: {len(valid_tickers)}")
+    valid_tickers = [ticker for ticker in tickers if ticker in available]
+    events.info('valid_tickers', f"Valid tickers with data: {len(valid_tickers)}", n_valid=len(valid_tickers))
+    
+    # Optionally prune the pair space with a clustering pre-stage
+    pairs = list(combinations(valid_tickers, 2))
+    pruned_pairs = None
+    if prune_method is not None:
+        from pair_pruning import cluster_tickers, candidate_pairs
+        with span('pruning'):
+            clusters = cluster_tickers(data[valid_tickers], method=prune_method, sectors=sectors)
+            pruned_pairs = candidate_pairs(data[valid_tickers], clusters, n_neighbors=n_neighbors)
+        events.info('pruning',
+                    f"Pruning ({prune_method}): {len(set(clusters.values()))} clusters, "
+                    f"{len(pruned_pairs)}/{len(pairs)} pairs kept "
+                    f"({len(pairs) / max(len(pruned_pairs), 1):.1f}x less work)",
+                    method=prune_method, n_clusters=len(set(clusters.values())),
+                    pairs_kept=len(pruned_pairs), pairs_total=len(pairs))
+        if not report_recall:
+            pairs = pruned_pairs
     
-    # Test all pairwise combinations
-    total_pairs = len(list(combinations(valid_tickers, 2)))
-    print(f"Testing {total_pairs} pairwise combinations...\n")
+    # Test the pairwise combinations
+    total_pairs = len(pairs)
+    events.info('screening', f"Testing {total_pairs} pairwise combinations...", total_pairs=total_pairs)
     
     candidates = []
     tested = 0
     
-    for ticker1, ticker2 in combinations(valid_tickers, 2):
+    for ticker1, ticker2 in pairs:
         tested += 1
-        if tested % 20 == 0:
-            print(f"Progress: {tested}/{total_pairs} pairs tested...")
+        events.progress('pairs tested', tested, total_pairs)
         
-        series1 = data[ticker1]
-        series2 = data[ticker2]
-        
-        # Calculate correlation
-        correlation = series1.corr(series2)
+        pair_data = data if calendars is None else calendars.align([ticker1, ticker2], how=align)
+        candidate = _test_pair(pair_data, ticker1, ticker2, p_value_threshold, correlation_threshold)
+        if candidate is not None:
+            candidates.append(candidate)
+    events.incr('pairs_tested', tested)
+    events.incr('pairs_found', len(candidates))
+    
+    # Sort by p-value (lower is better)
+    candidates.sort(key=lambda x: x.p_value)
+    
+    if pruned_pairs is not None and report_recall:
+        from pair_pruning import pruning_recall
+        exhaustive = candidates
+        kept = set(pruned_pairs)
+        candidates = [c for c in exhaustive if (c.ticker1, c.ticker2) in kept]
+        recall = pruning_recall(candidates, exhaustive)
+        events.info('pruning_recall',
+                    f"Pruning recall: {recall['found']}/{recall['expected']} "
+                    f"exhaustive pairs recovered ({recall['recall']:.1%})",
+                    recall=recall['recall'], found=recall['found'], expected=recall['expected'])
+        if recall['missed']:
+            events.info('pruning_missed', f"Missed: {', '.join(recall['missed'][:10])}", missed=recall['missed'])
+    
+    events.info('discovery_finished',
+                f"\n=== Discovery Complete ===\n"
+                f"Found {len(candidates)} cointegrated pairs out of {total_pairs} tested",
+                pairs_found=len(candidates), pairs_tested=total_pairs)
+    
+    return candidates
+
+def iter_pair_blocks(tickers: List[str], block_size: int = 500) -> Iterator[List[Tuple[str, str]]]:
+    """
+    Lazily yields the pairwise combinations of tickers in fixed-size blocks.
+    
+    Only one block is materialised at a time, so memory does not grow with
+    the O(N^2) size of the pair space.
+    """
+    pairs = combinations(tickers, 2)
+    while True:
+        block = list(islice(pairs, block_size))
+        if not block:
+            return
+        yield block
+
+@profiled('screen_pairs_streaming')
+def screen_pairs_streaming(data: pd.DataFrame,
+                           top_k: int = 20,
+                           rank_by: str = 'p_value',
+                           p_value_threshold: float = 0.05,
+                           correlation_threshold: float = 0.7,
+                           block_size: int = 500,
+                           stable_blocks: Optional[int] = None,
+                           progress_interval: float = 5.0) -> List[PairCandidate]:
+    """
+    Screens every pair of columns in `data`, keeping only the best `top_k`.
+    
+    Candidates are held in a bounded heap, so memory stays constant however
+    large the universe is. Progress and throughput are printed at most once
+    every `progress_interval` seconds.
+    
+    Args:
+        data: Aligned price DataFrame, one column per ticker
+        top_k: Number of candidates to keep
+        rank_by: 'p_value' (lower is better) or 'quality' (score_pair_quality, higher is better)
+        p_value_threshold: Maximum p-value for cointegration test
+        correlation_threshold: Minimum correlation coefficient
+        block_size: Number of pairs pulled from the generator at a time
+        stable_blocks: If set, stop early once the top-k membership has not
+                       changed for this many consecutive blocks
+        progress_interval: Minimum seconds between progress lines
         
-        # Skip if correlation is too low
-        if correlation < correlation_threshold:
-            continue
+    Returns:
+        List of at most top_k PairCandidate objects, best first
+    """
+    if rank_by not in ('p_value', 'quality'):
+        raise ValueError(f"Unknown rank_by '{rank_by}', expected 'p_value' or 'quality'")
+    if top_k < 1:
+        raise ValueError(f"top_k must be at least 1, got {top_k}")
+    
+    if rank_by == 'quality':
+        from advanced_metrics import score_pair_quality
+    
+    tickers = list(data.columns)
+    total_pairs = len(tickers) * (len(tickers) - 1) // 2
+    
+    # Min-heap whose root is the worst candidate kept so far.
+    # Entries are (key, seq, candidate) where a larger key is better.
+    heap = []
+    seq = 0
+    tested = 0
+    unchanged_blocks = 0
+    start = time.perf_counter()
+    last_report = start
+    
+    for block in iter_pair_blocks(tickers, block_size):
+        changed = False
         
-        # Test for cointegration
-        try:
-            t_stat, p_value, crit_values = check_cointegration(series1, series2)
-            
-            # Skip if not cointegrated
-            if p_value > p_value_threshold:
+        for ticker1, ticker2 in block:
+            tested += 1
+            candidate = _test_pair(data, ticker1, ticker2, p_value_threshold, correlation_threshold)
+            if candidate is None:
                 continue
             
-            # Calculate hedge ratio
-            hedge_ratio = calculate_hedge_ratio(series1, series2)
+            if rank_by == 'quality':
+                spread = calculate_spread(data[ticker1], data[ticker2], candidate.hedge_ratio)
+                metrics = score_pair_quality(spread, data[ticker1], data[ticker2])
+                candidate.quality_score = metrics['overall_score']
+                key = candidate.quality_score
+            else:
+                key = -candidate.p_value
             
-            # Add to candidates
-            candidate = PairCandidate(
-                ticker1=ticker1,
-                ticker2=ticker2,
-                p_value=p_value,
-                correlation=correlation,
-                hedge_ratio=hedge_ratio
-            )
-            candidates.append(candidate)
-            
-        except Exception as e:
-            # Skip pairs that cause errors (e.g., insufficient data variance)
-            continue
+            seq += 1
+            if len(heap) < top_k:
+                heapq.heappush(heap, (key, seq, candidate))
+                changed = True
+            elif key > heap[0][0]:
+                heapq.heapreplace(heap, (key, seq, candidate))
+                changed = True
+        
+        now = time.perf_counter()
+        if now - last_report >= progress_interval:
+            rate = tested / (now - start)
+            events.info('progress', f"Progress: {tested}/{total_pairs} pairs tested ({rate:.0f} pairs/s, {len(heap)} kept)",
+                        task='screen_pairs', done=tested, total=total_pairs, rate=rate, kept=len(heap))
+            last_report = now
+        
+        unchanged_blocks = 0 if changed else unchanged_blocks + 1
+        if stable_blocks is not None and len(heap) == top_k and unchanged_blocks >= stable_blocks:
+            events.info('early_stop', f"Top-{top_k} stable for {unchanged_blocks} blocks, stopping early.",
+                        top_k=top_k, stable_blocks=unchanged_blocks)
+            break
     
-    # Sort by p-value (lower is better)
-    candidates.sort(key=lambda x: x.p_value)
+    events.incr('pairs_tested', tested)
+    elapsed = time.perf_counter() - start
+    rate = tested / elapsed if elapsed > 0 else float('inf')
+    events.info('screening_finished', f"Screened {tested}/{total_pairs} pairs in {elapsed:.1f}s ({rate:.0f} pairs/s)",
+                tested=tested, total=total_pairs, seconds=elapsed, rate=rate)
     
-    print(f"\n=== Discovery Complete ===")
-    print(f"Found {len(candidates)} cointegrated pairs out of {total_pairs} tested")
+    return [entry[2] for entry in sorted(heap, key=lambda entry: (-entry[0], entry[1]))]
+
+def discover_pairs_streaming(tickers: List[str],
+                             start_date: str,
+                             end_date: str,
+                             top_k: int = 20,
+                             rank_by: str = 'p_value',
+                             p_value_threshold: float = 0.05,
+                             correlation_threshold: float = 0.7,
+                             block_size: int = 500,
+                             stable_blocks: Optional[int] = None,
+                             membership=None) -> List[PairCandidate]:
+    """
+    Streaming variant of discover_pairs that keeps only the best top_k pairs.
     
-    return candidates
+    See screen_pairs_streaming for the meaning of the screening arguments and
+    discover_pairs for `membership`.
+    """
+    if membership is not None:
+        tickers = point_in_time_tickers(tickers, membership, start_date, end_date)
+    events.info('discovery_started', f"\n=== Streaming Pair Discovery (top {top_k} by {rank_by}) ===",
+                n_tickers=len(tickers), top_k=top_k, rank_by=rank_by)
+    data = fetch_data(tickers, start_date, end_date)
+    
+    if data.empty:
+        events.warning('no_data', "No data fetched. Aborting discovery.")
+        return []
+    
+    valid_tickers = [ticker for ticker in tickers if ticker in data.columns]
+    
+    return screen_pairs_streaming(
+        data[valid_tickers],
+        top_k=top_k,
+        rank_by=rank_by,
+        p_value_threshold=p_value_threshold,
+        correlation_threshold=correlation_threshold,
+        block_size=block_size,
+        stable_blocks=stable_blocks
+    )
 
 def print_discovery_results(candidates: List[PairCandidate], top_n: int = 10):
     """Prints a formatted table of discovery results."""
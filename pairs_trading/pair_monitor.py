@@ -0,0 +1,293 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import pandas as pd
+
+from advanced_metrics import score_metrics
+import events
+
+# Alert -> (metric, threshold); the first two match select_strategy's regime checks
+ALERTS = {
+    'slow_mean_reversion': ('half_life', 60.0),
+    'correlation_unstable': ('correlation_stability', 0.15),
+    'trending': ('hurst_exponent', 0.5),
+}
+# Alerts meaning the spread no longer mean-reverts at all
+BREAKDOWN_ALERTS = ('no_mean_reversion', 'trending')
+
+def _watchlist_entry(entry):
+    """(ticker1, ticker2, hedge_ratio) from a PairCandidate or a tuple."""
+    if hasattr(entry, 'ticker1'):
+        return entry.ticker1, entry.ticker2, float(entry.hedge_ratio)
+    ticker1, ticker2, hedge_ratio = entry
+    return ticker1, ticker2, float(hedge_ratio)
+
+class PairHealthMonitor:
+    """
+    Online half-life, Hurst/variance-ratio and correlation-stability estimates
+    for every pair of a watchlist, updated bar by bar.
+
+    Each update costs O(max_lag) per pair, independent of the history length,
+    and all pairs are updated together as arrays:
+
+    - half-life: regression sums of diff(spread) on the lagged spread
+    - Hurst exponent and variance ratio: sums of the 1..max_lag-1 bar spread
+      differences, kept via a ring buffer of the last max_lag spreads
+    - correlation stability: a corr_window-bar rolling price correlation from
+      add/remove window sums (resynced from the ring buffer now and then),
+      and the running mean and variance of that correlation
+
+    With memory=None every sum covers the whole history and the estimates
+    equal advanced_metrics' calculate_half_life, calculate_hurst_exponent and
+    calculate_correlation_stability on the same bars. With memory=n, sums
+    decay by 1 - 1/n per bar, so they track roughly the last n bars.
+
+    Args:
+        watchlist (list): PairCandidate objects or (ticker1, ticker2, hedge_ratio) tuples;
+                          spread = ticker1 - hedge_ratio * ticker2.
+        max_lag (int): Largest difference lag + 1, as calculate_hurst_exponent.
+        corr_window (int): Rolling correlation window, as calculate_correlation_stability.
+        memory (int): Effective look-back of the decayed sums, or None for all history.
+        variance_ratio_lag (int): Lag q of VR(q) = Var(q-bar diff) / (q * Var(1-bar diff)).
+        min_bars (int): Bars before alerts are raised (default 2 * corr_window).
+    """
+    def __init__(self, watchlist, max_lag=20, corr_window=60, memory=None, variance_ratio_lag=10,
+                 min_bars=None, resync_every=1000):
+        entries = [_watchlist_entry(e) for e in watchlist]
+        self.pairs = [(a, b) for a, b, _ in entries]
+        self.tickers = sorted({t for pair in self.pairs for t in pair})
+        column = {t: i for i, t in enumerate(self.tickers)}
+        self.legs = np.array([[column[a], column[b]] for a, b in self.pairs], dtype=np.int64).reshape(-1, 2)
+        self.hedge_ratio = np.array([beta for _, _, beta in entries])
+        if not 1 <= variance_ratio_lag < max_lag:
+            raise ValueError(f"variance_ratio_lag must be in [1, {max_lag - 1}], got {variance_ratio_lag}")
+
+        self.max_lag = max_lag
+        self.corr_window = corr_window
+        self.decay = 1.0 if memory is None else 1.0 - 1.0 / memory
+        self.variance_ratio_lag = variance_ratio_lag
+        self.min_bars = 2 * corr_window if min_bars is None else min_bars
+        self.resync_every = resync_every
+
+        n = len(self.pairs)
+        self.n_bars = 0
+        self._origin = None  # First spread and prices, subtracted to keep the sums small
+        # Ring buffers of recent spreads and leg prices
+        self._spreads = np.zeros((max_lag, n))
+        self._prices = np.zeros((corr_window, n, 2))
+        # Half-life regression sums: weight, x, y, xx, xy
+        self._hl = np.zeros((5, n))
+        # Lag-difference sums for lags 1..max_lag-1: weight, sum, sum of squares
+        self._lag = np.zeros((3, max_lag - 1, n))
+        # Rolling correlation window sums: a, b, aa, bb, ab
+        self._corr = np.zeros((5, n))
+        # Running sums of the rolling correlation: weight, sum, sum of squares
+        self._stab = np.zeros((3, n))
+        self._correlation = np.full(n, np.nan)
+        self._alerts = [frozenset()] * n
+
+        self._log_lags = np.log(np.arange(2, max_lag))
+
+    def update(self, prices):
+        """
+        Adds one bar.
+
+        Args:
+            prices: Prices of the bar, a Series/dict keyed by ticker or an
+                    array in the order of self.tickers.
+
+        Returns:
+            list: (pair, new alerts) for pairs whose alerts changed on this bar.
+        """
+        if isinstance(prices, (pd.Series, dict)):
+            prices = np.array([prices[t] for t in self.tickers], dtype=float)
+        values = np.asarray(prices, dtype=float)[self.legs]
+        a, b = values[:, 0], values[:, 1]
+        spread = a - self.hedge_ratio * b
+        if self._origin is None:
+            self._origin = (spread.copy(), a.copy(), b.copy())
+        s = spread - self._origin[0]
+        a = a - self._origin[1]
+        b = b - self._origin[2]
+        t = self.n_bars
+        lam = self.decay
+
+        # Half-life: diff(spread) regressed on the previous spread
+        if t >= 1:
+            x = self._spreads[(t - 1) % self.max_lag]
+            y = s - x
+            self._hl *= lam
+            self._hl += np.array([np.ones_like(x), x, y, x * x, x * y])
+
+        # Lag differences for the Hurst exponent and variance ratio
+        available = min(t, self.max_lag - 1)
+        if available:
+            lags = np.arange(1, available + 1)
+            d = s - self._spreads[(t - lags) % self.max_lag]
+            self._lag *= lam
+            self._lag[0, :available] += 1.0
+            self._lag[1, :available] += d
+            self._lag[2, :available] += d * d
+        self._spreads[t % self.max_lag] = s
+
+        # Rolling correlation over the last corr_window bars
+        slot = t % self.corr_window
+        if t >= self.corr_window:
+            old_a, old_b = self._prices[slot, :, 0], self._prices[slot, :, 1]
+            self._corr -= np.array([old_a, old_b, old_a * old_a, old_b * old_b, old_a * old_b])
+        self._prices[slot, :, 0] = a
+        self._prices[slot, :, 1] = b
+        self._corr += np.array([a, b, a * a, b * b, a * b])
+        self.n_bars = t + 1
+        if self.n_bars % self.resync_every == 0:
+            self._resync_correlation()
+
+        if self.n_bars >= self.corr_window:
+            w = self.corr_window
+            sa, sb, saa, sbb, sab = self._corr
+            with np.errstate(divide='ignore', invalid='ignore'):
+                cov = sab - sa * sb / w
+                var_a = saa - sa * sa / w
+                var_b = sbb - sb * sb / w
+                corr = cov / np.sqrt(var_a * var_b)
+            self._correlation = corr
+            valid = np.isfinite(corr)
+            self._stab *= lam
+            self._stab[0] += valid
+            self._stab[1] += np.where(valid, corr, 0.0)
+            self._stab[2] += np.where(valid, corr * corr, 0.0)
+
+        return self._check_alerts()
+
+    def _resync_correlation(self):
+        """Recomputes the window sums from the ring buffer to stop add/remove drift."""
+        n = min(self.n_bars, self.corr_window)
+        window = self._prices[:n] if n < self.corr_window else self._prices
+        a, b = window[:, :, 0], window[:, :, 1]
+        self._corr = np.array([a.sum(0), b.sum(0), (a * a).sum(0), (b * b).sum(0), (a * b).sum(0)])
+
+    def update_frame(self, data):
+        """
+        Feeds every bar of a price frame (columns include self.tickers).
+
+        Returns:
+            list: (timestamp, pair, alerts) for every alert change.
+        """
+        changes = []
+        values = data[self.tickers].values
+        for timestamp, row in zip(data.index, values):
+            for pair, alerts in self.update(row):
+                changes.append((timestamp, pair, alerts))
+        return changes
+
+    def _estimates(self):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            n, sx, sy, sxx, sxy = self._hl
+            slope = (n * sxy - sx * sy) / (n * sxx - sx * sx)
+            half_life = np.where(slope < 0, -np.log(2) / slope, np.inf)
+            half_life = np.where(np.isfinite(slope), half_life, np.nan)
+
+            w, s1, s2 = self._lag
+            var = s2 / w - (s1 / w) ** 2
+            std = np.sqrt(np.maximum(var, 0.0))
+            log_tau = np.log(std[1:])  # lags 2..max_lag-1
+            valid = np.isfinite(log_tau)
+            k = np.where(valid, self._log_lags[:, None], 0.0)
+            m = valid.sum(axis=0)
+            mean_k = k.sum(axis=0) / m
+            mean_tau = np.where(valid, log_tau, 0.0).sum(axis=0) / m
+            dk = np.where(valid, k - mean_k, 0.0)
+            hurst = (dk * np.where(valid, log_tau - mean_tau, 0.0)).sum(axis=0) / (dk * dk).sum(axis=0)
+            hurst = np.where(m >= 2, hurst, 0.5)
+
+            q = self.variance_ratio_lag
+            variance_ratio = var[q - 1] / (q * var[0])
+
+            w, c1, c2 = self._stab
+            stability = np.sqrt(np.maximum(c2 - c1 * c1 / w, 0.0) / (w - 1))
+            stability = np.where(w >= 2, stability, 1.0)
+        return half_life, hurst, variance_ratio, stability
+
+    def _check_alerts(self):
+        if self.n_bars < self.min_bars:
+            return []
+        half_life, hurst, _, stability = self._estimates()
+        metrics = {'half_life': half_life, 'hurst_exponent': hurst, 'correlation_stability': stability}
+        flags = {name: metrics[metric] > threshold for name, (metric, threshold) in ALERTS.items()}
+        flags['no_mean_reversion'] = np.isinf(half_life)
+        flags['slow_mean_reversion'] &= np.isfinite(half_life)
+
+        changed = []
+        for i, pair in enumerate(self.pairs):
+            alerts = frozenset(name for name, flag in flags.items() if flag[i])
+            if alerts != self._alerts[i]:
+                self._alerts[i] = alerts
+                changed.append((pair, alerts))
+                if alerts:
+                    events.incr('pair_alerts')
+                    events.warning('pair_alert', f"{pair[0]}/{pair[1]}: {', '.join(sorted(alerts))} "
+                                   f"(half-life {half_life[i]:.1f}, Hurst {hurst[i]:.3f}, "
+                                   f"correlation stability {stability[i]:.3f})",
+                                   pair=list(pair), alerts=sorted(alerts), bar=self.n_bars)
+                else:
+                    events.info('pair_recovered', f"{pair[0]}/{pair[1]}: alerts cleared",
+                                pair=list(pair), bar=self.n_bars)
+        return changed
+
+    def metrics(self):
+        """
+        Current estimates, one row per pair.
+
+        Returns:
+            pd.DataFrame: 'half_life', 'hurst_exponent', 'variance_ratio',
+                'correlation', 'correlation_stability', 'overall_score'
+                (score_metrics), 'alerts' and 'broken'.
+        """
+        estimates = self._estimates()
+        rows = []
+        for i, pair in enumerate(self.pairs):
+            health = self._health(i, estimates)
+            rows.append({
+                'pair': f"{pair[0]}/{pair[1]}",
+                'half_life': health['half_life'],
+                'hurst_exponent': health['hurst_exponent'],
+                'variance_ratio': health['variance_ratio'],
+                'correlation': self._correlation[i],
+                'correlation_stability': health['correlation_stability'],
+                'overall_score': health['overall_score'],
+                'alerts': health['alerts'],
+                'broken': health['broken']
+            })
+        return pd.DataFrame(rows).set_index('pair')
+
+    def health(self, pair):
+        """
+        One pair's live metrics for select_strategy(health=...): the
+        score_metrics dict plus 'variance_ratio', 'alerts' and 'broken'.
+        """
+        return self._health(self.pairs.index(tuple(pair)), self._estimates())
+
+    def _health(self, i, estimates):
+        half_life, hurst, variance_ratio, stability = estimates
+        health = score_metrics(half_life[i], hurst[i], stability[i])
+        health.update({
+            'variance_ratio': variance_ratio[i],
+            'alerts': sorted(self._alerts[i]),
+            'broken': any(a in BREAKDOWN_ALERTS for a in self._alerts[i])
+        })
+        return health
+
+    def select_strategies(self, verbose=False):
+        """
+        Runs select_strategy on every pair's live metrics.
+
+        Returns:
+            dict: pair -> 'static' or 'kalman'
+        """
+        from adaptive_strategy import select_strategy
+
+        estimates = self._estimates()
+        return {pair: select_strategy(None, None, verbose=verbose, health=self._health(i, estimates))[0]
+                for i, pair in enumerate(self.pairs)}
@@ -0,0 +1,144 @@
+import numpy as np
+import pandas as pd
+from itertools import combinations
+from typing import Dict, List, Optional, Tuple
+
+PRUNE_METHODS = ('sector', 'correlation', 'pca')
+
+def cluster_tickers(data: pd.DataFrame,
+                    method: str = 'correlation',
+                    sectors: Optional[Dict[str, List[str]]] = None,
+                    n_clusters: Optional[int] = None,
+                    distance_threshold: float = 0.6,
+                    n_components: int = 3) -> Dict[str, int]:
+    """
+    Groups tickers into clusters of likely-related assets.
+
+    Args:
+        data: Aligned price DataFrame, one column per ticker
+        method: 'sector' (use the `sectors` labels), 'correlation'
+                (average-linkage clustering on 1 - return correlation) or
+                'pca' (k-means on the leading PCA loadings of returns)
+        sectors: Mapping of sector name to tickers, required for 'sector'
+        n_clusters: Number of clusters for 'correlation' and 'pca'.
+                    'correlation' falls back to `distance_threshold` when unset,
+                    'pca' defaults to roughly sqrt(N / 2).
+        distance_threshold: Correlation-distance cut for 'correlation'
+        n_components: Number of principal components for 'pca'
+
+    Returns:
+        dict: ticker -> integer cluster label
+    """
+    tickers = list(data.columns)
+
+    if method == 'sector':
+        if sectors is None:
+            raise ValueError("method='sector' requires a sectors mapping")
+        labels = {}
+        for label, (sector, members) in enumerate(sectors.items()):
+            for ticker in members:
+                labels[ticker] = label
+        # Unlabelled tickers each get a cluster of their own
+        next_label = len(sectors)
+        clusters = {}
+        for ticker in tickers:
+            if ticker in labels:
+                clusters[ticker] = labels[ticker]
+            else:
+                clusters[ticker] = next_label
+                next_label += 1
+        return clusters
+
+    returns = data.pct_change().dropna()
+
+    if method == 'correlation':
+        from scipy.cluster.hierarchy import fcluster, linkage
+        from scipy.spatial.distance import squareform
+
+        distance = 1 - returns.corr().values
+        np.fill_diagonal(distance, 0.0)
+        distance = np.clip((distance + distance.T) / 2, 0.0, None)
+        tree = linkage(squareform(distance, checks=False), method='average')
+        if n_clusters is not None:
+            labels = fcluster(tree, t=n_clusters, criterion='maxclust')
+        else:
+            labels = fcluster(tree, t=distance_threshold, criterion='distance')
+        return dict(zip(tickers, labels.tolist()))
+
+    if method == 'pca':
+        from scipy.cluster.vq import kmeans2
+
+        standardized = (returns - returns.mean()) / returns.std()
+        # Right singular vectors give the loading of each ticker on each component
+        _, singular_values, vt = np.linalg.svd(standardized.values, full_matrices=False)
+        k = min(n_components, len(singular_values))
+        loadings = (vt[:k] * singular_values[:k, None]).T
+        if n_clusters is None:
+            n_clusters = max(1, int(round(np.sqrt(len(tickers) / 2))))
+        # Best of 10 seeded k-means++ runs by within-cluster sum of squares
+        rng = np.random.default_rng(0)
+        best_labels, best_inertia = None, np.inf
+        for _ in range(10):
+            centroids, labels = kmeans2(loadings, min(n_clusters, len(tickers)), minit='++', seed=rng)
+            inertia = ((loadings - centroids[labels]) ** 2).sum()
+            if inertia < best_inertia:
+                best_labels, best_inertia = labels, inertia
+        return dict(zip(tickers, best_labels.tolist()))
+
+    raise ValueError(f"Unknown clustering method '{method}', expected one of {PRUNE_METHODS}")
+
+def candidate_pairs(data: pd.DataFrame,
+                    clusters: Dict[str, int],
+                    n_neighbors: int = 2) -> List[Tuple[str, str]]:
+    """
+    Builds the pruned candidate pair list.
+
+    Keeps every within-cluster pair, plus for each ticker its `n_neighbors`
+    most correlated tickers (by returns) from other clusters, so that pairs
+    straddling a cluster boundary are not lost.
+
+    Pairs keep the column order of `data`, matching combinations(), since the
+    Engle-Granger test is not symmetric.
+    """
+    tickers = list(data.columns)
+    position = {ticker: i for i, ticker in enumerate(tickers)}
+    selected = set()
+
+    for ticker1, ticker2 in combinations(tickers, 2):
+        if clusters[ticker1] == clusters[ticker2]:
+            selected.add((ticker1, ticker2))
+
+    if n_neighbors > 0 and len(tickers) > 1:
+        corr = data.pct_change().dropna().corr().values
+        labels = np.array([clusters[ticker] for ticker in tickers])
+        for i, ticker in enumerate(tickers):
+            scores = np.where(labels != labels[i], corr[i], -np.inf)
+            for j in np.argsort(scores)[::-1][:n_neighbors]:
+                if not np.isfinite(scores[j]):
+                    break
+                pair = (ticker, tickers[j]) if i < j else (tickers[j], ticker)
+                selected.add(pair)
+
+    return sorted(selected, key=lambda pair: (position[pair[0]], position[pair[1]]))
+
+def pruning_recall(pruned, exhaustive) -> dict:
+    """
+    Measures how many exhaustive-search discoveries the pruned search kept.
+
+    Args:
+        pruned, exhaustive: Lists of PairCandidate from the two searches
+
+    Returns:
+        dict with 'recall', 'found', 'expected' and the 'missed' pair names
+    """
+    kept = {(c.ticker1, c.ticker2) for c in pruned}
+    expected = [(c.ticker1, c.ticker2) for c in exhaustive]
+    missed = [f"{t1}/{t2}" for t1, t2 in expected if (t1, t2) not in kept]
+    found = len(expected) - len(missed)
+
+    return {
+        'recall': found / len(expected) if expected else 1.0,
+        'found': found,
+        'expected': len(expected),
+        'missed': missed
+    }
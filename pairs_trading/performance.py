@@ -0,0 +1,226 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import pandas as pd
+
+from position_events import PositionEvents, trade_returns
+
+def returns_matrix(results):
+    """
+    Stacks backtest outputs into one (time x strategies) frame.
+
+    Args:
+        results (dict): name -> calculate_returns output (or any frame with a
+                        'daily_returns' column), or name -> pd.Series of returns.
+
+    Returns:
+        pd.DataFrame: Daily returns, one column per strategy, on the union of dates.
+    """
+    columns = {}
+    for name, result in results.items():
+        columns[name] = result['daily_returns'] if isinstance(result, pd.DataFrame) else result
+    return pd.DataFrame(columns)
+
+def _as_frame(values):
+    if isinstance(values, pd.Series):
+        return values.to_frame()
+    if isinstance(values, pd.DataFrame) and 'daily_returns' in values.columns:
+        return values[['daily_returns']]
+    return pd.DataFrame(values)
+
+def _match_columns(positions, returns):
+    """
+    Lines the positions' columns up with the returns' strategies.
+
+    Columns are matched by name when both frames name the same strategies
+    (in any order). Only when the names are unrelated, e.g. a 'positions'
+    Series against 'daily_returns' or unnamed arrays, are they matched by position.
+    """
+    if list(positions.columns) == list(returns.columns):
+        return positions
+    if set(positions.columns) == set(returns.columns):
+        return positions[returns.columns]
+    if set(positions.columns) & set(returns.columns) or positions.shape[1] != returns.shape[1]:
+        raise ValueError(f"Position columns {list(positions.columns)} do not match "
+                         f"return columns {list(returns.columns)}")
+    return positions.set_axis(returns.columns, axis=1)
+
+def _trade_ids(positions):
+    """
+    Numbers every trade (a run of one non-zero position) across all columns.
+
+    Returns:
+        tuple: (ids, n_trades, trade_column) where ids has the shape of
+               positions with -1 outside trades and a global trade number inside
+    """
+    previous = np.vstack([np.zeros((1, positions.shape[1])), positions[:-1]])
+    starts = (positions != 0) & (positions != previous)
+    # Column-major numbering so each strategy's trades are contiguous
+    order = np.cumsum(starts.T.ravel()).reshape(positions.shape[1], positions.shape[0]).T - 1
+    ids = np.where(positions != 0, order, -1)
+    trade_column = np.nonzero(starts.T)[0]
+    return ids, len(trade_column), trade_column
+
+def _trade_arrays(returns, positions):
+    """Per-trade return, length and direction, plus the strategy of each trade."""
+    ids, n_trades, trade_column = _trade_ids(positions)
+    # A position held at bar t earns the return of bar t + 1
+    held = np.vstack([returns[1:], np.zeros((1, returns.shape[1]))])
+    in_trade = ids >= 0
+    flat_ids = ids[in_trade]
+    trade_return = np.expm1(np.bincount(flat_ids, weights=np.log1p(held[in_trade]), minlength=n_trades))
+    trade_bars = np.bincount(flat_ids, minlength=n_trades)
+    direction = np.zeros(n_trades)
+    direction[flat_ids] = positions[in_trade]
+    return trade_return, trade_bars, direction, trade_column
+
+def compute_performance(returns, positions=None, periods_per_year=252):
+    """
+    Risk and performance metrics for many strategies in one vectorized pass.
+
+    Leading rows where no strategy has a return yet (e.g. the first row of
+    calculate_returns) are skipped; any other missing return counts as 0.
+
+    Args:
+        returns (pd.DataFrame): Daily returns, time x strategies (a Series, or a
+                                calculate_returns output, is treated as one strategy).
+        positions (pd.DataFrame): Optional positions of the same shape (1, -1, 0),
+                                  held from bar t to t + 1 as in calculate_returns,
+                                  or the same trades as PositionEvents (used
+                                  as they are, without expanding them).
+                                  Trade statistics, turnover and exposure need them.
+        periods_per_year (int): Bars per year for annualisation.
+
+    Returns:
+        pd.DataFrame: One row per strategy with 'total_return', 'annual_return',
+            'annual_volatility', 'sharpe', 'sortino', 'max_drawdown',
+            'max_drawdown_duration' (bars), 'calmar', and with positions also
+            'n_trades', 'hit_rate', 'avg_trade_return', 'best_trade',
+            'worst_trade', 'profit_factor', 'avg_holding_period' (bars),
+            'turnover' (position changes per year) and 'exposure'.
+    """
+    returns = _as_frame(returns)
+    started = returns.notna().any(axis=1).values
+    first = int(np.argmax(started)) if started.any() else len(returns)
+    r = np.nan_to_num(returns.values[first:].astype(float))
+    n_obs, n_strategies = r.shape
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        equity = np.vstack([np.ones((1, n_strategies)), np.cumprod(1 + r, axis=0)])
+        total = equity[-1] - 1
+        annual = np.where(equity[-1] > 0, equity[-1] ** (periods_per_year / max(n_obs, 1)), 0.0) - 1
+
+        mean = r.mean(axis=0) if n_obs else np.zeros(n_strategies)
+        std = r.std(axis=0, ddof=1) if n_obs > 1 else np.zeros(n_strategies)
+        downside = np.sqrt(np.mean(np.minimum(r, 0.0) ** 2, axis=0)) if n_obs else np.zeros(n_strategies)
+        sharpe = np.where(std > 0, mean / std * np.sqrt(periods_per_year), 0.0)
+        sortino = np.where(downside > 0, mean / downside * np.sqrt(periods_per_year), 0.0)
+
+        peak = np.maximum.accumulate(equity, axis=0)
+        drawdown = equity / peak - 1
+        max_drawdown = drawdown.min(axis=0)
+        # Bars since the last peak; the longest such run is the drawdown duration
+        t = np.arange(n_obs + 1)[:, None]
+        last_peak = np.maximum.accumulate(np.where(drawdown >= 0, t, 0), axis=0)
+        duration = (t - last_peak).max(axis=0)
+        calmar = np.where(max_drawdown < 0, annual / -max_drawdown, 0.0)
+
+    metrics = pd.DataFrame({
+        'total_return': total,
+        'annual_return': annual,
+        'annual_volatility': std * np.sqrt(periods_per_year),
+        'sharpe': sharpe,
+        'sortino': sortino,
+        'max_drawdown': max_drawdown,
+        'max_drawdown_duration': duration,
+        'calmar': calmar
+    }, index=returns.columns)
+
+    if isinstance(positions, PositionEvents):
+        events = positions.from_bar(first)
+        trade_return = trade_returns(events, r)
+        trade_bars, trade_column = events.bars, events.column
+        # Every entry and every exit before the last bar changes the position by |direction|
+        size = np.abs(events.direction).astype(float)
+        changes = (np.bincount(trade_column, weights=size, minlength=n_strategies)
+                   + np.bincount(trade_column, weights=size * (events.exit < n_obs), minlength=n_strategies))
+        held = np.bincount(trade_column, weights=trade_bars, minlength=n_strategies)
+    elif positions is not None:
+        positions = _match_columns(_as_frame(positions), returns)
+        p = np.nan_to_num(positions.reindex(returns.index).values[first:].astype(float))
+        trade_return, trade_bars, _, trade_column = _trade_arrays(r, p)
+        changes = np.abs(np.diff(np.vstack([np.zeros((1, n_strategies)), p]), axis=0)).sum(axis=0)
+        held = (p != 0).sum(axis=0)
+
+    if positions is not None:
+        n_trades = np.bincount(trade_column, minlength=n_strategies)
+        wins = np.bincount(trade_column, weights=trade_return > 0, minlength=n_strategies)
+        gains = np.bincount(trade_column, weights=np.maximum(trade_return, 0), minlength=n_strategies)
+        losses = np.bincount(trade_column, weights=np.minimum(trade_return, 0), minlength=n_strategies)
+        best = np.full(n_strategies, np.nan)
+        worst = np.full(n_strategies, np.nan)
+        np.fmax.at(best, trade_column, trade_return)
+        np.fmin.at(worst, trade_column, trade_return)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            metrics['n_trades'] = n_trades
+            metrics['hit_rate'] = np.where(n_trades > 0, wins / n_trades, np.nan)
+            metrics['avg_trade_return'] = np.bincount(trade_column, weights=trade_return, minlength=n_strategies) / n_trades
+            metrics['best_trade'] = best
+            metrics['worst_trade'] = worst
+            metrics['profit_factor'] = np.where(losses < 0, gains / -losses, np.where(gains > 0, np.inf, np.nan))
+            metrics['avg_holding_period'] = np.bincount(trade_column, weights=trade_bars, minlength=n_strategies) / n_trades
+            metrics['turnover'] = changes / max(n_obs, 1) * periods_per_year
+            metrics['exposure'] = held / n_obs if n_obs else 0.0
+
+    return metrics
+
+def trade_table(returns, positions):
+    """
+    Trade-level statistics: one row per trade with its strategy, entry and exit
+    bars, direction, length and compounded return.
+
+    Args:
+        returns, positions (pd.DataFrame): As for compute_performance.
+
+    Returns:
+        pd.DataFrame
+    """
+    returns = _as_frame(returns)
+    if isinstance(positions, PositionEvents):
+        return pd.DataFrame({
+            'strategy': returns.columns[positions.column],
+            'entry': returns.index[positions.entry],
+            'exit': returns.index[np.minimum(positions.exit, len(returns) - 1)],
+            'direction': positions.direction.astype(int),
+            'bars': positions.bars,
+            'return': trade_returns(positions, returns.values)
+        })
+    positions = _match_columns(_as_frame(positions), returns).reindex(returns.index)
+    r = np.nan_to_num(returns.values.astype(float))
+    p = np.nan_to_num(positions.values.astype(float))
+    trade_return, trade_bars, direction, trade_column = _trade_arrays(r, p)
+
+    ids, _, _ = _trade_ids(p)
+    flat_ids = ids[ids >= 0]
+    bar_index = np.broadcast_to(np.arange(len(p))[:, None], p.shape)[ids >= 0]
+    entry = np.full(len(trade_return), len(p))
+    np.minimum.at(entry, flat_ids, bar_index)
+    exit_bar = np.zeros(len(trade_return), dtype=int)
+    np.maximum.at(exit_bar, flat_ids, bar_index)
+
+    return pd.DataFrame({
+        'strategy': returns.columns[trade_column],
+        'entry': returns.index[entry],
+        'exit': returns.index[np.minimum(exit_bar + 1, len(p) - 1)],
+        'direction': direction.astype(int),
+        'bars': trade_bars,
+        'return': trade_return
+    })
+
+def rank_strategies(metrics, by='sharpe', ascending=False, top_n=None):
+    """Sorts compute_performance output by one metric."""
+    ranked = metrics.sort_values(by, ascending=ascending)
+    return ranked.head(top_n) if top_n is not None else ranked
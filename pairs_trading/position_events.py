@@ -0,0 +1,197 @@
+import numpy as np
+import pandas as pd
+from dataclasses import dataclass
+from typing import List, Optional
+
+@dataclass
+class PositionEvents:
+    """
+    Run-length-encoded positions: one record per trade instead of one value per bar.
+
+    A trade is a run of one non-zero position. It is held from bar `entry`
+    up to, but not including, bar `exit` (the first bar with a different
+    position, or n_bars if it is still open at the end). Flat bars are not
+    stored. Strategies (columns) are stored one after the other, each in time
+    order, so a pair that trades a few hundred times over a year of minute
+    bars takes a few kilobytes instead of one integer per bar.
+    """
+    entry: np.ndarray
+    exit: np.ndarray
+    direction: np.ndarray
+    column: np.ndarray
+    n_bars: int
+    index: Optional[pd.Index] = None
+    columns: Optional[List] = None
+
+    @staticmethod
+    def _bar_dtype(n_bars):
+        return np.int32 if n_bars < 2 ** 31 - 1 else np.int64
+
+    @classmethod
+    def from_dense(cls, positions, index=None, columns=None) -> 'PositionEvents':
+        """
+        Encodes a positions Series / DataFrame / array (time along the first axis).
+
+        NaN positions (e.g. from a reindex) count as flat.
+        """
+        if isinstance(positions, pd.Series):
+            index = positions.index if index is None else index
+            columns = [positions.name] if columns is None else columns
+        elif isinstance(positions, pd.DataFrame):
+            index = positions.index if index is None else index
+            columns = list(positions.columns) if columns is None else columns
+        p = np.asarray(positions)
+        if p.dtype.kind == 'f':
+            p = np.nan_to_num(p).astype(np.int8)
+        if p.ndim == 1:
+            p = p[:, None]
+        n_bars, n_columns = p.shape
+        zeros = np.zeros((1, n_columns), dtype=p.dtype)
+        starts = (p != 0) & (p != np.vstack([zeros, p[:-1]]))
+        ends = (p != 0) & (p != np.vstack([p[1:], zeros]))
+        # Transposed so the events come out column by column, each in time order
+        column, entry = np.nonzero(starts.T)
+        _, last = np.nonzero(ends.T)
+        dtype = cls._bar_dtype(n_bars)
+        return cls(entry=entry.astype(dtype), exit=(last + 1).astype(dtype),
+                   direction=p[entry, column].astype(np.int8), column=column.astype(np.int32),
+                   n_bars=n_bars, index=index,
+                   columns=list(columns) if columns is not None else list(range(n_columns)))
+
+    @classmethod
+    def hstack(cls, parts: List['PositionEvents']) -> 'PositionEvents':
+        """Joins the events of column blocks (same bars) into one set, e.g. per block of pairs."""
+        offsets = np.cumsum([0] + [len(part.columns) for part in parts[:-1]])
+        return cls(entry=np.concatenate([part.entry for part in parts]),
+                   exit=np.concatenate([part.exit for part in parts]),
+                   direction=np.concatenate([part.direction for part in parts]),
+                   column=np.concatenate([part.column + offset for part, offset in zip(parts, offsets)]),
+                   n_bars=parts[0].n_bars, index=parts[0].index,
+                   columns=[c for part in parts for c in part.columns])
+
+    def __len__(self):
+        return len(self.entry)
+
+    @property
+    def n_columns(self):
+        return len(self.columns)
+
+    @property
+    def bars(self):
+        """Bars each trade was held."""
+        return (self.exit - self.entry).astype(np.int64)
+
+    @property
+    def nbytes(self):
+        return self.entry.nbytes + self.exit.nbytes + self.direction.nbytes + self.column.nbytes
+
+    def to_dense(self, dtype=np.int8) -> np.ndarray:
+        """Expands to a (n_bars x n_columns) positions array in one vectorized pass."""
+        delta = np.zeros((self.n_bars + 1, self.n_columns), dtype=np.int16)
+        np.add.at(delta, (self.entry, self.column), self.direction)
+        np.add.at(delta, (self.exit, self.column), -self.direction)
+        return np.cumsum(delta[:-1], axis=0, dtype=np.int16).astype(dtype)
+
+    def to_frame(self, dtype=np.int64) -> pd.DataFrame:
+        return pd.DataFrame(self.to_dense(dtype), index=self.index, columns=self.columns)
+
+    def to_series(self, column=0, dtype=np.int64) -> pd.Series:
+        """Dense positions of one column, as generate_signals' 'positions'."""
+        return self.to_frame(dtype).iloc[:, column].rename('positions')
+
+    def from_bar(self, start) -> 'PositionEvents':
+        """The events on bars start.. (renumbered from 0); trades open at `start` are cut there."""
+        keep = self.exit > start
+        return PositionEvents(entry=np.maximum(self.entry[keep], start) - start, exit=self.exit[keep] - start,
+                              direction=self.direction[keep], column=self.column[keep],
+                              n_bars=self.n_bars - start,
+                              index=self.index[start:] if self.index is not None else None, columns=self.columns)
+
+    def to_records(self) -> pd.DataFrame:
+        """One row per trade, e.g. to write to a results file instead of the per-bar positions."""
+        records = pd.DataFrame({'strategy': np.asarray(self.columns, dtype=object)[self.column],
+                                'entry': self.entry, 'exit': self.exit, 'direction': self.direction})
+        if self.index is not None:
+            records['entry_time'] = self.index[self.entry]
+            records['exit_time'] = self.index[np.minimum(self.exit, self.n_bars - 1)]
+        return records
+
+def trade_returns(events: PositionEvents, returns) -> np.ndarray:
+    """
+    Compounded return of every trade from the strategy's bar returns.
+
+    As in calculate_returns, a position held at bar t earns the return of bar
+    t + 1, so a trade earns bars entry + 1 .. exit. One cumulative sum of
+    log returns per column answers every trade with two lookups, without
+    expanding the positions.
+
+    Args:
+        events (PositionEvents): Trades.
+        returns (array-like): Strategy returns (n_bars x n_columns, or 1-D for
+                              one column); NaNs count as 0.
+
+    Returns:
+        np.ndarray: One return per trade, in event order.
+    """
+    r = np.nan_to_num(np.asarray(returns, dtype=float))
+    if r.ndim == 1:
+        r = r[:, None]
+    log_growth = np.vstack([np.zeros((1, r.shape[1])), np.cumsum(np.log1p(r), axis=0)])
+    last = np.minimum(events.exit, events.n_bars - 1)
+    return np.expm1(log_growth[last + 1, events.column] - log_growth[events.entry + 1, events.column])
+
+def trade_pnl(events: PositionEvents, prices1, prices2, hedge_ratio=1.0) -> pd.DataFrame:
+    """
+    Per-trade PnL of holding the spread legs from entry to exit prices.
+
+    One unit of the spread is long 1 unit of asset 1 and short hedge_ratio
+    units of asset 2 (the reverse for a short). The trade is opened at the
+    close of its entry bar and closed at the close of its exit bar (the last
+    bar for a trade still open), so only those two prices per leg are read.
+
+    Args:
+        events (PositionEvents): Trades.
+        prices1, prices2 (array-like): Leg prices, (n_bars,) or one column per strategy.
+        hedge_ratio (float or array): Units of asset 2 per unit of asset 1: a
+                                      scalar, one per strategy, or per bar
+                                      (n_bars,) or (n_bars, n_columns), as
+                                      from the Kalman filter; the value at
+                                      entry is used.
+
+    Returns:
+        pd.DataFrame: One row per trade with 'strategy', 'entry', 'exit',
+            'direction', 'bars', the leg prices at entry and exit, 'pnl' (per
+            unit of the spread) and 'return' (pnl over the gross capital at entry).
+    """
+    p1 = np.asarray(prices1, dtype=float)
+    p2 = np.asarray(prices2, dtype=float)
+    p1 = p1[:, None] if p1.ndim == 1 else p1
+    p2 = p2[:, None] if p2.ndim == 1 else p2
+    col1 = events.column if p1.shape[1] > 1 else np.zeros_like(events.column)
+    col2 = events.column if p2.shape[1] > 1 else np.zeros_like(events.column)
+    hedge = np.asarray(hedge_ratio, dtype=float)
+    if hedge.ndim == 1 and events.n_columns == 1 and len(hedge) == events.n_bars:
+        hedge = hedge[:, None]  # a dynamic (Kalman) hedge ratio of a single pair
+    if hedge.ndim == 2:
+        beta = hedge[events.entry, events.column]
+    elif hedge.ndim == 1:
+        beta = hedge[events.column]
+    else:
+        beta = np.full(len(events), float(hedge))
+
+    close = np.minimum(events.exit, events.n_bars - 1)
+    entry1, exit1 = p1[events.entry, col1], p1[close, col1]
+    entry2, exit2 = p2[events.entry, col2], p2[close, col2]
+    pnl = events.direction * ((exit1 - entry1) - beta * (exit2 - entry2))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        gross = np.abs(entry1) + np.abs(beta * entry2)
+        ret = np.where(gross > 0, pnl / gross, np.nan)
+
+    table = events.to_records()
+    table['bars'] = events.bars
+    table['entry_price1'], table['exit_price1'] = entry1, exit1
+    table['entry_price2'], table['exit_price2'] = entry2, exit2
+    table['hedge_ratio'] = beta
+    table['pnl'] = pnl
+    table['return'] = ret
+    return table
@@ -0,0 +1,176 @@
+import functools
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+class _NullSpan:
+    """Shared no-op span returned while profiling is disabled."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+# The active Profiler, or None when profiling is disabled
+_profiler = None
+
+class _Span:
+    __slots__ = ('profiler', 'name', 'start', 'memory_start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        profiler = self.profiler
+        profiler._stack.append(self.name)
+        if profiler.track_memory:
+            self.memory_start = tracemalloc.get_traced_memory()[0]
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        profiler = self.profiler
+        path = tuple(profiler._stack)
+        profiler._stack.pop()
+
+        stats = profiler.spans.get(path)
+        if stats is None:
+            stats = profiler.spans[path] = {'calls': 0, 'wall_time': 0.0, 'memory_delta': 0}
+        stats['calls'] += 1
+        stats['wall_time'] += elapsed
+        if profiler.track_memory:
+            stats['memory_delta'] += tracemalloc.get_traced_memory()[0] - self.memory_start
+        return False
+
+class Profiler:
+    """
+    Collects nested wall-time spans and counters.
+
+    Spans are keyed by their full call path (e.g. run_experiment > fetch_data),
+    so the same stage reached from different callers is kept apart.
+    With track_memory=True, tracemalloc also records the net allocated bytes
+    of each span (this slows the profiled code noticeably).
+    """
+    def __init__(self, track_memory=False):
+        self.track_memory = track_memory
+        self.spans = {}
+        self.counters = {}
+        self._stack = []
+        self._started_tracemalloc = False
+
+    def span(self, name):
+        return _Span(self, name)
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def stages(self):
+        """Per-stage totals aggregated over every call path."""
+        totals = {}
+        for path, stats in self.spans.items():
+            stage = totals.setdefault(path[-1], {'calls': 0, 'wall_time': 0.0, 'memory_delta': 0})
+            stage['calls'] += stats['calls']
+            stage['wall_time'] += stats['wall_time']
+            stage['memory_delta'] += stats['memory_delta']
+        return totals
+
+    def to_dict(self):
+        return {
+            'stages': self.stages(),
+            'spans': [dict(path=' > '.join(path), **stats) for path, stats in self.spans.items()],
+            'counters': dict(self.counters)
+        }
+
+    def export_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def export_folded(self, path):
+        """
+        Writes self-time per call path in the folded-stack format used by
+        flamegraph.pl and speedscope ("outer;inner <microseconds>").
+        """
+        self_time = {p: stats['wall_time'] for p, stats in self.spans.items()}
+        for p, stats in self.spans.items():
+            if len(p) > 1 and p[:-1] in self_time:
+                self_time[p[:-1]] -= stats['wall_time']
+        with open(path, 'w') as f:
+            for p, seconds in sorted(self_time.items()):
+                f.write(f"{';'.join(p)} {max(0, int(round(seconds * 1e6)))}\n")
+
+    def print_report(self):
+        print(f"\n{'Stage':<30} {'Calls':>8} {'Wall (s)':>10} {'Mem (MB)':>10}")
+        print("-" * 62)
+        for name, stats in sorted(self.stages().items(), key=lambda item: -item[1]['wall_time']):
+            print(f"{name:<30} {stats['calls']:>8} {stats['wall_time']:>10.3f} {stats['memory_delta'] / 1e6:>10.2f}")
+        for name, value in sorted(self.counters.items()):
+            print(f"{name:<30} {value:>8}")
+
+def span(name):
+    """
+    Context manager timing one stage. Returns a shared no-op object while
+    profiling is disabled, so instrumented code costs one global lookup.
+    """
+    if _profiler is None:
+        return _NULL_SPAN
+    return _profiler.span(name)
+
+def profiled(name):
+    """Decorator wrapping every call of the function in span(name)."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _profiler is None:
+                return func(*args, **kwargs)
+            with _profiler.span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def count(name, n=1):
+    """Increments a named counter on the active profiler, if any."""
+    if _profiler is not None:
+        _profiler.count(name, n)
+
+def enable(track_memory=False):
+    """Starts a new global profiler and returns it."""
+    global _profiler
+    _profiler = Profiler(track_memory=track_memory)
+    if track_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _profiler._started_tracemalloc = True
+    return _profiler
+
+def disable():
+    """Stops profiling and returns the profiler that was active."""
+    global _profiler
+    profiler, _profiler = _profiler, None
+    if profiler is not None and profiler._started_tracemalloc:
+        tracemalloc.stop()
+    return profiler
+
+@contextmanager
+def profile(track_memory=False, json_path=None, folded_path=None):
+    """
+    Profiles the enclosed block:
+
+        with profiling.profile(json_path='profile.json') as profiler:
+            run_experiment(...)
+        profiler.print_report()
+    """
+    profiler = enable(track_memory=track_memory)
+    try:
+        yield profiler
+    finally:
+        disable()
+        if json_path is not None:
+            profiler.export_json(json_path)
+        if folded_path is not None:
+            profiler.export_folded(folded_path)
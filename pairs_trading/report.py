@@ -0,0 +1,267 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import html
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from performance import compute_performance
+from profiling import span
+import events
+
+COLORS = ('#1f77b4', '#ff7f0e', '#2ca02c', '#d62728')
+
+def lttb(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets downsampling.
+
+    Keeps the first and last points and, from each of n_out - 2 equal buckets
+    in between, the point forming the largest triangle with the previously
+    kept point and the average of the next bucket. Peaks, troughs and the
+    overall shape of the line survive, unlike plain decimation. NaN points
+    are skipped.
+
+    Args:
+        x, y (array-like): Coordinates, x increasing.
+        n_out (int): Number of points to keep.
+
+    Returns:
+        np.ndarray: Indices of the kept points into x and y.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    valid = np.flatnonzero(np.isfinite(x) & np.isfinite(y))
+    n = len(valid)
+    if n_out >= n or n_out < 3:
+        return valid
+    xv, yv = x[valid], y[valid]
+
+    # Bucket i covers [bounds[i], bounds[i + 1]) of the interior points 1..n-2
+    bounds = np.floor(np.linspace(1, n - 1, n_out - 1)).astype(np.int64)
+    keep = np.empty(n_out, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = bounds[i], bounds[i + 1]
+        if i + 2 < len(bounds):
+            next_start, next_end = bounds[i + 1], bounds[i + 2]
+        else:
+            next_start, next_end = n - 1, n
+        avg_x = xv[next_start:next_end].mean()
+        avg_y = yv[next_start:next_end].mean()
+        area = np.abs((xv[a] - avg_x) * (yv[start:end] - yv[a]) - (xv[a] - xv[start:end]) * (avg_y - yv[a]))
+        a = start + int(np.argmax(area))
+        keep[i + 1] = a
+    return valid[keep]
+
+def downsample(series, n_out=500):
+    """LTTB-downsampled copy of a pd.Series (datetime or numeric index)."""
+    index = series.index
+    x = index.asi8 if isinstance(index, pd.DatetimeIndex) else np.arange(len(series))
+    return series.iloc[lttb(x, series.values, n_out)]
+
+@dataclass
+class ChartSpec:
+    """One line chart: named series (already downsampled) and horizontal reference lines."""
+    title: str
+    series: Dict[str, pd.Series]
+    hlines: List[float] = field(default_factory=list)
+
+@dataclass
+class ReportEntry:
+    name: str
+    summary: dict
+    charts: List[ChartSpec]
+    group: Optional[str] = None
+
+def _svg_chart(chart, width=900, height=220):
+    """Renders a ChartSpec as an inline SVG polyline chart."""
+    pad_left, pad_right, pad_top, pad_bottom = 60, 10, 24, 22
+    all_x, all_y = [], []
+    for s in chart.series.values():
+        index = s.index
+        all_x.append(index.asi8 if isinstance(index, pd.DatetimeIndex) else np.asarray(index, dtype=float))
+        all_y.append(s.values.astype(float))
+    if not all_x or not sum(len(x) for x in all_x):
+        return f'<p class="empty">{html.escape(chart.title)}: no data</p>'
+    xs, ys = np.concatenate(all_x).astype(float), np.concatenate(all_y + [np.asarray(chart.hlines, dtype=float)])
+    x0, x1 = np.nanmin(xs), np.nanmax(xs)
+    y0, y1 = np.nanmin(ys), np.nanmax(ys)
+    if x1 == x0:
+        x1 = x0 + 1
+    if y1 == y0:
+        y0, y1 = y0 - 1, y1 + 1
+    plot_w, plot_h = width - pad_left - pad_right, height - pad_top - pad_bottom
+
+    def px(x):
+        return pad_left + (x - x0) / (x1 - x0) * plot_w
+
+    def py(y):
+        return pad_top + (y1 - y) / (y1 - y0) * plot_h
+
+    parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" class="chart">',
+             f'<text x="{pad_left}" y="15" class="title">{html.escape(chart.title)}</text>',
+             f'<rect x="{pad_left}" y="{pad_top}" width="{plot_w}" height="{plot_h}" class="frame"/>']
+    for value in (y0, y1):
+        parts.append(f'<text x="{pad_left - 4}" y="{py(value) + 4:.1f}" class="axis" text-anchor="end">{value:.4g}</text>')
+    first = chart.series[next(iter(chart.series))].index
+    if len(first):
+        for x, anchor, label in ((x0, 'start', first[0]), (x1, 'end', first[-1])):
+            text = label.strftime('%Y-%m-%d') if hasattr(label, 'strftime') else str(label)
+            parts.append(f'<text x="{px(x):.1f}" y="{height - 6}" class="axis" text-anchor="{anchor}">{text}</text>')
+    for value in chart.hlines:
+        parts.append(f'<line x1="{pad_left}" x2="{pad_left + plot_w}" y1="{py(value):.1f}" y2="{py(value):.1f}" class="hline"/>')
+    for k, ((label, s), x, y) in enumerate(zip(chart.series.items(), all_x, all_y)):
+        color = COLORS[k % len(COLORS)]
+        valid = np.isfinite(y)
+        points = ' '.join(f'{a:.1f},{b:.1f}' for a, b in zip(px(x[valid].astype(float)), py(y[valid])))
+        parts.append(f'<polyline points="{points}" fill="none" stroke="{color}" stroke-width="1.2"/>')
+        parts.append(f'<text x="{width - pad_right - 4}" y="{pad_top + 14 + 14 * k}" class="legend" '
+                     f'fill="{color}" text-anchor="end">{html.escape(str(label))}</text>')
+    parts.append('</svg>')
+    return ''.join(parts)
+
+def _render_entries(entries):
+    """Worker: HTML sections of a batch of entries."""
+    sections = []
+    for entry in entries:
+        charts = ''.join(_svg_chart(chart) for chart in entry.charts)
+        anchor = html.escape(entry.name.replace(' ', '_'))
+        sections.append(f'<section id="{anchor}"><h2>{html.escape(entry.name)}</h2>{charts}</section>')
+    return sections
+
+_STYLE = """
+body { font-family: sans-serif; margin: 24px; color: #222; }
+table { border-collapse: collapse; font-size: 13px; }
+th, td { border: 1px solid #ccc; padding: 3px 8px; text-align: right; }
+th { background: #f0f0f0; }
+td.name { text-align: left; }
+svg.chart { display: block; margin: 8px 0; }
+svg .title { font-size: 13px; font-weight: bold; }
+svg .axis, svg .legend { font-size: 11px; }
+svg .frame { fill: none; stroke: #bbb; }
+svg .hline { stroke: #999; stroke-dasharray: 4 3; }
+"""
+
+class ReportBuilder:
+    """
+    Collects experiment results and renders one static HTML report for a study.
+
+    Series are LTTB-downsampled to max_points when added, so the builder stays
+    small however long the backtests are. render() draws every chart as inline
+    SVG (no image files), splitting the experiments across worker processes
+    when there are many.
+
+    Args:
+        title (str): Report title.
+        max_points (int): Points kept per series.
+    """
+    def __init__(self, title='Pairs Trading Study', max_points=500):
+        self.title = title
+        self.max_points = max_points
+        self.entries: List[ReportEntry] = []
+
+    def add(self, name, data, result, tickers, use_kalman=False, entry_threshold=2.0, group=None):
+        """
+        Adds one run_pipeline result.
+
+        Args:
+            name (str): Experiment name.
+            data (pd.DataFrame): The prices that were backtested.
+            result (dict): run_pipeline output.
+            tickers (list): [ticker1, ticker2].
+            use_kalman (bool): Whether the hedge ratio is dynamic.
+            group (str): Optional study group (e.g. a period) shown in the summary table.
+        """
+        n = self.max_points
+        with span('report_downsample'):
+            charts = [ChartSpec(f'{name} - Asset Prices', {t: downsample(data[t], n) for t in tickers})]
+            if use_kalman:
+                charts.append(ChartSpec(f'{name} - Kalman Hedge Ratio',
+                                        {'Dynamic Hedge Ratio': downsample(result['hedge_ratio'], n)}))
+            charts.append(ChartSpec(f'{name} - Spread Z-Score', {'Z-Score': downsample(result['zscore'], n)},
+                                    hlines=[entry_threshold, -entry_threshold, 0.0]))
+            charts.append(ChartSpec(f'{name} - Cumulative Returns',
+                                    {'Strategy Returns': downsample(result['metrics']['cumulative_returns'], n)}))
+
+        metrics = compute_performance(result['metrics']['daily_returns'], result['positions']).iloc[0]
+        summary = {
+            'tickers': f"{tickers[0]}/{tickers[1]}",
+            'model': 'kalman' if use_kalman else 'static',
+            'bars': len(data),
+            **{k: float(metrics[k]) for k in ('total_return', 'sharpe', 'sortino', 'max_drawdown',
+                                               'n_trades', 'hit_rate', 'avg_holding_period')}
+        }
+        self.entries.append(ReportEntry(name=name, summary=summary, charts=charts, group=group))
+        events.incr('report_entries')
+
+    def summary_frame(self):
+        rows = [{'name': e.name, 'group': e.group, **e.summary} for e in self.entries]
+        return pd.DataFrame(rows)
+
+    def _summary_table(self):
+        frame = self.summary_frame()
+        if frame.empty:
+            return '<p>No experiments.</p>'
+        if frame['group'].isna().all():
+            frame = frame.drop(columns='group')
+        header = ''.join(f'<th>{html.escape(str(c))}</th>' for c in frame.columns)
+        body = []
+        for _, row in frame.iterrows():
+            cells = []
+            for column, value in row.items():
+                if column == 'name':
+                    anchor = html.escape(str(value).replace(' ', '_'))
+                    cells.append(f'<td class="name"><a href="#{anchor}">{html.escape(str(value))}</a></td>')
+                elif isinstance(value, float):
+                    text = f'{value * 100:.2f}%' if column in ('total_return', 'max_drawdown', 'hit_rate') else f'{value:.3g}'
+                    cells.append(f'<td>{text}</td>')
+                else:
+                    cells.append(f'<td>{html.escape(str(value))}</td>')
+            body.append(f"<tr>{''.join(cells)}</tr>")
+        return f"<table><tr>{header}</tr>{''.join(body)}</table>"
+
+    def render(self, path, n_jobs=None, min_parallel=200):
+        """
+        Writes the whole study as one self-contained HTML file.
+
+        Args:
+            path (str): Output file.
+            n_jobs (int): Worker processes for chart rendering (defaults to the
+                          CPU count; 1 renders in-process).
+            min_parallel (int): Fewer experiments than this render in-process,
+                                where starting workers would cost more than it saves.
+
+        Returns:
+            str: path
+        """
+        started = time.perf_counter()
+        n_jobs = n_jobs or os.cpu_count() or 1
+        with span('render_report'):
+            if n_jobs == 1 or len(self.entries) < min_parallel:
+                sections = _render_entries(self.entries)
+            else:
+                batches = [self.entries[i::n_jobs] for i in range(n_jobs)]
+                with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+                    rendered = list(pool.map(_render_entries, batches))
+                # Restore the original order from the round-robin batches
+                sections = [None] * len(self.entries)
+                for k, batch in enumerate(rendered):
+                    sections[k::n_jobs] = batch
+
+            document = (f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>{html.escape(self.title)}</title>'
+                        f'<style>{_STYLE}</style></head><body><h1>{html.escape(self.title)}</h1>'
+                        f'{self._summary_table()}{"".join(sections)}</body></html>')
+            with open(path, 'w') as f:
+                f.write(document)
+
+        elapsed = time.perf_counter() - started
+        events.info('report_saved', f"Report with {len(self.entries)} experiments saved to {path} ({elapsed:.2f}s)",
+                    path=path, experiments=len(self.entries), seconds=elapsed)
+        return path
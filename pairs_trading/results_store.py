@@ -0,0 +1,252 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import json
+import sqlite3
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from performance import compute_performance
+import events
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results.db')
+
+# Metric columns of the backtests table, named as in performance.compute_performance
+METRIC_COLUMNS = (
+    'final_return', 'total_return', 'annual_return', 'annual_volatility', 'sharpe', 'sortino',
+    'max_drawdown', 'max_drawdown_duration', 'calmar', 'n_trades', 'hit_rate', 'avg_trade_return',
+    'avg_holding_period', 'turnover', 'exposure', 'hedge_ratio', 'n_bars'
+)
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    name TEXT,
+    created_at REAL NOT NULL,
+    params TEXT
+);
+CREATE TABLE IF NOT EXISTS discoveries (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    period TEXT,
+    start_date TEXT,
+    end_date TEXT,
+    pair TEXT NOT NULL,
+    ticker1 TEXT NOT NULL,
+    ticker2 TEXT NOT NULL,
+    p_value REAL,
+    correlation REAL,
+    hedge_ratio REAL,
+    quality_score REAL,
+    rank INTEGER
+);
+CREATE TABLE IF NOT EXISTS backtests (
+    backtest_id INTEGER PRIMARY KEY,
+    run_id INTEGER REFERENCES runs(run_id),
+    name TEXT,
+    pair TEXT NOT NULL,
+    period TEXT,
+    model TEXT,
+    sample TEXT,
+    start_date TEXT,
+    end_date TEXT,
+    params TEXT,
+    {', '.join(f'{c} REAL' for c in METRIC_COLUMNS)}
+);
+CREATE TABLE IF NOT EXISTS returns (
+    backtest_id INTEGER NOT NULL REFERENCES backtests(backtest_id),
+    bar INTEGER NOT NULL,
+    timestamp TEXT,
+    daily_return REAL,
+    position REAL,
+    PRIMARY KEY (backtest_id, bar)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_discoveries_pair ON discoveries(pair);
+CREATE INDEX IF NOT EXISTS idx_discoveries_period ON discoveries(period);
+CREATE INDEX IF NOT EXISTS idx_backtests_pair ON backtests(pair);
+CREATE INDEX IF NOT EXISTS idx_backtests_period ON backtests(period);
+CREATE INDEX IF NOT EXISTS idx_backtests_model ON backtests(model);
+CREATE INDEX IF NOT EXISTS idx_backtests_sample_sharpe ON backtests(sample, sharpe);
+"""
+
+def pair_key(tickers):
+    """'T1/T2', the pair column used by every table."""
+    return '/'.join(tickers)
+
+def _number(value):
+    if value is None:
+        return None
+    value = float(value)
+    return None if np.isnan(value) else value
+
+class ResultsStore:
+    """
+    Embedded SQLite store of discoveries, backtest metrics and return series.
+
+    Each process opens its own connection; the database runs in WAL mode with
+    a busy timeout, so pool workers can bulk-insert concurrently while a
+    reader queries. Every record_* call is one transaction.
+
+    Tables:
+        runs:        one row per discovery or backtest session
+        discoveries: candidate pairs found by a run
+        backtests:   one row per backtest with its parameters and metrics;
+                     sample is 'in' or 'out' (of sample) when known
+        returns:     per-bar daily return and position of stored backtests
+    """
+    def __init__(self, path=DEFAULT_PATH, timeout=30.0):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=timeout)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __getstate__(self):
+        # Pool workers reopen the database rather than sharing a connection
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+    def start_run(self, kind, name=None, **params):
+        """Registers a session and returns its run_id."""
+        with self.conn:
+            cursor = self.conn.execute('INSERT INTO runs (kind, name, created_at, params) VALUES (?, ?, ?, ?)',
+                                       (kind, name, time.time(), json.dumps(params, default=str)))
+        return cursor.lastrowid
+
+    def record_discoveries(self, run_id, candidates, period=None, start_date=None, end_date=None):
+        """Bulk-inserts PairCandidate objects in rank order."""
+        rows = [(run_id, period, start_date, end_date, pair_key([c.ticker1, c.ticker2]), c.ticker1, c.ticker2,
+                 _number(c.p_value), _number(c.correlation), _number(c.hedge_ratio), _number(c.quality_score), rank)
+                for rank, c in enumerate(candidates, 1)]
+        with self.conn:
+            self.conn.executemany('INSERT INTO discoveries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        events.incr('store_discoveries', len(rows))
+        return len(rows)
+
+    def record_backtests(self, rows: List[Dict], run_id=None, series: Optional[List[pd.DataFrame]] = None):
+        """
+        Bulk-inserts backtest summaries, e.g. experiment-grid rows.
+
+        Args:
+            rows: Dicts with 'tickers' (or 'pair'), optional 'name', 'period',
+                  'model', 'sample', 'start'/'end' and 'params' (a dict; other
+                  unknown keys are stored there too), and any METRIC_COLUMNS.
+            run_id: Session the rows belong to.
+            series: Optional per-row frames with 'daily_returns' and
+                    'positions' columns to store as return series.
+
+        Returns:
+            list: The new backtest_ids.
+        """
+        known = {'tickers', 'pair', 'name', 'period', 'model', 'sample', 'start', 'end', 'params', 'cell_id',
+                 'status', 'error', 'total_return_pct'} | set(METRIC_COLUMNS)
+        columns = ('run_id', 'name', 'pair', 'period', 'model', 'sample', 'start_date', 'end_date', 'params') + METRIC_COLUMNS
+        sql = f"INSERT INTO backtests ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+
+        ids = []
+        with self.conn:
+            for i, row in enumerate(rows):
+                params = dict(row.get('params') or {})
+                params.update({k: v for k, v in row.items() if k not in known})
+                pair = row.get('pair') if 'tickers' not in row else pair_key(row['tickers'])
+                values = (run_id, row.get('name', row.get('cell_id')), pair, row.get('period'), row.get('model'),
+                          row.get('sample'), row.get('start'), row.get('end'), json.dumps(params, default=str))
+                metrics = dict(row)
+                if metrics.get('total_return') is None and metrics.get('final_return') is not None:
+                    metrics['total_return'] = metrics['final_return'] - 1
+                values += tuple(_number(metrics.get(c)) for c in METRIC_COLUMNS)
+                backtest_id = self.conn.execute(sql, values).lastrowid
+                ids.append(backtest_id)
+                if series is not None and series[i] is not None:
+                    self._insert_series(backtest_id, series[i])
+        events.incr('store_backtests', len(ids))
+        return ids
+
+    def record_backtest(self, result, tickers, run_id=None, name=None, period=None, model=None, sample=None,
+                        start=None, end=None, params=None, store_returns=True, periods_per_year=252):
+        """
+        Stores one run_pipeline result with its performance metrics and,
+        by default, its daily return and position series.
+
+        Returns:
+            int: backtest_id
+        """
+        metrics = result['metrics']
+        perf = compute_performance(metrics['daily_returns'], result['positions'], periods_per_year).iloc[0]
+        row = {c: perf[c] for c in METRIC_COLUMNS if c in perf}
+        row.update({
+            'tickers': tickers, 'name': name, 'period': period, 'model': model, 'sample': sample,
+            'start': start, 'end': end, 'params': params or {},
+            'final_return': perf['total_return'] + 1,
+            'hedge_ratio': float(np.mean(result['hedge_ratio'])),
+            'n_bars': len(result['positions'])
+        })
+        series = None
+        if store_returns:
+            series = [pd.DataFrame({'daily_returns': metrics['daily_returns'], 'positions': result['positions']})]
+        return self.record_backtests([row], run_id=run_id, series=series)[0]
+
+    def _insert_series(self, backtest_id, frame):
+        index = frame.index
+        timestamps = index.astype(str) if not isinstance(index, pd.RangeIndex) else [None] * len(frame)
+        returns = frame['daily_returns'].astype(float).values
+        positions = frame['positions'].astype(float).values if 'positions' in frame else np.full(len(frame), np.nan)
+        self.conn.executemany('INSERT INTO returns VALUES (?, ?, ?, ?, ?)',
+                              ((backtest_id, bar, ts, _number(r), _number(p))
+                               for bar, (ts, r, p) in enumerate(zip(timestamps, returns, positions))))
+
+    def query(self, sql, params=()):
+        """Runs a read query and returns a DataFrame."""
+        return pd.read_sql_query(sql, self.conn, params=params)
+
+    def top_pairs(self, metric='sharpe', n=50, sample=None, model=None, period=None, best_per_pair=True):
+        """
+        Best backtests by a metric across all runs, e.g.
+        top_pairs('sharpe', 50, sample='out') for the top 50 pairs by out-of-sample Sharpe.
+
+        Args:
+            best_per_pair: Keep only each pair's best backtest.
+
+        Returns:
+            pd.DataFrame
+        """
+        if metric not in METRIC_COLUMNS:
+            raise ValueError(f"Unknown metric '{metric}', expected one of {METRIC_COLUMNS}")
+        filters, params = [f'{metric} IS NOT NULL'], []
+        for column, value in (('sample', sample), ('model', model), ('period', period)):
+            if value is not None:
+                filters.append(f'{column} = ?')
+                params.append(value)
+        where = ' AND '.join(filters)
+        if best_per_pair:
+            sql = (f"SELECT * FROM (SELECT *, ROW_NUMBER() OVER (PARTITION BY pair ORDER BY {metric} DESC) AS pair_rank "
+                   f"FROM backtests WHERE {where}) WHERE pair_rank = 1 ORDER BY {metric} DESC LIMIT ?")
+        else:
+            sql = f"SELECT * FROM backtests WHERE {where} ORDER BY {metric} DESC LIMIT ?"
+        return self.query(sql, params + [n])
+
+    def load_returns(self, backtest_ids):
+        """
+        Stored return series as a (bar x backtest) frame of daily returns,
+        ready for performance.compute_performance.
+        """
+        backtest_ids = [backtest_ids] if np.isscalar(backtest_ids) else list(backtest_ids)
+        placeholders = ', '.join('?' * len(backtest_ids))
+        long = self.query(f'SELECT backtest_id, bar, daily_return FROM returns '
+                          f'WHERE backtest_id IN ({placeholders})', backtest_ids)
+        return long.pivot(index='bar', columns='backtest_id', values='daily_return').reindex(columns=backtest_ids)
@@ -2,8 +2,12 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from pair_discovery import discover_pairs, print_discovery_results
+from pair_discovery import discover_pairs, print_discovery_results, point_in_time_tickers
 from main import run_experiment
+from basket_discovery import discover_baskets, print_basket_results
+from results_store import ResultsStore
+from report import ReportBuilder
+from universe import UniverseMembership
 
 # Curated universe - 50 highly liquid blue-chip stocks
 ASSET_UNIVERSE = {
@@ -14,8 +18,31 @@ ASSET_UNIVERSE = {
     'Energy': ['XOM', 'CVX', 'COP', 'SLB', 'OXY', 'EOG', 'PXD', 'MPC', 'VLO', 'PSX']
 }
 
-def run_period_comparison():
-    """Run discovery across multiple training periods for comparison."""
+# Listing changes within ASSET_UNIVERSE as (first trading day, first day no longer traded)
+UNIVERSE_LISTINGS = {
+    'META': ('2012-05-18', None),  # IPO (as FB)
+    'MPC': ('2011-07-01', None),   # spun off from Marathon Oil
+    'PSX': ('2012-05-01', None),   # spun off from ConocoPhillips
+    'ABBV': ('2013-01-02', None),  # spun off from Abbott
+    'PXD': (None, '2024-05-03'),   # acquired by Exxon Mobil
+}
+
+UNIVERSE_MEMBERSHIP = UniverseMembership.from_universe(ASSET_UNIVERSE, UNIVERSE_LISTINGS)
+
+def run_period_comparison(prune_method=None, store=None, report=None, membership=UNIVERSE_MEMBERSHIP):
+    """
+    Run discovery across multiple training periods for comparison.
+    
+    Args:
+        prune_method: Optional clustering pre-stage for discover_pairs
+                      ('sector', 'correlation' or 'pca'). 'sector' uses ASSET_UNIVERSE.
+        store: Optional ResultsStore; the discoveries and out-of-sample
+               backtests of every period are recorded there.
+        report: Optional ReportBuilder collecting the backtests instead of
+                one PNG per pair; render it once the study is done.
+        membership: Point-in-time UniverseMembership; each period only screens
+                    the tickers tradable throughout it (None screens them all).
+    """
     
     # Flatten asset universe
     all_tickers = []
@@ -39,6 +66,8 @@ def run_period_comparison():
     test_end = '2023-01-01'
     
     results_summary = []
+    run_id = store.start_run('period_comparison', prune_method=prune_method,
+                             test_start=test_start, test_end=test_end) if store else None
     
     for period in periods:
         print(f"\n{'='*80}")
@@ -51,10 +80,16 @@ def run_period_comparison():
             start_date=period['start'],
             end_date=period['end'],
             p_value_threshold=0.05,
-            correlation_threshold=0.7
+            correlation_threshold=0.7,
+            prune_method=prune_method,
+            sectors=ASSET_UNIVERSE,
+            membership=membership
         )
         
         print_discovery_results(candidates, top_n=10)
+        if store is not None:
+            store.record_discoveries(run_id, candidates, period=period['name'],
+                                     start_date=period['start'], end_date=period['end'])
         
         # Backtest top 3 pairs
         print(f"\n{'-'*80}")
@@ -63,7 +98,13 @@ def run_period_comparison():
         
         backtest_results = []
         
-        for i, candidate in enumerate(candidates[:3], 1):
+        # Only pairs still listed through the test period can be backtested out of sample
+        testable = candidates
+        if membership is not None:
+            tradable = set(membership.members_during(test_start, test_end))
+            testable = [c for c in candidates if c.ticker1 in tradable and c.ticker2 in tradable]
+        
+        for i, candidate in enumerate(testable[:3], 1):
             print(f"\n--- Pair {i}: {candidate.ticker1} / {candidate.ticker2} ---")
             
             # We'll capture the return by running the experiment
@@ -73,7 +114,12 @@ def run_period_comparison():
                 start_date=test_start,
                 end_date=test_end,
                 name=f"{period['name']}_Discovered_{candidate.ticker1}_{candidate.ticker2}",
-                use_kalman=False
+                use_kalman=False,
+                store=store,
+                run_id=run_id,
+                period=period['name'],
+                sample='out',
+                report=report
             )
         
         # Store summary
@@ -111,5 +157,34 @@ def run_period_comparison():
     
     print(f"\nDetailed results saved to {output_file}")
 
+def run_basket_discovery(start_date='2020-01-01', end_date='2022-01-01', basket_sizes=(3, 4)):
+    """
+    Johansen basket discovery within each ASSET_UNIVERSE sector.
+    
+    Returns:
+        list of BasketCandidate, strongest first
+    """
+    all_tickers = [ticker for tickers in ASSET_UNIVERSE.values() for ticker in tickers]
+    all_tickers = point_in_time_tickers(all_tickers, UNIVERSE_MEMBERSHIP, start_date, end_date)
+    
+    print(f"\n{'='*80}")
+    print(f"BASKET DISCOVERY ({start_date} to {end_date})")
+    print(f"Asset Universe: {len(all_tickers)} stocks, baskets of {list(basket_sizes)} legs within a sector")
+    print(f"{'='*80}")
+    
+    candidates = discover_baskets(
+        all_tickers,
+        start_date,
+        end_date,
+        basket_sizes=basket_sizes,
+        prune_method='sector',
+        sectors=ASSET_UNIVERSE
+    )
+    print_basket_results(candidates, top_n=10)
+    return candidates
+
 if __name__ == "__main__":
-    run_period_comparison()
+    report = ReportBuilder('Training Period Comparison')
+    with ResultsStore() as store:
+        run_period_comparison(store=store, report=report)
+    report.render(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'period_comparison_report.html'))
@@ -0,0 +1,362 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import argparse
+import glob
+import json
+import multiprocessing
+import shutil
+import socket
+import time
+from dataclasses import asdict
+from itertools import combinations
+from typing import List, Optional
+
+import pandas as pd
+
+from data_loader import fetch_data
+from pair_discovery import PairCandidate, _test_pair, print_discovery_results
+import events
+
+# Queue layout under one directory, shared by every host (e.g. an NFS mount):
+#   job.json, prices.pkl        the screen to run and the prices, written once by the coordinator
+#   pending/<shard>.json        shards waiting for a worker
+#   running/<shard>@<worker>    claimed shards; the worker touches the file as a lease heartbeat
+#   results/<shard>.json        finished shards
+#   failed/<shard>.json         shards that ran out of attempts
+#   DONE                        tells the workers to exit
+QUEUE_DIRS = ('pending', 'running', 'results', 'failed')
+
+def _write_json(path, payload):
+    """Writes a file atomically: readers see the old file or the whole new one, never a partial write."""
+    tmp = f"{path}.{socket.gethostname()}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(payload, f)
+    os.replace(tmp, path)
+
+def _read_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+def _shard_id(path):
+    return os.path.basename(path).split('@')[0].split('.')[0]
+
+def worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+class ShardQueue:
+    """
+    File-queue protocol between one coordinator and any number of workers.
+
+    Every state change is an atomic rename, so workers on several hosts can
+    share the queue directory without locks: claiming a shard renames it from
+    pending/ to running/ and only one rename can win. A claimed shard whose
+    lease file has not been touched for `lease_timeout` seconds belongs to a
+    dead worker and is put back in pending/ by the coordinator, up to
+    `max_attempts` times.
+
+    Args:
+        root (str): Queue directory.
+    """
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, *parts):
+        return os.path.join(self.root, *parts)
+
+    # Coordinator side
+
+    def create(self, data, pairs, block_size=500, max_attempts=3, lease_timeout=60.0, **screen):
+        """
+        Writes the prices and the pair space, cut into shards of block_size pairs.
+
+        Args:
+            data (pd.DataFrame): Aligned prices of every ticker in `pairs`.
+            pairs (list): (ticker1, ticker2) tuples to screen.
+            block_size (int): Pairs per shard.
+            max_attempts (int): Tries per shard before it is marked failed.
+            lease_timeout (float): Seconds without a heartbeat before a claimed
+                                   shard is considered abandoned.
+            **screen: p_value_threshold and correlation_threshold for _test_pair.
+
+        Returns:
+            int: Number of shards.
+        
+        Raises:
+            ValueError: If root is a non-empty directory that is not a queue.
+        """
+        if os.path.isdir(self.root) and os.listdir(self.root):
+            if not os.path.exists(self.path('job.json')):
+                raise ValueError(f"{self.root} is not empty and not a shard queue; refusing to reuse it")
+            # Reset a previous queue, touching nothing but the queue's own files
+            for name in QUEUE_DIRS:
+                shutil.rmtree(self.path(name), ignore_errors=True)
+            for name in ('prices.pkl', 'job.json', 'DONE'):
+                if os.path.exists(self.path(name)):
+                    os.remove(self.path(name))
+        for name in QUEUE_DIRS:
+            os.makedirs(self.path(name))
+        data.to_pickle(self.path('prices.pkl'))
+        n_shards = 0
+        for n_shards, start in enumerate(range(0, len(pairs), block_size), 1):
+            _write_json(self.path('pending', f'{n_shards - 1:06d}.json'),
+                        {'pairs': [list(pair) for pair in pairs[start:start + block_size]],
+                         'attempts': 0, 'errors': []})
+        _write_json(self.path('job.json'), {'n_shards': n_shards, 'max_attempts': max_attempts,
+                                            'lease_timeout': lease_timeout, 'screen': screen})
+        return n_shards
+
+    def requeue_stale(self):
+        """Moves abandoned shards back to pending/ (or to failed/). Returns how many were retried."""
+        job = _read_json(self.path('job.json'))
+        now = time.time()
+        retried = 0
+        for path in glob.glob(self.path('running', '*')):
+            try:
+                stale = now - os.path.getmtime(path) > job['lease_timeout']
+                if not stale:
+                    continue
+                shard = _read_json(path)
+            except (FileNotFoundError, json.JSONDecodeError):
+                continue  # finished or renamed meanwhile
+            shard_id = _shard_id(path)
+            if os.path.exists(self.path('results', f'{shard_id}.json')):
+                os.remove(path)
+                continue
+            shard['attempts'] += 1
+            shard['errors'].append(f"lease of {os.path.basename(path).split('@')[1]} expired")
+            self._release(path, shard_id, shard, job['max_attempts'])
+            retried += 1
+        return retried
+
+    def _release(self, running_path, shard_id, shard, max_attempts):
+        target = 'failed' if shard['attempts'] >= max_attempts else 'pending'
+        # A slow worker may have finished the shard after all
+        done = os.path.exists(self.path('results', f'{shard_id}.json'))
+        if not done:
+            _write_json(self.path(target, f'{shard_id}.json'), shard)
+        try:
+            os.remove(running_path)
+        except FileNotFoundError:
+            pass
+        if target == 'failed' and not done:
+            events.warning('shard_failed', f"Shard {shard_id} failed after {shard['attempts']} attempts: "
+                           f"{shard['errors'][-1]}", shard=shard_id, errors=shard['errors'])
+
+    def status(self):
+        return {name: len(glob.glob(self.path(name, '*.json' if name != 'running' else '*')))
+                for name in QUEUE_DIRS}
+
+    def finished_shards(self):
+        """Ids of the shards with a result or given up on, each counted once."""
+        return {_shard_id(path) for name in ('results', 'failed') for path in glob.glob(self.path(name, '*.json'))}
+
+    def finish(self):
+        open(self.path('DONE'), 'w').close()
+
+    def merge(self):
+        """All candidates of the finished shards, sorted by p-value, and the summed worker counters."""
+        candidates, counters, workers = [], {}, set()
+        for path in sorted(glob.glob(self.path('results', '*.json'))):
+            result = _read_json(path)
+            candidates.extend(PairCandidate(**c) for c in result['candidates'])
+            for counter, value in result['counters'].items():
+                counters[counter] = counters.get(counter, 0) + value
+            workers.add(result['worker'])
+        candidates.sort(key=lambda c: c.p_value)
+        return candidates, counters, workers
+
+    # Worker side
+
+    def claim(self, worker):
+        """Renames one pending shard into running/; returns (running path, shard) or None."""
+        for path in sorted(glob.glob(self.path('pending', '*.json'))):
+            running = self.path('running', f'{_shard_id(path)}@{worker}')
+            try:
+                os.rename(path, running)
+            except FileNotFoundError:
+                continue  # another worker won this one
+            return running, _read_json(running)
+        return None
+
+    def complete(self, running, candidates, counters, worker):
+        _write_json(self.path('results', f'{_shard_id(running)}.json'),
+                    {'candidates': [asdict(c) for c in candidates], 'counters': counters, 'worker': worker})
+        try:
+            os.remove(running)
+        except FileNotFoundError:
+            pass  # the lease expired and the shard was requeued; the duplicate result is identical
+        try:
+            os.remove(self.path('failed', f'{_shard_id(running)}.json'))
+        except FileNotFoundError:
+            pass  # normally the shard was never given up on
+
+def run_worker(root, worker=None, poll=0.5, heartbeat=5.0, idle_timeout=None):
+    """
+    Screens shards from a queue until the coordinator marks it DONE.
+
+    Run one per core on every host that can see the queue directory:
+        python3 pairs_trading/sharded_discovery.py worker /shared/queue
+
+    Args:
+        root (str): Queue directory.
+        worker (str): Worker name (defaults to host-pid).
+        poll (float): Seconds between looks at an empty queue.
+        heartbeat (float): Seconds between lease renewals while screening.
+        idle_timeout (float): Optional seconds to wait for work before exiting.
+
+    Returns:
+        int: Shards completed by this worker.
+    """
+    queue = ShardQueue(root)
+    worker = worker or worker_id()
+    while not os.path.exists(queue.path('job.json')):
+        if os.path.exists(queue.path('DONE')):
+            return 0
+        time.sleep(poll)
+    job = _read_json(queue.path('job.json'))
+    data = pd.read_pickle(queue.path('prices.pkl'))
+    done = 0
+    idle_since = time.time()
+    while not os.path.exists(queue.path('DONE')):
+        claimed = queue.claim(worker)
+        if claimed is None:
+            if idle_timeout is not None and time.time() - idle_since > idle_timeout:
+                break
+            time.sleep(poll)
+            continue
+        running, shard = claimed
+        last_beat = time.time()
+        try:
+            candidates = []
+            for ticker1, ticker2 in shard['pairs']:
+                candidate = _test_pair(data, ticker1, ticker2, **job['screen'])
+                if candidate is not None:
+                    candidates.append(candidate)
+                if time.time() - last_beat > heartbeat:
+                    os.utime(running)
+                    last_beat = time.time()
+        except Exception as e:
+            shard['attempts'] += 1
+            shard['errors'].append(f"{worker}: {type(e).__name__}: {e}")
+            queue._release(running, _shard_id(running), shard, job['max_attempts'])
+            continue
+        counters = {'pairs_tested': len(shard['pairs']), 'pairs_found': len(candidates)}
+        queue.complete(running, candidates, counters, worker)
+        done += 1
+        idle_since = time.time()
+    return done
+
+def discover_pairs_sharded(tickers: List[str],
+                           start_date: str,
+                           end_date: str,
+                           queue_dir: str,
+                           local_workers: int = 2,
+                           block_size: int = 500,
+                           p_value_threshold: float = 0.05,
+                           correlation_threshold: float = 0.7,
+                           max_attempts: int = 3,
+                           lease_timeout: float = 60.0,
+                           poll: float = 0.5,
+                           data: Optional[pd.DataFrame] = None) -> List[PairCandidate]:
+    """
+    discover_pairs with the pair space sharded across worker processes on any number of hosts.
+
+    The coordinator fetches the prices once, writes them and the shards to
+    `queue_dir`, starts `local_workers` worker processes on this machine and
+    then waits: workers on other hosts join by running the worker command
+    against the same (shared) directory. Abandoned shards are retried on
+    another worker; candidates of every finished shard are merged.
+
+    Args:
+        tickers, start_date, end_date, p_value_threshold, correlation_threshold: As in discover_pairs
+        queue_dir: Queue directory, on a filesystem every worker host can see
+        local_workers: Worker processes started on this machine (0 = remote only)
+        block_size: Pairs per shard
+        max_attempts: Tries per shard before giving up on it
+        lease_timeout: Seconds without a heartbeat before a shard is retried
+        poll: Seconds between coordinator checks
+        data: Optional prices to screen instead of downloading them
+
+    Returns:
+        List of PairCandidate objects, sorted by p-value (best first)
+    """
+    if data is None:
+        data = fetch_data(tickers, start_date, end_date)
+    valid_tickers = [ticker for ticker in tickers if ticker in data.columns]
+    pairs = list(combinations(valid_tickers, 2))
+
+    queue = ShardQueue(queue_dir)
+    n_shards = queue.create(data[valid_tickers], pairs, block_size=block_size, max_attempts=max_attempts,
+                            lease_timeout=lease_timeout, p_value_threshold=p_value_threshold,
+                            correlation_threshold=correlation_threshold)
+    events.info('sharded_discovery_started',
+                f"\n=== Sharded Pair Discovery ===\n{len(pairs)} pairs of {len(valid_tickers)} tickers in "
+                f"{n_shards} shards at {queue_dir} ({local_workers} local workers)",
+                pairs=len(pairs), shards=n_shards, queue=queue_dir, local_workers=local_workers)
+
+    context = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn')
+    processes = [context.Process(target=run_worker, args=(queue_dir, f'{worker_id()}-local{i}', poll), daemon=True)
+                 for i in range(local_workers)]
+    for process in processes:
+        process.start()
+
+    retried = 0
+    try:
+        while True:
+            retried += queue.requeue_stale()
+            finished = len(queue.finished_shards())
+            events.progress('shards done', finished, n_shards)
+            if finished >= n_shards:
+                break
+            time.sleep(poll)
+    finally:
+        queue.finish()
+        for process in processes:
+            process.join(timeout=max(10.0, 4 * poll))
+
+    status = queue.status()
+    candidates, counters, workers = queue.merge()
+    events.get_stream().merge({'counters': counters})
+    events.incr('shards_retried', retried)
+    events.info('sharded_discovery_finished',
+                f"\n=== Discovery Complete ===\nFound {len(candidates)} cointegrated pairs out of "
+                f"{counters.get('pairs_tested', 0)} tested on {len(workers)} workers "
+                f"({retried} shards retried, {status['failed']} failed)",
+                pairs_found=len(candidates), pairs_tested=counters.get('pairs_tested', 0),
+                workers=sorted(workers), retried=retried, failed=status['failed'])
+    return candidates
+
+def main():
+    parser = argparse.ArgumentParser(description="Sharded pair discovery over a shared queue directory.")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    worker = sub.add_parser('worker', help="Screen shards from a queue until it is done")
+    worker.add_argument('queue')
+    worker.add_argument('--poll', type=float, default=0.5)
+
+    run = sub.add_parser('run', help="Coordinate a sharded discovery")
+    run.add_argument('queue')
+    run.add_argument('--tickers', nargs='+', default=None, help="Defaults to ASSET_UNIVERSE")
+    run.add_argument('--start', default='2020-01-01')
+    run.add_argument('--end', default='2022-01-01')
+    run.add_argument('--local-workers', type=int, default=os.cpu_count() or 1)
+    run.add_argument('--block-size', type=int, default=500)
+    run.add_argument('--lease-timeout', type=float, default=60.0)
+
+    args = parser.parse_args()
+    if args.command == 'worker':
+        run_worker(args.queue, poll=args.poll)
+        return
+    tickers = args.tickers
+    if tickers is None:
+        from run_discovery import ASSET_UNIVERSE
+        tickers = [t for sector in ASSET_UNIVERSE.values() for t in sector]
+    candidates = discover_pairs_sharded(tickers, args.start, args.end, args.queue,
+                                        local_workers=args.local_workers, block_size=args.block_size,
+                                        lease_timeout=args.lease_timeout)
+    print_discovery_results(candidates)
+
+if __name__ == "__main__":
+    main()
@@ -23,31 +23,70 @@ def generate_signals(zscore, entry_threshold=2.0, exit_threshold=0.0):
     signals['long_exit'] = zscore >= -exit_threshold
     signals['short_exit'] = zscore <= exit_threshold
     
-    # Initialize positions
-    signals['positions'] = 0
+    # Determine positions (state-dependent)
+    positions_list, _ = compute_positions(zscore.values, entry_threshold, exit_threshold)
     
-    # Iterate to determine positions (state-dependent)
-    position = 0 # 0: flat, 1: long spread, -1: short spread
+    signals['positions'] = positions_list
     
-    positions_list = []
+    return signals
+
+def compute_positions(zscore, entry_threshold=2.0, exit_threshold=0.0, initial_position=0, dtype=np.int64):
+    """
+    Runs the same position state machine as generate_signals on a plain array.
     
-    for i in range(len(signals)):
-        row = signals.iloc[i]
+    Args:
+        zscore (array-like): Z-scores of the spread, with time along the first axis.
+                             A 2-D array runs one independent state machine per
+                             column (e.g. one per bootstrap replication).
+                             NaNs never trigger a change.
+        entry_threshold (float): Z-score threshold to enter a trade.
+        exit_threshold (float): Z-score threshold to exit a trade.
+        initial_position (int or array): Position held before the first bar, so that
+                                         consecutive chunks can be processed one by one.
+        dtype: Integer dtype of the positions array (e.g. np.int8 in compact mode).
         
+    Returns:
+        tuple: (np.ndarray of positions, final position)
+    """
+    zscore = np.asarray(zscore, dtype=float)
+    if zscore.ndim == 2:
+        return _compute_positions_2d(zscore, entry_threshold, exit_threshold, initial_position, dtype)
+    
+    position = initial_position
+    positions = np.empty(len(zscore), dtype=dtype)
+    
+    for i, z in enumerate(zscore.tolist()):
         if position == 0:
-            if row['long_entry']:
+            if z < -entry_threshold:
                 position = 1
-            elif row['short_entry']:
+            elif z > entry_threshold:
                 position = -1
         elif position == 1:
-            if row['long_exit']:
+            if z >= -exit_threshold:
                 position = 0
         elif position == -1:
-            if row['short_exit']:
+            if z <= exit_threshold:
                 position = 0
-                
-        positions_list.append(position)
-        
-    signals['positions'] = positions_list
+        positions[i] = position
     
-    return signals
+    return positions, position
+
+def _compute_positions_2d(zscore, entry_threshold, exit_threshold, initial_position, dtype=np.int64):
+    """Vectorized across columns; loops only over time."""
+    position = np.broadcast_to(np.asarray(initial_position, dtype=dtype), zscore.shape[1:]).copy()
+    positions = np.empty(zscore.shape, dtype=dtype)
+    
+    long_entry = zscore < -entry_threshold
+    short_entry = zscore > entry_threshold
+    long_exit = zscore >= -exit_threshold
+    short_exit = zscore <= exit_threshold
+    
+    for t in range(zscore.shape[0]):
+        flat = position == 0
+        position[flat & long_entry[t]] = 1
+        position[flat & ~long_entry[t] & short_entry[t]] = -1
+        position[~flat & (position == 1) & long_exit[t]] = 0
+        position[~flat & (position == -1) & short_exit[t]] = 0
+        positions[t] = position
+    
+    return positions, position
@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+
+def generate_cointegrated_prices(n_tickers=2, n_bars=756, freq='B', n_factors=None,
+                                 noise=0.5, start='2020-01-01', seed=0):
+    """
+    Generates a universe of synthetic prices with cointegrated groups.
+
+    Tickers are split into groups that share one geometric random-walk factor;
+    each ticker is a scaled copy of its group factor plus a mean-reverting
+    AR(1) deviation, so pairs within a group are cointegrated and pairs across
+    groups are not.
+
+    Args:
+        n_tickers (int): Number of tickers (columns), named S0000, S0001, ...
+        n_bars (int): Number of bars (rows).
+        freq (str): Bar frequency for the index, e.g. 'B' for daily or 'min' for minute bars.
+        n_factors (int): Number of independent groups (defaults to about n_tickers / 5).
+        noise (float): Volatility of the AR(1) deviation, in price units.
+        start (str): First timestamp.
+        seed (int): Random seed.
+
+    Returns:
+        pd.DataFrame: Prices, one column per ticker.
+    """
+    rng = np.random.default_rng(seed)
+    n_factors = n_factors or max(1, n_tickers // 5)
+
+    factor_returns = rng.normal(0.0002, 0.01, size=(n_bars, n_factors))
+    factors = 100 * np.exp(np.cumsum(factor_returns, axis=0))
+
+    group = np.arange(n_tickers) % n_factors
+    scale = rng.uniform(0.5, 2.0, size=n_tickers)
+    offset = rng.uniform(0, 20, size=n_tickers)
+
+    shocks = rng.normal(0, noise, size=(n_bars, n_tickers))
+    deviation = np.empty((n_bars, n_tickers))
+    deviation[0] = shocks[0]
+    for t in range(1, n_bars):
+        deviation[t] = 0.9 * deviation[t - 1] + shocks[t]
+
+    prices = offset + scale * factors[:, group] + deviation
+    index = pd.date_range(start, periods=n_bars, freq=freq)
+    columns = [f"S{i:04d}" for i in range(n_tickers)]
+    return pd.DataFrame(prices, index=index, columns=columns)
@@ -3,12 +3,60 @@ import pandas as pd
 import numpy as np
 import sys
 import os
+import tempfile
+import time
 
 # Add the current directory to path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from analysis import calculate_zscore
+from analysis import calculate_zscore, RollingStats
 from strategy import generate_signals
+from pair_discovery import _test_pair, screen_pairs_streaming
+from pair_pruning import cluster_tickers, candidate_pairs, pruning_recall
+from backtest import calculate_returns
+from bar_store import BarStore
+from chunked_pipeline import run_chunked_backtest, iter_frame_chunks, fit_hedge_ratio_streaming
+from main import run_pipeline, run_parameter_sweep
+from bootstrap import backtest_paths, run_bootstrap_study
+from benchmark import compare_to_baseline
+from synthetic_data import generate_cointegrated_prices
+from ensemble import run_ensemble
+from kalman import KalmanFilterMulti, run_kalman_basket, run_kalman_strategy, fixed_lag_smooth
+from kalman import KalmanFilterReg, kalman_log_likelihood, calibrate_kalman, calibrate_pairs
+from basket_discovery import JohansenMoments, screen_baskets, run_basket_pipeline
+from execution import Book, simulate_execution, target_units
+from experiment_grid import ExperimentGrid, run_grid
+from performance import compute_performance, trade_table
+from results_store import ResultsStore
+from compact import run_pipeline_compact, _hedge_ratios
+from pair_monitor import PairHealthMonitor
+from report import ReportBuilder, lttb
+from main import run_experiment, run_experiment_chunked
+from daemon import ResearchDaemon
+from alignment import CalendarIndex, asof_join
+from universe import Listing, UniverseMembership
+from sharded_discovery import ShardQueue, run_worker, discover_pairs_sharded
+from position_events import PositionEvents, trade_pnl
+from pair_discovery import discover_pairs
+import client
+import threading
+from advanced_metrics import calculate_half_life, calculate_hurst_exponent, calculate_correlation_stability
+from analysis import calculate_hedge_ratio
+from concurrent.futures import ProcessPoolExecutor
+import profiling
+import events
+import data_loader
+from unittest import mock
+
+def make_cointegrated_prices(n_assets=6, n_bars=500, seed=0):
+    """Builds a price frame where every asset shares one random-walk factor."""
+    rng = np.random.default_rng(seed)
+    factor = 100 + np.cumsum(rng.normal(0, 1, n_bars))
+    columns = {}
+    for i in range(n_assets):
+        noise = rng.normal(0, 1.0 + i, n_bars)
+        columns[f"T{i}"] = 10 + (1 + 0.1 * i) * factor + noise
+    return pd.DataFrame(columns, index=pd.bdate_range('2020-01-01', periods=n_bars))
 
 class TestPairsTrading(unittest.TestCase):
     
@@ -52,5 +100,1041 @@ class TestPairsTrading(unittest.TestCase):
         expected_positions = [0, -1, -1, 0, 1, 1, 0]
         self.assertEqual(positions, expected_positions)
 
+class TestStreamingDiscovery(unittest.TestCase):
+    
+    def test_top_k_matches_exhaustive_search(self):
+        data = make_cointegrated_prices()
+        exhaustive = []
+        for i, ticker1 in enumerate(data.columns):
+            for ticker2 in data.columns[i + 1:]:
+                candidate = _test_pair(data, ticker1, ticker2, 0.05, 0.7)
+                if candidate is not None:
+                    exhaustive.append(candidate)
+        exhaustive.sort(key=lambda x: x.p_value)
+        
+        top = screen_pairs_streaming(data, top_k=3, block_size=4, progress_interval=0.0)
+        
+        self.assertEqual([(c.ticker1, c.ticker2) for c in top],
+                         [(c.ticker1, c.ticker2) for c in exhaustive[:3]])
+        with self.assertRaises(ValueError):
+            screen_pairs_streaming(data, top_k=0)
+
+class TestPairPruning(unittest.TestCase):
+    
+    def setUp(self):
+        # Two independent groups of three co-moving assets
+        group_a = make_cointegrated_prices(n_assets=3, seed=1)
+        group_b = make_cointegrated_prices(n_assets=3, seed=2)
+        group_b.columns = ['U0', 'U1', 'U2']
+        self.data = pd.concat([group_a, group_b], axis=1)
+    
+    def test_sector_clusters_keep_within_sector_pairs(self):
+        sectors = {'A': ['T0', 'T1', 'T2'], 'B': ['U0', 'U1', 'U2']}
+        clusters = cluster_tickers(self.data, method='sector', sectors=sectors)
+        pairs = candidate_pairs(self.data, clusters, n_neighbors=0)
+        
+        self.assertEqual(len(pairs), 6)
+        self.assertIn(('T0', 'T1'), pairs)
+        self.assertNotIn(('T0', 'U0'), pairs)
+    
+    def test_correlation_clusters_recover_groups(self):
+        clusters = cluster_tickers(self.data, method='correlation', n_clusters=2)
+        
+        self.assertEqual(clusters['T0'], clusters['T2'])
+        self.assertNotEqual(clusters['T0'], clusters['U0'])
+    
+    def test_pca_clusters_recover_groups(self):
+        clusters = cluster_tickers(self.data, method='pca', n_clusters=2, n_components=2)
+        
+        self.assertEqual(clusters['T0'], clusters['T2'])
+        self.assertEqual(clusters['U0'], clusters['U1'])
+        self.assertNotEqual(clusters['T0'], clusters['U0'])
+        self.assertEqual(clusters, cluster_tickers(self.data, method='pca', n_clusters=2, n_components=2))
+    
+    def test_recall_report(self):
+        pruned = [_test_pair(self.data, 'T0', 'T1', 0.05, 0.7)]
+        exhaustive = pruned + [_test_pair(self.data, 'U0', 'U1', 0.05, 0.7)]
+        recall = pruning_recall(pruned, exhaustive)
+        
+        self.assertAlmostEqual(recall['recall'], 0.5)
+        self.assertEqual(recall['missed'], ['U0/U1'])
+
+class TestIntradayBars(unittest.TestCase):
+    
+    def setUp(self):
+        prices = make_cointegrated_prices(n_assets=2, n_bars=3 * 390, seed=3)
+        sessions = [pd.date_range(f'2024-01-0{day} 14:30', periods=390, freq='min') for day in (2, 3, 4)]
+        prices.index = sessions[0].append(sessions[1]).append(sessions[2])
+        self.prices = prices
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store = BarStore(self.tmpdir.name, partition='day')
+        self.store.write('T0', prices['T0'])
+        # T1 misses every 7th bar
+        self.store.write('T1', prices['T1'].iloc[np.arange(len(prices)) % 7 != 3])
+    
+    def tearDown(self):
+        self.tmpdir.cleanup()
+    
+    def test_asof_alignment_keeps_gapped_rows(self):
+        chunks = list(self.store.iter_aligned_chunks(['T0', 'T1']))
+        aligned = pd.concat(chunks)
+        
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(len(aligned), len(self.prices))
+        expected = self.prices['T1'].where(np.arange(len(self.prices)) % 7 != 3).ffill()
+        np.testing.assert_allclose(aligned['T1'].values, expected.values)
+    
+    def test_windowed_read_skips_partitions_outside_the_window(self):
+        full = pd.concat(self.store.iter_aligned_chunks(['T0', 'T1']))
+        start, end = '2024-01-04 14:30', '2024-01-04 16:00'  # T1 has no bar at 14:30 on the 4th
+        with mock.patch.object(self.store, 'load_partition', wraps=self.store.load_partition) as load:
+            window = pd.concat(self.store.iter_aligned_chunks(['T0', 'T1'], start=start, end=end))
+        
+        pd.testing.assert_frame_equal(window, full[(full.index >= start) & (full.index < end)], check_freq=False)
+        # The window's own partitions plus the last bar before it, never the first day
+        self.assertNotIn('2024-01-02', {call.args[1] for call in load.call_args_list})
+    
+    def test_chunked_backtest_matches_in_memory(self):
+        aligned = pd.concat(self.store.iter_aligned_chunks(['T0', 'T1']))
+        hedge_ratio = 0.9
+        zscore = calculate_zscore(aligned['T0'] - hedge_ratio * aligned['T1'], 60)
+        expected = calculate_returns(aligned, generate_signals(zscore))
+        
+        results = []
+        summary = run_chunked_backtest(self.store.iter_aligned_chunks(['T0', 'T1']),
+                                       hedge_ratio=hedge_ratio, window=60, on_chunk=results.append)
+        results = pd.concat(results)
+        
+        self.assertEqual(summary['bars'], len(aligned))
+        np.testing.assert_allclose(results['cumulative_returns'].values,
+                                   expected['cumulative_returns'].values, equal_nan=True)
+        self.assertAlmostEqual(summary['final_return'], expected['cumulative_returns'].iloc[-1])
+
+class TestChunkedPipeline(unittest.TestCase):
+    
+    def setUp(self):
+        # Columns deliberately not in ticker order, as yfinance returns them
+        self.data = make_cointegrated_prices(n_assets=2, n_bars=700, seed=4)[['T1', 'T0']]
+        self.tickers = ['T0', 'T1']
+    
+    def _run_chunked(self, use_kalman, chunk_size=97):
+        hedge_ratio = None
+        if not use_kalman:
+            hedge_ratio = fit_hedge_ratio_streaming(iter_frame_chunks(self.data, chunk_size), self.tickers)
+        results = []
+        run_chunked_backtest(iter_frame_chunks(self.data, chunk_size), hedge_ratio=hedge_ratio,
+                             use_kalman=use_kalman, on_chunk=results.append, tickers=self.tickers)
+        return pd.concat(results)
+    
+    def test_static_matches_in_memory(self):
+        expected = run_pipeline(self.data, self.tickers)
+        chunked = self._run_chunked(use_kalman=False)
+        
+        self.assertAlmostEqual(chunked['hedge_ratio'].iloc[0], expected['hedge_ratio'])
+        np.testing.assert_array_equal(chunked['positions'].values, expected['positions'].values)
+        np.testing.assert_allclose(chunked['cumulative_returns'].values,
+                                   expected['metrics']['cumulative_returns'].values, equal_nan=True)
+    
+    def test_chunks_shorter_than_window(self):
+        expected = run_pipeline(self.data, self.tickers)
+        chunked = self._run_chunked(use_kalman=False, chunk_size=7)
+        np.testing.assert_array_equal(chunked['positions'].values, expected['positions'].values)
+        np.testing.assert_allclose(chunked['zscore'].values, expected['zscore'].values, equal_nan=True)
+    
+    def test_kalman_matches_in_memory(self):
+        expected = run_pipeline(self.data, self.tickers, use_kalman=True)
+        chunked = self._run_chunked(use_kalman=True)
+        
+        np.testing.assert_array_equal(chunked['hedge_ratio'].values, expected['hedge_ratio'].values)
+        np.testing.assert_array_equal(chunked['positions'].values, expected['positions'].values)
+        np.testing.assert_allclose(chunked['cumulative_returns'].values,
+                                   expected['metrics']['cumulative_returns'].values, equal_nan=True)
+    
+    def test_experiment_downloads_window_by_window(self):
+        data = self.data[self.tickers]
+        
+        def download(tickers, start, end, **kwargs):
+            rows = data[(data.index >= start) & (data.index < end)]
+            return pd.concat({'Close': rows}, axis=1)
+        
+        output_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results_chunked_window_test.csv')
+        self.addCleanup(lambda: os.path.exists(output_path) and os.remove(output_path))
+        with mock.patch.object(data_loader.yf, 'download', side_effect=download) as downloads:
+            summary = run_experiment_chunked(self.tickers, '2020-01-01', '2023-01-01', 'chunked_window_test',
+                                             download_window='180D')
+        self.assertEqual(summary['output_path'], output_path)
+        expected = run_pipeline(data, self.tickers)
+        self.assertGreater(downloads.call_count, 4)
+        self.assertEqual(summary['bars'], len(data))
+        self.assertAlmostEqual(summary['hedge_ratio'], expected['hedge_ratio'])
+        self.assertAlmostEqual(summary['final_return'], expected['metrics']['cumulative_returns'].iloc[-1])
+
+class TestBootstrap(unittest.TestCase):
+    
+    def test_batched_backtest_matches_pipeline(self):
+        data = make_cointegrated_prices(n_assets=2, n_bars=300, seed=5)
+        paths1 = np.column_stack([data['T0'].values, data['T0'].values[::-1]])
+        paths2 = np.column_stack([data['T1'].values, data['T1'].values[::-1]])
+        
+        for use_kalman in (False, True):
+            batched = backtest_paths(paths1, paths2, strategy='kalman' if use_kalman else 'static')
+            expected = run_pipeline(data, ['T0', 'T1'], use_kalman=use_kalman)
+            np.testing.assert_allclose(batched[:, 0], expected['metrics']['daily_returns'].values,
+                                       equal_nan=True)
+    
+    def test_study_is_reproducible_across_batches(self):
+        data = make_cointegrated_prices(n_assets=2, n_bars=200, seed=6)
+        first = run_bootstrap_study(data['T0'], data['T1'], n_reps=40, batch_size=10, n_jobs=1, seed=7)
+        second = run_bootstrap_study(data['T0'], data['T1'], n_reps=40, batch_size=10, n_jobs=2, seed=7)
+        
+        np.testing.assert_allclose(first.sharpe_ratios['kalman'], second.sharpe_ratios['kalman'])
+        self.assertEqual(len(first.total_returns['static']), 40)
+        comparison = first.compare('kalman', 'static')
+        self.assertTrue(0 < comparison['p_value_two_sided'] <= 1)
+
+class TestBenchmark(unittest.TestCase):
+    
+    def test_synthetic_groups_are_cointegrated(self):
+        prices = generate_cointegrated_prices(n_tickers=4, n_bars=500, n_factors=2, seed=1)
+        same_group = _test_pair(prices, 'S0000', 'S0002', 0.05, 0.0)
+        
+        self.assertEqual(prices.shape, (500, 4))
+        self.assertIsNotNone(same_group)
+    
+    def test_regressions_flagged_against_baseline(self):
+        baseline = {'results': [{'stage': 'calculate_zscore', 'size': 'a', 'seconds': 1.0},
+                                {'stage': 'generate_signals', 'size': 'a', 'seconds': 1.0}]}
+        results = [{'stage': 'calculate_zscore', 'size': 'a', 'seconds': 1.1},
+                   {'stage': 'generate_signals', 'size': 'a', 'seconds': 2.0},
+                   {'stage': 'discover_pairs', 'size': 'a', 'seconds': 9.0}]
+        regressions = compare_to_baseline(results, baseline, tolerance=0.25)
+        
+        self.assertEqual([r[0] for r in regressions], ['generate_signals'])
+
+class TestProfiling(unittest.TestCase):
+    
+    def test_spans_and_counters_are_recorded(self):
+        data = make_cointegrated_prices(n_assets=2, n_bars=200)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            folded_path = os.path.join(tmpdir, 'profile.folded')
+            with profiling.profile(folded_path=folded_path) as profiler:
+                with profiling.span('study'):
+                    run_pipeline(data, ['T0', 'T1'])
+                    _test_pair(data, 'T0', 'T1', 0.05, 0.7)
+            with open(folded_path) as f:
+                folded = f.read()
+        
+        stages = profiler.stages()
+        self.assertEqual(stages['zscore']['calls'], 1)
+        self.assertIn('cointegration', stages)
+        self.assertEqual(profiler.counters['pairs_accepted'], 1)
+        self.assertIn('study;zscore ', folded)
+    
+    def test_disabled_span_is_shared_noop(self):
+        self.assertIs(profiling.span('a'), profiling.span('b'))
+
+class TestEvents(unittest.TestCase):
+    
+    def test_levels_progress_and_counters(self):
+        sink = events.MemorySink()
+        stream = events.EventStream(level='info', sinks=[sink], progress_interval=60.0)
+        
+        stream.debug('hidden', "not emitted")
+        stream.info('shown', "emitted", value=1)
+        for done in range(1, 101):
+            stream.progress('pairs', done, 100)
+        stream.incr('pairs_tested', 100)
+        
+        self.assertEqual([r['event'] for r in sink.records], ['shown', 'progress'])
+        self.assertEqual(sink.records[0]['value'], 1)
+        self.assertEqual(sink.records[1]['done'], 100)
+        
+        parent = events.EventStream(sinks=[])
+        parent.merge(stream.snapshot())
+        parent.merge(stream.snapshot())
+        self.assertEqual(parent.counters['pairs_tested'], 200)
+    
+    def test_unknown_env_level_falls_back_to_info(self):
+        with mock.patch.dict(os.environ, {'PAIRS_LOG_LEVEL': 'verbose'}):
+            with self.assertWarns(UserWarning):
+                self.assertEqual(events._initial_level(), 'info')
+        with mock.patch.dict(os.environ, {'PAIRS_LOG_LEVEL': 'warning'}):
+            self.assertEqual(events._initial_level(), 'warning')
+
+class TestRollingStats(unittest.TestCase):
+    
+    def test_matches_pandas_rolling_for_any_window(self):
+        data = make_cointegrated_prices(n_assets=2, n_bars=600, seed=9)
+        spreads = data - data.mean()
+        spreads.iloc[50, 0] = np.nan
+        stats = RollingStats(spreads)
+        
+        for window in (2, 5, 30, 250):
+            expected = calculate_zscore(spreads, window)
+            result = stats.zscore(window)
+            self.assertIsInstance(result, pd.DataFrame)
+            pd.testing.assert_frame_equal(result.isna(), expected.isna())
+            np.testing.assert_allclose(result.values, expected.values, atol=1e-8, equal_nan=True)
+        
+        flat = RollingStats(pd.Series([1.0] * 20 + [2.0]))
+        self.assertTrue(flat.zscore(10).iloc[:20].isna().all())
+        self.assertAlmostEqual(flat.mean(10).iloc[-1], 1.1)
+    
+    def test_parameter_sweep_matches_pipeline(self):
+        data = make_cointegrated_prices(n_assets=2, n_bars=500, seed=10)
+        sweep = run_parameter_sweep(data, ['T0', 'T1'], windows=(20, 30), entry_thresholds=(1.5, 2.0),
+                                    exit_thresholds=(0.0,))
+        self.assertEqual(len(sweep), 4)
+        for _, row in sweep.iterrows():
+            expected = run_pipeline(data, ['T0', 'T1'], window=int(row['window']),
+                                    entry_threshold=row['entry_threshold'])
+            self.assertAlmostEqual(row['final_return'], expected['metrics']['cumulative_returns'].iloc[-1])
+
+class TestBasketDiscovery(unittest.TestCase):
+    
+    def test_shared_moments_match_statsmodels_johansen(self):
+        from statsmodels.tsa.vector_ar.vecm import coint_johansen
+        data = generate_cointegrated_prices(n_tickers=6, n_bars=400, n_factors=2, seed=11)
+        basket = ['S0000', 'S0002', 'S0005']
+        
+        moments = JohansenMoments(data, k_ar_diff=1)
+        eigenvalues, _ = moments.test(moments.columns(basket))
+        expected = coint_johansen(data[basket].values, 0, 1)
+        np.testing.assert_allclose(eigenvalues, expected.eig, rtol=1e-8)
+    
+    def test_screen_prunes_by_sector_and_feeds_pipeline(self):
+        data = generate_cointegrated_prices(n_tickers=8, n_bars=500, n_factors=2, seed=12)
+        sectors = {'even': ['S0000', 'S0002', 'S0004', 'S0006'], 'odd': ['S0001', 'S0003', 'S0005', 'S0007']}
+        
+        baskets = screen_baskets(data, basket_sizes=(3,), prune_method='sector', sectors=sectors, n_jobs=1)
+        self.assertTrue(baskets)
+        for basket in baskets:
+            self.assertTrue(set(basket.tickers) <= set(sectors['even']) or set(basket.tickers) <= set(sectors['odd']))
+        strengths = [b.strength for b in baskets]
+        self.assertEqual(strengths, sorted(strengths, reverse=True))
+        
+        result = run_basket_pipeline(data, baskets[0])
+        self.assertEqual(result['weights'].iloc[0], 1.0)
+        self.assertFalse(result['metrics']['cumulative_returns'].iloc[1:].isna().any())
+        
+        dynamic = run_basket_pipeline(data, baskets[0], use_kalman=True)
+        self.assertEqual(dynamic['weights'].shape, (len(data), 3))
+        self.assertFalse(dynamic['metrics']['cumulative_returns'].iloc[1:].isna().any())
+
+class TestKalmanMulti(unittest.TestCase):
+    
+    def test_one_regressor_matches_pair_filter(self):
+        data = make_cointegrated_prices(n_assets=2, n_bars=300, seed=13)
+        expected_spread, expected_beta = run_kalman_strategy(data['T0'], data['T1'])
+        spread, states = run_kalman_basket(data[['T0', 'T1']])
+        np.testing.assert_allclose(spread.values, expected_spread.values, atol=1e-10)
+        np.testing.assert_allclose(states['T1'].values, expected_beta.values, atol=1e-12)
+    
+    def test_fixed_lag_smoothing_tracks_drifting_betas(self):
+        rng = np.random.default_rng(14)
+        n_bars = 1500
+        x = 50 + np.cumsum(rng.normal(0, 1, size=(n_bars, 2)), axis=0)
+        betas = np.array([1.0, 0.5]) + np.cumsum(rng.normal(0, 0.003, size=(n_bars, 2)), axis=0)
+        y = np.einsum('ij,ij->i', x, betas) + rng.normal(0, 0.05, n_bars)
+        prices = pd.DataFrame(np.column_stack([y, x]), columns=['Y', 'X1', 'X2'])
+        
+        _, filtered = run_kalman_basket(prices, delta=1e-4, R=0.01)
+        _, smoothed = run_kalman_basket(prices, delta=1e-4, R=0.01, smoothing_lag=20)
+        error = lambda states: np.abs(states[['X1', 'X2']].values[200:] - betas[200:]).mean()
+        self.assertLess(error(smoothed), error(filtered))
+        
+        # The online filter's fixed-lag estimate equals the batch one
+        kf = KalmanFilterMulti(2, delta=1e-4, R=0.01, smoothing_lag=20)
+        means, covs = [], []
+        for t in range(100):
+            means.append(kf.update(x[t], y[t]).copy())
+            covs.append(kf.state_cov.copy())
+        batch = fixed_lag_smooth(np.array(means), np.array(covs), kf.q, 20)
+        np.testing.assert_allclose(kf.smoothed_state(), batch[79])
+
+class TestKalmanCalibration(unittest.TestCase):
+    
+    @staticmethod
+    def _simulate(q, R, n_bars, rng):
+        x = 100 + np.cumsum(rng.normal(0, 1, n_bars))
+        beta = 1 + np.cumsum(rng.normal(0, np.sqrt(q), n_bars))
+        alpha = 5 + np.cumsum(rng.normal(0, np.sqrt(q), n_bars))
+        return beta * x + alpha + rng.normal(0, np.sqrt(R), n_bars), x
+    
+    def test_vectorized_likelihood_matches_filter(self):
+        data = make_cointegrated_prices(n_assets=2, n_bars=300, seed=15)
+        kf = KalmanFilterReg(delta=1e-4, R=0.5)
+        for x, y in zip(data['T1'], data['T0']):
+            kf.update(x, y)
+        self.assertAlmostEqual(kalman_log_likelihood(data['T0'], data['T1'], 1e-4, 0.5), kf.log_likelihood, places=6)
+        
+        multi = KalmanFilterMulti(1, delta=1e-4, R=0.5)
+        for x, y in zip(data['T1'], data['T0']):
+            multi.update(x, y)
+        self.assertAlmostEqual(multi.log_likelihood, kf.log_likelihood, places=6)
+    
+    def test_recovers_simulated_noise(self):
+        rng = np.random.default_rng(16)
+        y, x = self._simulate(1e-4, 0.5, 3000, rng)
+        fit = calibrate_kalman(y, x)
+        self.assertLess(abs(np.log10(fit['delta'] / 1e-4)), 0.5)
+        self.assertLess(abs(np.log10(fit['R'] / 0.5)), 0.3)
+        self.assertGreater(fit['log_likelihood'], kalman_log_likelihood(y, x, 1e-5, 1e-3, burn_in=20))
+    
+    def test_batch_matches_single_pair_fits(self):
+        rng = np.random.default_rng(17)
+        columns = {}
+        for i, (q, R) in enumerate([(1e-6, 0.1), (1e-4, 1.0), (1e-5, 0.01)]):
+            columns[f'Y{i}'], columns[f'X{i}'] = self._simulate(q, R, 400, rng)
+        prices = pd.DataFrame(columns)
+        prices.iloc[:40, prices.columns.get_loc('Y1')] = np.nan  # listed later
+        pairs = [(f'Y{i}', f'X{i}') for i in range(3)]
+        
+        table = calibrate_pairs(prices, pairs)
+        self.assertEqual(list(table['ticker1']), ['Y0', 'Y1', 'Y2'])
+        self.assertTrue((table['log_likelihood'] >= table['default_log_likelihood']).all())
+        for (t1, t2), row in zip(pairs, table.itertuples()):
+            aligned = prices[[t1, t2]].dropna()
+            fit = calibrate_kalman(aligned[t1], aligned[t2])
+            self.assertAlmostEqual(row.delta, fit['delta'], delta=1e-9 * max(fit['delta'], 1))
+            self.assertAlmostEqual(row.R, fit['R'], places=6)
+        
+        # The calibrated parameters plug straight into the pipeline
+        params = table.iloc[0][['delta', 'R']].to_dict()
+        result = run_pipeline(prices, ['Y0', 'X0'], use_kalman=True, kalman_params=params)
+        expected, _ = run_kalman_strategy(prices['Y0'], prices['X0'], **params)
+        np.testing.assert_allclose(result['spread'].values, expected.values)
+
+class TestExecution(unittest.TestCase):
+    
+    def setUp(self):
+        self.data = make_cointegrated_prices(n_assets=2, n_bars=400, seed=15)
+        positions = np.zeros(len(self.data))
+        positions[50:90] = 1
+        positions[200:260] = -1
+        self.positions = pd.Series(positions, index=self.data.index)
+        self.drifting_beta = pd.Series(np.linspace(0.8, 1.0, len(self.data)), index=self.data.index)
+    
+    def test_frictionless_pnl_matches_holdings(self):
+        static = run_pipeline(self.data, ['T0', 'T1'])
+        book = Book(('T0', 'T1'), static['positions'], static['hedge_ratio'])
+        result = simulate_execution(self.data, [book])
+        units = target_units(book, self.data)
+        expected = np.sum(units[:-1] * np.diff(self.data[['T0', 'T1']].values, axis=0))
+        self.assertAlmostEqual(result.equity['equity'].iloc[-1] - book.notional, expected, places=6)
+        self.assertTrue((result.orders['status'] == 1).all())
+        
+        held = Book(('T0', 'T1'), self.positions, 0.9)
+        delayed = simulate_execution(self.data, [held], latency_bars=1)
+        np.testing.assert_array_equal(delayed.fills['bar'], [51, 51, 91, 91, 201, 201, 261, 261])
+    
+    def test_partial_fills_costs_and_rehedging(self):
+        book = Book(('T0', 'T1'), self.positions, self.drifting_beta)
+        volumes = pd.DataFrame(200.0, index=self.data.index, columns=self.data.columns)
+        result = simulate_execution(self.data, [book], volumes=volumes, participation_rate=0.1,
+                                    commission_per_share=0.01, borrow_rate=0.05, rebalance_threshold=0.01)
+        summary = result.summary()
+        
+        # 20 shares per bar at most, so every entry and exit takes several fills
+        self.assertGreater(summary['fills'], summary['orders'])
+        self.assertTrue((np.abs(result.fills['quantity']) <= 20 + 1e-9).all())
+        self.assertGreater(summary['commission'], 0)
+        self.assertGreater(summary['borrow_cost'], 0)
+        # The drifting hedge ratio triggers extra orders on leg 2 while a trade is open
+        self.assertGreater(np.sum(result.orders['leg'] == 1), np.sum(result.orders['leg'] == 0))
+        # Flat at the end
+        self.assertAlmostEqual(result.equity['market_value'].iloc[-1], 0.0)
+
+class TestExperimentGrid(unittest.TestCase):
+    
+    def test_grid_dedupes_loads_and_resumes(self):
+        data = make_cointegrated_prices(n_assets=2, n_bars=300, seed=7)
+        frame = data.copy()
+        frame.columns = pd.MultiIndex.from_product([['Close'], data.columns])
+        grid = ExperimentGrid(
+            pairs=[{'tickers': ['T0', 'T1'], 'name': 'T0_T1'}],
+            periods=[{'name': 'A', 'start': '2020-01-01', 'end': '2021-01-01'},
+                     {'name': 'B', 'start': '2021-01-01', 'end': '2022-01-01'}],
+            models=['static', 'kalman'],
+            params={'window': [20, 30]}
+        )
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'grid.jsonl')
+            with mock.patch.object(data_loader.yf, 'download', return_value=frame) as download:
+                results = run_grid(grid, path, n_jobs=1)
+                self.assertEqual(download.call_count, 2)
+            
+            self.assertEqual(len(results), 8)
+            self.assertTrue((results['status'] == 'ok').all())
+            expected = run_pipeline(data, ['T0', 'T1'], use_kalman=True, window=20)
+            row = results[(results['period'] == 'A') & (results['model'] == 'kalman') & (results['window'] == 20)]
+            self.assertAlmostEqual(row['final_return'].iloc[0],
+                                   expected['metrics']['cumulative_returns'].iloc[-1])
+            
+            # Simulate a crash that lost the last two rows, then resume
+            with open(path) as f:
+                lines = f.readlines()
+            with open(path, 'w') as f:
+                f.writelines(lines[:-2])
+            with mock.patch.object(data_loader.yf, 'download', return_value=frame) as download:
+                resumed = run_grid(grid, path, n_jobs=1)
+                self.assertEqual(download.call_count, 1)
+            pd.testing.assert_frame_equal(resumed, results)
+
+def _store_backtests(store, seed):
+    rows = [{'tickers': [f'A{seed}', f'B{i}'], 'period': 'P', 'model': 'static', 'sample': 'out',
+             'sharpe': seed + i / 10} for i in range(50)]
+    return store.record_backtests(rows)
+
+class TestResultsStore(unittest.TestCase):
+    
+    def test_backtests_returns_and_top_pairs(self):
+        data = make_cointegrated_prices(n_assets=3, n_bars=300, seed=9)
+        with tempfile.TemporaryDirectory() as tmp, ResultsStore(os.path.join(tmp, 'results.db')) as store:
+            run_id = store.start_run('test')
+            ids = []
+            for tickers in (['T0', 'T1'], ['T0', 'T2'], ['T1', 'T2']):
+                result = run_pipeline(data[tickers], tickers)
+                ids.append(store.record_backtest(result, tickers, run_id=run_id, period='P', model='static',
+                                                 sample='out'))
+            
+            returns = store.load_returns(ids)
+            self.assertEqual(returns.shape, (300, 3))
+            expected = run_pipeline(data[['T0', 'T2']], ['T0', 'T2'])
+            np.testing.assert_allclose(returns[ids[1]].values, expected['metrics']['daily_returns'].values)
+            
+            # Pool workers reopen the database and insert concurrently
+            with ProcessPoolExecutor(max_workers=2) as pool:
+                inserted = list(pool.map(_store_backtests, [store] * 4, range(4)))
+            self.assertEqual(sum(len(batch) for batch in inserted), 200)
+            
+            top = store.top_pairs('sharpe', n=5, sample='out')
+            self.assertEqual(list(top['pair']), ['A3/B49', 'A3/B48', 'A3/B47', 'A3/B46', 'A3/B45'])
+            self.assertEqual(len(store.top_pairs('sharpe', n=1000, period='P')), 203)
+            stored = store.query('SELECT sharpe FROM backtests WHERE backtest_id = ?', (ids[0],))
+            expected = compute_performance(run_pipeline(data[['T0', 'T1']], ['T0', 'T1'])['metrics'])
+            self.assertAlmostEqual(stored['sharpe'].iloc[0], expected['sharpe'].iloc[0])
+
+class TestCompact(unittest.TestCase):
+    
+    def test_compact_matches_float64_pipeline(self):
+        data = make_cointegrated_prices(n_assets=4, n_bars=1500, seed=10)
+        pairs = [('T0', 'T1'), ('T2', 'T3'), ('T1', 'T3')]
+        for use_kalman in (False, True):
+            compact = run_pipeline_compact(data, pairs, use_kalman=use_kalman, block_size=2)
+            self.assertEqual(compact.positions.dtype, np.int8)
+            self.assertEqual(compact.zscore.dtype, np.float32)
+            self.assertEqual(compact.flags.dtype, np.uint8)
+            for j, (a, b) in enumerate(pairs):
+                expected = run_pipeline(data[[a, b]], [a, b], use_kalman=use_kalman)
+                np.testing.assert_allclose(compact.zscore[:, j], expected['zscore'].values, atol=1e-3)
+                np.testing.assert_array_equal(compact.positions[:, j], expected['positions'].values)
+                np.testing.assert_allclose(compact.daily_returns[:, j], expected['metrics']['daily_returns'].values,
+                                           atol=1e-6)
+                
+                signals = generate_signals(expected['zscore'])
+                unpacked = compact.signals_frame(j)
+                for flag in ('long_entry', 'short_entry', 'long_exit', 'short_exit'):
+                    self.assertLessEqual((unpacked[flag] != signals[flag]).sum(), 1)
+            self.assertLessEqual(compact.nbytes, 18 * len(data) * len(pairs))
+    
+    def test_flags_agree_with_positions_at_the_threshold(self):
+        data = make_cointegrated_prices(n_assets=2, n_bars=400, seed=10)
+        y, x = (data[t].values.astype(np.float32).astype(float)[:, None] for t in ('T0', 'T1'))
+        z = RollingStats(y - _hedge_ratios(y, x) * x).zscore(30)[:, 0]
+        # A bar whose z-score rounds up in float32: a threshold equal to it must not flag an entry
+        t = next(i for i in range(30, len(z)) if z[i] > 0 and np.float32(z[i]) > z[i])
+        compact = run_pipeline_compact(data, [('T0', 'T1')], entry_threshold=z[t])
+        self.assertFalse(compact.signals_frame(0)['short_entry'].iloc[t])
+
+class TestPairMonitor(unittest.TestCase):
+    
+    def test_online_estimates_match_batch_metrics(self):
+        prices = generate_cointegrated_prices(4, 800, n_factors=2, seed=2)
+        pairs = [('S0000', 'S0002'), ('S0000', 'S0001')]
+        watchlist = [(a, b, calculate_hedge_ratio(prices[a], prices[b])) for a, b in pairs]
+        monitor = PairHealthMonitor(watchlist, resync_every=97)
+        monitor.update_frame(prices)
+        metrics = monitor.metrics()
+        
+        for a, b, beta in watchlist:
+            spread = prices[a] - beta * prices[b]
+            row = metrics.loc[f"{a}/{b}"]
+            self.assertAlmostEqual(row['half_life'], calculate_half_life(spread), places=6)
+            self.assertAlmostEqual(row['hurst_exponent'], calculate_hurst_exponent(spread), places=8)
+            self.assertAlmostEqual(row['correlation_stability'],
+                                   calculate_correlation_stability(prices[a], prices[b]), places=8)
+        
+        decisions = monitor.select_strategies()
+        self.assertEqual(decisions[('S0000', 'S0002')], 'static')
+        self.assertEqual(decisions[('S0000', 'S0001')], 'kalman')
+    
+    def test_breakdown_alert_after_relationship_breaks(self):
+        rng = np.random.default_rng(4)
+        n = 600
+        common = 100 + np.cumsum(rng.normal(0, 1, n))
+        second = common + rng.normal(0, 0.5, n)
+        # From bar 300 the second leg drifts away on its own random walk
+        second[300:] += np.cumsum(rng.normal(0, 1.5, n - 300))
+        prices = pd.DataFrame({'A': common, 'B': second})
+        
+        monitor = PairHealthMonitor([('A', 'B', 1.0)], memory=100)
+        changes = monitor.update_frame(prices)
+        self.assertFalse(any(alerts for bar, _, alerts in changes if bar < 300))
+        self.assertTrue(monitor.health(('A', 'B'))['alerts'])
+        self.assertEqual(monitor.select_strategies()[('A', 'B')], 'kalman')
+
+class TestReport(unittest.TestCase):
+    
+    def test_lttb_keeps_shape(self):
+        rng = np.random.default_rng(6)
+        y = np.cumsum(rng.normal(size=10000))
+        y[4321] += 500  # A spike plain decimation would miss
+        y[:5] = np.nan
+        keep = lttb(np.arange(10000), y, 300)
+        self.assertEqual(len(keep), 300)
+        self.assertEqual(keep[0], 5)
+        self.assertEqual(keep[-1], 9999)
+        self.assertIn(4321, keep)
+        self.assertTrue((np.diff(keep) > 0).all())
+    
+    def test_study_report_replaces_pngs(self):
+        data = make_cointegrated_prices(n_assets=2, n_bars=2000, seed=11)
+        frame = data.copy()
+        frame.columns = pd.MultiIndex.from_product([['Close'], data.columns])
+        report = ReportBuilder('Test Study', max_points=200)
+        with mock.patch.object(data_loader.yf, 'download', return_value=frame), \
+             mock.patch('main.plt.savefig') as savefig:
+            for use_kalman in (False, True):
+                run_experiment(['T0', 'T1'], '2020-01-01', '2021-01-01', f'Synthetic_{use_kalman}',
+                               use_kalman=use_kalman, period='P1', report=report)
+            savefig.assert_not_called()
+        
+        self.assertEqual(len(report.entries), 2)
+        self.assertLessEqual(max(len(s) for e in report.entries for c in e.charts for s in c.series.values()), 200)
+        expected = run_pipeline(data, ['T0', 'T1'])
+        self.assertAlmostEqual(report.summary_frame()['total_return'].iloc[0] + 1,
+                               expected['metrics']['cumulative_returns'].iloc[-1])
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            path = report.render(os.path.join(tmp, 'study.html'), n_jobs=1)
+            with open(path) as f:
+                document = f.read()
+        self.assertEqual(document.count('<section'), 2)
+        self.assertEqual(document.count('<svg'), 7)
+        self.assertNotIn('<img', document)
+
+class TestDaemon(unittest.TestCase):
+    
+    def test_jobs_reuse_warm_price_cache(self):
+        data = make_cointegrated_prices(n_assets=2, n_bars=500, seed=12)
+        frame = data.copy()
+        frame.columns = pd.MultiIndex.from_product([['Close'], data.columns])
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'daemon.sock')
+            daemon = ResearchDaemon(path)
+            daemon.start()
+            thread = threading.Thread(target=daemon.serve_forever, daemon=True)
+            thread.start()
+            try:
+                with mock.patch.object(data_loader.yf, 'download', return_value=frame) as download:
+                    params = dict(tickers=['T0', 'T1'], start='2020-01-01', end='2021-01-01', path=path)
+                    first = client.request('experiment', **params)
+                    second = client.request('experiment', use_kalman=True, **params)
+                    stats = client.request('pair_stats', **params)
+                    self.assertEqual(download.call_count, 1)
+                
+                expected = run_pipeline(data, ['T0', 'T1'])
+                self.assertAlmostEqual(first['final_return'], expected['metrics']['cumulative_returns'].iloc[-1])
+                self.assertEqual(second['model'], 'kalman')
+                self.assertAlmostEqual(stats['hedge_ratio'], expected['hedge_ratio'])
+                
+                status = client.request('status', path=path)
+                self.assertEqual(status['price_cache']['hits'], 2)
+                self.assertEqual(status['memoized']['entries'], 1)
+                with self.assertRaises(RuntimeError):
+                    client.request('no_such_job', path=path)
+                client.request('shutdown', path=path)
+                thread.join(timeout=5)
+                self.assertFalse(thread.is_alive())
+                self.assertFalse(os.path.exists(path))
+            finally:
+                data_loader.disable_cache()
+    
+    def test_discover_screens_explicit_tickers_outside_the_universe(self):
+        prices = make_cointegrated_prices(n_assets=3, n_bars=400, seed=19)
+        prices.columns = ['BTC-USD', 'ETH-USD', 'GLD']
+        daemon = ResearchDaemon(os.path.join(tempfile.gettempdir(), 'unused.sock'))
+        try:
+            with mock.patch.object(data_loader.yf, 'download', return_value=pd.concat({'Close': prices}, axis=1)):
+                result = daemon.discover('2020-01-01', '2022-01-01', tickers=list(prices.columns),
+                                         align='intersection')
+        finally:
+            data_loader.disable_cache()
+        self.assertGreater(result['pairs_found'], 0)
+    
+    def test_caches_are_bounded_and_thread_safe(self):
+        memo = data_loader.LRUCache(max_entries=2)
+        for key in 'abc':
+            memo.put(key, [key])
+        self.assertIsNone(memo.get('a'))
+        self.assertEqual(memo.get('c'), ['c'])
+        
+        cache = data_loader.PriceCache(max_entries=8)
+        frame = make_cointegrated_prices(n_assets=2, n_bars=50, seed=1)
+        stop = threading.Event()
+        errors = []
+        
+        def read_stats():
+            while not stop.is_set():
+                try:
+                    cache.stats()
+                except RuntimeError as e:
+                    errors.append(e)
+        
+        reader = threading.Thread(target=read_stats)
+        reader.start()
+        for i in range(2000):
+            cache.put(i % 16, frame)
+            cache.get((i * 7) % 16)
+        stop.set()
+        reader.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(cache.stats()['entries'], 8)
+
+class TestEnsemble(unittest.TestCase):
+    
+    def test_sleeves_match_pipeline_and_blend(self):
+        data = make_cointegrated_prices(n_assets=2, n_bars=400, seed=8)
+        result = run_ensemble(data, ['T0', 'T1'], static_weight=0.25)
+        
+        for sleeve, use_kalman in [('static', False), ('kalman', True)]:
+            expected = run_pipeline(data, ['T0', 'T1'], use_kalman=use_kalman)
+            np.testing.assert_array_equal(result['positions'][sleeve].values, expected['positions'].values)
+            np.testing.assert_allclose(result['cumulative_returns'][sleeve].values,
+                                       expected['metrics']['cumulative_returns'].values)
+        
+        returns = result['returns']
+        blended = 0.25 * returns['static'] + 0.75 * returns['kalman']
+        np.testing.assert_allclose(returns['ensemble'].values[1:], blended.values[1:])
+        
+        rolling = run_ensemble(data, ['T0', 'T1'], weighting='rolling_sharpe', lookback=40)
+        np.testing.assert_allclose(rolling['weights'].sum(axis=1).values, 1.0)
+        self.assertTrue((rolling['weights'].iloc[:40] == [0.5, 0.5]).all().all())
+
+class TestPerformance(unittest.TestCase):
+    
+    def test_matrix_matches_per_strategy_loops(self):
+        rng = np.random.default_rng(3)
+        returns = pd.DataFrame(rng.normal(0, 0.01, (300, 3)), columns=['a', 'b', 'c'])
+        returns.iloc[0] = np.nan
+        positions = pd.DataFrame(rng.choice([-1, 0, 1], (300, 3)), columns=returns.columns)
+        positions = positions.where(rng.random((300, 3)) < 0.15).ffill().fillna(0)
+        metrics = compute_performance(returns, positions)
+
+        for name in returns:
+            r = returns[name].values[1:]
+            p = positions[name].values[1:]
+            equity = np.cumprod(1 + r)
+            drawdown = equity / np.maximum.accumulate(np.r_[1.0, equity])[1:] - 1
+            longest = run = 0
+            for value in drawdown:
+                run = run + 1 if value < 0 else 0
+                longest = max(longest, run)
+            trades = []
+            for t in range(len(p)):
+                if p[t] != 0 and (t == 0 or p[t] != p[t - 1]):
+                    trades.append([1.0, 0])
+                if p[t] != 0:
+                    trades[-1][1] += 1
+                    if t + 1 < len(p):
+                        trades[-1][0] *= 1 + r[t + 1]
+            trade_returns = np.array([growth - 1 for growth, _ in trades])
+
+            row = metrics.loc[name]
+            self.assertAlmostEqual(row['total_return'], equity[-1] - 1)
+            self.assertAlmostEqual(row['sharpe'], r.mean() / r.std(ddof=1) * np.sqrt(252))
+            self.assertAlmostEqual(row['max_drawdown'], drawdown.min())
+            self.assertEqual(row['max_drawdown_duration'], longest)
+            self.assertEqual(row['n_trades'], len(trades))
+            self.assertAlmostEqual(row['hit_rate'], (trade_returns > 0).mean())
+            self.assertAlmostEqual(row['avg_holding_period'], np.mean([bars for _, bars in trades]))
+
+        table = trade_table(returns, positions)
+        self.assertEqual(len(table), metrics['n_trades'].sum())
+
+    def test_single_backtest_output(self):
+        prices = make_cointegrated_prices(2, 400, seed=5)
+        result = run_pipeline(prices, list(prices.columns))
+        metrics = compute_performance(result['metrics'], result['positions'])
+        self.assertEqual(len(metrics), 1)
+        self.assertAlmostEqual(metrics['total_return'].iloc[0] + 1,
+                               result['metrics']['cumulative_returns'].iloc[-1])
+    
+    def test_positions_are_matched_by_column_name(self):
+        returns = pd.DataFrame({'a': np.full(20, 0.01), 'b': np.full(20, -0.01)})
+        positions = pd.DataFrame({'a': np.r_[0, 1, 1, np.zeros(17)], 'b': np.zeros(20)})
+        swapped = compute_performance(returns, positions[['b', 'a']])
+        pd.testing.assert_frame_equal(swapped, compute_performance(returns, positions))
+        self.assertEqual(swapped.loc['a', 'n_trades'], 1)
+        self.assertEqual(swapped.loc['b', 'n_trades'], 0)
+        self.assertEqual(list(trade_table(returns, positions[['b', 'a']])['strategy']), ['a'])
+        
+        # Unrelated names (e.g. a positions Series) still match by position
+        unnamed = compute_performance(returns, pd.DataFrame(positions.values))
+        pd.testing.assert_frame_equal(unnamed, swapped)
+        with self.assertRaises(ValueError):
+            compute_performance(returns, positions.rename(columns={'b': 'c'}))
+    
+    def test_profit_factor_is_per_strategy(self):
+        returns = pd.DataFrame({'a': np.full(20, 0.01), 'b': np.full(20, 0.01)})
+        positions = pd.DataFrame({'a': np.r_[0, 1, 1, 1, np.zeros(16)], 'b': np.zeros(20)})
+        metrics = compute_performance(returns, positions)
+        self.assertEqual(metrics.loc['a', 'profit_factor'], np.inf)
+        self.assertEqual(metrics.loc['b', 'n_trades'], 0)
+        self.assertTrue(np.isnan(metrics.loc['b', 'profit_factor']))
+
+class TestAlignment(unittest.TestCase):
+    
+    def setUp(self):
+        # Two 24/7 crypto assets and a weekday ETF that skips a halted week
+        prices = make_cointegrated_prices(n_assets=3, n_bars=600, seed=8)
+        prices.index = pd.date_range('2021-01-01', periods=600, freq='D')
+        prices.columns = ['BTC-USD', 'ETH-USD', 'GLD']
+        weekday = prices.index.dayofweek < 5
+        halted = (prices.index >= '2021-06-07') & (prices.index < '2021-06-14')
+        prices.loc[~weekday | halted, 'GLD'] = np.nan
+        self.prices = prices
+        self.frame = pd.concat({'Close': prices}, axis=1)
+    
+    def test_pair_alignment_matches_merge_asof(self):
+        index = CalendarIndex.from_frame(self.prices)
+        
+        inner = index.align(['BTC-USD', 'GLD'])
+        pd.testing.assert_frame_equal(inner, self.prices[['BTC-USD', 'GLD']].dropna(), check_freq=False)
+        
+        # GLD sampled as-of on the crypto calendar: weekends bridged, the halt is not
+        aligned = index.align(['BTC-USD', 'GLD'], how='BTC-USD', max_staleness='3D')
+        btc = self.prices[['BTC-USD']].rename_axis('t').reset_index()
+        gld = self.prices['GLD'].dropna().rename_axis('t').reset_index()
+        expected = pd.merge_asof(btc, gld, on='t', tolerance=pd.Timedelta('3D')).dropna().set_index('t')
+        np.testing.assert_allclose(aligned.values, expected.values)
+        self.assertTrue((aligned.index == expected.index).all())
+        self.assertFalse(((aligned.index >= '2021-06-11') & (aligned.index < '2021-06-14')).any())
+        
+        exact = index.align(['BTC-USD', 'GLD'], how='union', fill='none')
+        self.assertEqual(len(exact), len(inner))
+        
+        ts = self.prices['GLD'].dropna().index.asi8
+        values = asof_join(ts, self.prices['GLD'].dropna().values, self.prices.index.asi8)
+        np.testing.assert_allclose(values, self.prices['GLD'].ffill().values, equal_nan=True)
+    
+    def test_fetch_and_discovery_keep_mixed_calendars(self):
+        with mock.patch.object(data_loader.yf, 'download', return_value=self.frame):
+            legacy = data_loader.fetch_data(['BTC-USD', 'GLD'], '2021-01-01', '2023-01-01')
+            aligned = data_loader.fetch_data(['BTC-USD', 'GLD'], '2021-01-01', '2023-01-01', how='intersection')
+            legacy_pairs = discover_pairs(list(self.prices.columns), '2021-01-01', '2023-01-01')
+            aligned_pairs = discover_pairs(list(self.prices.columns), '2021-01-01', '2023-01-01',
+                                           align='intersection')
+        
+        # Under 80% coverage on the crypto calendar, so the default path drops GLD
+        self.assertNotIn('GLD', legacy.columns)
+        self.assertEqual(list(aligned.columns), ['BTC-USD', 'GLD'])
+        self.assertEqual(len(aligned), self.prices['GLD'].count())
+        self.assertFalse(any('GLD' in (c.ticker1, c.ticker2) for c in legacy_pairs))
+        self.assertTrue(any('GLD' in (c.ticker1, c.ticker2) for c in aligned_pairs))
+    
+    def test_aligned_fetch_keeps_download_column_order(self):
+        # yfinance returns columns sorted, so PEP/KO comes back as KO, PEP
+        prices = make_cointegrated_prices(n_assets=2, n_bars=400, seed=18)
+        prices.columns = ['KO', 'PEP']
+        with mock.patch.object(data_loader.yf, 'download', return_value=pd.concat({'Close': prices}, axis=1)):
+            legacy = data_loader.fetch_data(['PEP', 'KO'], '2020-01-01', '2022-01-01')
+            aligned = data_loader.fetch_data(['PEP', 'KO'], '2020-01-01', '2022-01-01', how='intersection')
+        self.assertEqual(list(aligned.columns), ['KO', 'PEP'])
+        self.assertEqual(list(aligned.columns), list(legacy.columns))
+        expected = run_pipeline(legacy, ['PEP', 'KO'])['metrics']['daily_returns']
+        np.testing.assert_allclose(run_pipeline(aligned, ['PEP', 'KO'])['metrics']['daily_returns'].values,
+                                   expected.values, equal_nan=True)
+    
+    def test_empty_download_returns_empty(self):
+        # What yfinance returns offline or for unknown tickers
+        with mock.patch.object(data_loader.yf, 'download', return_value=pd.DataFrame()):
+            legacy = data_loader.fetch_data(['BTC-USD', 'GLD'], '1990-01-01', '1990-02-01')
+            aligned = data_loader.fetch_data(['BTC-USD', 'GLD'], '1990-01-01', '1990-02-01', how='intersection')
+            pairs = discover_pairs(['BTC-USD', 'GLD'], '1990-01-01', '1990-02-01', align='intersection')
+        self.assertTrue(legacy.empty)
+        self.assertTrue(aligned.empty)
+        self.assertEqual(pairs, [])
+        self.assertTrue(CalendarIndex({}).align(['BTC-USD', 'GLD']).empty)
+        self.assertTrue(CalendarIndex.from_frame(self.prices).align([]).empty)
+
+class TestUniverseMembership(unittest.TestCase):
+    
+    def setUp(self):
+        rng = np.random.default_rng(9)
+        days = pd.date_range('2010-01-01', '2025-01-01', freq='D')
+        listings = []
+        for i in range(40):
+            start, end = np.sort(rng.choice(days, 2, replace=False))
+            listings.append(Listing(f'S{i % 30}', pd.Timestamp(start) if i % 4 else None,
+                                    pd.Timestamp(end) if i % 3 else None, group=f'G{i % 3}'))
+        self.listings = listings
+        self.membership = UniverseMembership(listings)
+    
+    def _listed(self, listing, date):
+        return (listing.start is None or listing.start <= date) and (listing.end is None or date < listing.end)
+    
+    def test_asof_queries_match_intervals(self):
+        dates = pd.date_range('2009-06-01', '2025-06-01', freq='17D').append(
+            pd.DatetimeIndex([l.start for l in self.listings if l.start is not None]))
+        for date in dates:
+            expected = {l.ticker for l in self.listings if self._listed(l, date)}
+            self.assertEqual(set(self.membership.members(date)), expected)
+        
+        start, end = pd.Timestamp('2015-03-01'), pd.Timestamp('2018-07-01')
+        window = pd.date_range(start, end - pd.Timedelta('1D'), freq='D')
+        listed = {t: np.zeros(len(window), dtype=bool) for t in self.membership.tickers}
+        for l in self.listings:
+            listed[l.ticker] |= np.array([self._listed(l, d) for d in window])
+        self.assertEqual(self.membership.members_during(start, end, how='all'),
+                         [t for t in self.membership.tickers if listed[t].all()])
+        self.assertEqual(self.membership.members_during(start, end, how='any'),
+                         [t for t in self.membership.tickers if listed[t].any()])
+    
+    def test_discovery_only_fetches_tradable_tickers(self):
+        prices = make_cointegrated_prices(n_assets=4, n_bars=300, seed=10)
+        membership = UniverseMembership.from_universe({'All': list(prices.columns)},
+                                                      {'T3': (None, '2020-06-01'), 'T2': ('2020-03-02', None)})
+        self.assertEqual(membership.members('2020-01-15'), ('T0', 'T1', 'T3'))
+        self.assertFalse(membership.is_member('T3', '2020-06-01'))
+        
+        frame = pd.concat({'Close': prices}, axis=1)
+        with mock.patch.object(data_loader.yf, 'download', return_value=frame) as download:
+            discover_pairs(list(prices.columns), '2020-01-01', '2021-01-01', membership=membership)
+        self.assertEqual(download.call_args.args[0], ['T0', 'T1'])
+
+class TestShardedDiscovery(unittest.TestCase):
+    
+    def setUp(self):
+        self.data = generate_cointegrated_prices(n_tickers=12, n_bars=300, seed=11)
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.queue_dir = os.path.join(self.tmpdir.name, 'queue')
+        tickers = list(self.data.columns)
+        self.expected = sorted((c.ticker1, c.ticker2, c.p_value) for c in
+                               (_test_pair(self.data, a, b, 0.05, 0.7)
+                                for i, a in enumerate(tickers) for b in tickers[i + 1:]) if c is not None)
+    
+    def tearDown(self):
+        self.tmpdir.cleanup()
+    
+    def test_local_workers_match_sequential_screen(self):
+        candidates = discover_pairs_sharded(list(self.data.columns), None, None, self.queue_dir,
+                                            local_workers=2, block_size=10, poll=0.05, data=self.data)
+        self.assertEqual(sorted((c.ticker1, c.ticker2, c.p_value) for c in candidates), self.expected)
+        self.assertEqual(ShardQueue(self.queue_dir).status()['results'], 7)
+    
+    def test_abandoned_shards_are_retried_then_failed(self):
+        tickers = list(self.data.columns)
+        pairs = [(a, b) for i, a in enumerate(tickers) for b in tickers[i + 1:]]
+        queue = ShardQueue(self.queue_dir)
+        queue.create(self.data, pairs, block_size=30, max_attempts=2, lease_timeout=1.0,
+                     p_value_threshold=0.05, correlation_threshold=0.7)
+        
+        def abandon():
+            running, _ = queue.claim('dead-worker')
+            os.utime(running, (time.time() - 10, time.time() - 10))
+            return running
+        
+        abandon()
+        run_worker(self.queue_dir, 'live', poll=0.01, idle_timeout=0)
+        self.assertEqual(queue.status(), {'pending': 0, 'running': 1, 'results': 2, 'failed': 0})
+        self.assertEqual(queue.requeue_stale(), 1)
+        run_worker(self.queue_dir, 'live', poll=0.01, idle_timeout=0)
+        candidates, counters, workers = queue.merge()
+        self.assertEqual(sorted((c.ticker1, c.ticker2, c.p_value) for c in candidates), self.expected)
+        self.assertEqual(counters['pairs_tested'], len(pairs))
+        
+        # A shard abandoned max_attempts times ends up in failed/
+        queue.create(self.data, pairs, block_size=100, max_attempts=2, lease_timeout=1.0,
+                     p_value_threshold=0.05, correlation_threshold=0.7)
+        for _ in range(2):
+            abandon()
+            queue.requeue_stale()
+        self.assertEqual(queue.status()['failed'], 1)
+    
+    def test_late_result_of_a_failed_shard_counts_once(self):
+        queue = ShardQueue(self.queue_dir)
+        tickers = list(self.data.columns)
+        pairs = [(a, b) for i, a in enumerate(tickers) for b in tickers[i + 1:]]
+        queue.create(self.data, pairs, block_size=40, max_attempts=1, lease_timeout=1.0,
+                     p_value_threshold=0.05, correlation_threshold=0.7)
+        running, shard = queue.claim('slow-worker')
+        os.utime(running, (time.time() - 10, time.time() - 10))
+        queue.requeue_stale()
+        self.assertEqual(queue.finished_shards(), {'000000'})
+        
+        # The slow worker finishes after all: one shard, now a result rather than a failure
+        queue.complete(running, [], {'pairs_tested': len(shard['pairs'])}, 'slow-worker')
+        self.assertEqual(queue.finished_shards(), {'000000'})
+        self.assertEqual(queue.status()['failed'], 0)
+    
+    def test_create_refuses_a_directory_that_is_not_a_queue(self):
+        other = os.path.join(self.tmpdir.name, 'project')
+        os.makedirs(other)
+        open(os.path.join(other, 'notes.txt'), 'w').close()
+        with self.assertRaises(ValueError):
+            ShardQueue(other).create(self.data, [('S0000', 'S0001')])
+        self.assertTrue(os.path.exists(os.path.join(other, 'notes.txt')))
+        
+        # Recreating a queue keeps anything else in its directory
+        queue = ShardQueue(self.queue_dir)
+        queue.create(self.data, [('S0000', 'S0001')])
+        open(queue.path('notes.txt'), 'w').close()
+        queue.create(self.data, [('S0000', 'S0001'), ('S0000', 'S0002')], block_size=1)
+        self.assertTrue(os.path.exists(queue.path('notes.txt')))
+        self.assertEqual(queue.status()['pending'], 2)
+
+class TestPositionEvents(unittest.TestCase):
+    
+    def test_round_trip_and_analytics_match_dense(self):
+        rng = np.random.default_rng(12)
+        # Runs of random length, including direct reversals and trades still open at the end
+        runs = np.repeat(rng.choice([-1, 0, 0, 1], 400), rng.integers(1, 15, 400))[:3000]
+        positions = pd.DataFrame({'a': runs, 'b': np.roll(runs, 17), 'c': -runs},
+                                 index=pd.date_range('2021-01-01', periods=3000, freq='min'))
+        positions.iloc[-5:, 0] = 1
+        returns = pd.DataFrame(rng.normal(0, 0.001, positions.shape), index=positions.index, columns=positions.columns)
+        returns.iloc[:3] = np.nan
+        
+        events = PositionEvents.from_dense(positions)
+        np.testing.assert_array_equal(events.to_dense(), positions.values)
+        self.assertLess(events.nbytes, positions.values.nbytes / 4)
+        self.assertEqual(events.to_records()['exit_time'].iloc[len(events) - 1], positions.index[-1])
+        
+        pd.testing.assert_frame_equal(compute_performance(returns, events),
+                                      compute_performance(returns, positions), check_dtype=False)
+        pd.testing.assert_frame_equal(trade_table(returns, events),
+                                      trade_table(returns, positions), check_dtype=False)
+    
+    def test_trade_pnl_from_entry_and_exit_prices(self):
+        prices = make_cointegrated_prices(n_assets=2, n_bars=600, seed=13)
+        result = run_pipeline(prices, ['T0', 'T1'])
+        events = PositionEvents.from_dense(result['positions'])
+        table = trade_pnl(events, prices['T0'], prices['T1'], hedge_ratio=result['hedge_ratio'])
+        
+        dense = result['positions'].values
+        p1, p2 = prices['T0'].values, prices['T1'].values
+        beta = float(np.mean(result['hedge_ratio']))
+        pnl = dense[:-1] * (np.diff(p1) - beta * np.diff(p2))
+        self.assertGreater(len(table), 0)
+        self.assertAlmostEqual(table['pnl'].sum(), pnl.sum())
+        
+        compact = run_pipeline_compact(prices, [('T0', 'T1')], position_storage='events')
+        self.assertIsNone(compact.positions)
+        np.testing.assert_array_equal(compact.dense_positions()[:, 0], dense)
+
 if __name__ == '__main__':
     unittest.main()
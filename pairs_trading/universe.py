@@ -0,0 +1,131 @@
+import numpy as np
+import pandas as pd
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+@dataclass(frozen=True)
+class Listing:
+    """One interval during which a ticker was tradable: [start, end), None = open-ended."""
+    ticker: str
+    start: Optional[pd.Timestamp] = None
+    end: Optional[pd.Timestamp] = None
+    group: Optional[str] = None
+
+def _ns(date):
+    return pd.Timestamp(date).as_unit('ns').value
+
+class UniverseMembership:
+    """
+    Point-in-time universe: which tickers were tradable on any given date.
+
+    The listing intervals are cut at every listing and delisting date into
+    elementary segments, and the members of each segment are computed once
+    with a sweep. members(date) is then a binary search over the segment
+    boundaries, O(log n) however many tickers and listings there are, and
+    returns a precomputed tuple. A ticker may have several listings (e.g.
+    when it is relisted).
+
+    Args:
+        listings (list): Listing records.
+    """
+    def __init__(self, listings: List[Listing]):
+        self.listings = list(listings)
+        self.tickers = list(dict.fromkeys(listing.ticker for listing in self.listings))
+        self.groups = {listing.ticker: listing.group for listing in self.listings if listing.group is not None}
+        self._column = column = {ticker: i for i, ticker in enumerate(self.tickers)}
+
+        starts = [_ns(l.start) for l in self.listings if l.start is not None]
+        ends = [_ns(l.end) for l in self.listings if l.end is not None]
+        # Segment k covers [boundaries[k - 1], boundaries[k]); segment 0 is everything before the first boundary
+        self.boundaries = np.unique(np.array(starts + ends, dtype=np.int64))
+
+        n_segments = len(self.boundaries) + 1
+        delta = np.zeros((n_segments + 1, len(self.tickers)), dtype=np.int32)
+        for listing in self.listings:
+            first = self._segment(listing.start) if listing.start is not None else 0
+            stop = self._segment(listing.end) if listing.end is not None else n_segments
+            delta[first, column[listing.ticker]] += 1
+            delta[stop, column[listing.ticker]] -= 1
+        self._active = np.cumsum(delta, axis=0)[:n_segments] > 0
+        names = np.array(self.tickers, dtype=object)
+        self._members = [tuple(names[row]) for row in self._active]
+
+    @classmethod
+    def from_universe(cls, groups: Dict[str, List[str]],
+                      listings: Optional[Dict[str, Tuple[Optional[str], Optional[str]]]] = None) -> 'UniverseMembership':
+        """
+        Builds the membership of a sector universe such as ASSET_UNIVERSE.
+
+        Args:
+            groups: Group (sector) name -> tickers
+            listings: Optional ticker -> (start, end) listing dates; other
+                      tickers are taken as listed throughout
+        """
+        listings = listings or {}
+        records = []
+        for group, tickers in groups.items():
+            for ticker in tickers:
+                start, end = listings.get(ticker, (None, None))
+                records.append(Listing(ticker, pd.Timestamp(start) if start else None,
+                                       pd.Timestamp(end) if end else None, group))
+        return cls(records)
+
+    @classmethod
+    def from_frame(cls, frame: pd.DataFrame) -> 'UniverseMembership':
+        """From a frame with 'ticker', 'start' and 'end' (NaN = open-ended) and an optional 'group' column."""
+        records = []
+        for row in frame.itertuples(index=False):
+            start, end = getattr(row, 'start', None), getattr(row, 'end', None)
+            group = getattr(row, 'group', None)
+            records.append(Listing(row.ticker, pd.Timestamp(start) if pd.notna(start) else None,
+                                   pd.Timestamp(end) if pd.notna(end) else None,
+                                   group if pd.notna(group) else None))
+        return cls(records)
+
+    @classmethod
+    def from_csv(cls, path) -> 'UniverseMembership':
+        return cls.from_frame(pd.read_csv(path))
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame([{'ticker': l.ticker, 'start': l.start, 'end': l.end, 'group': l.group}
+                             for l in self.listings])
+
+    def _segment(self, date):
+        return int(np.searchsorted(self.boundaries, _ns(date), side='right'))
+
+    def members(self, date) -> Tuple[str, ...]:
+        """Tickers tradable on `date`."""
+        return self._members[self._segment(date)]
+
+    def is_member(self, ticker, date) -> bool:
+        return ticker in self._column and bool(self._active[self._segment(date), self._column[ticker]])
+
+    def members_during(self, start, end, how: str = 'all') -> List[str]:
+        """
+        Tickers tradable during [start, end).
+
+        Args:
+            start, end: Window bounds
+            how: 'all' for tickers tradable throughout the window (what a
+                 backtest on fully aligned prices needs), 'any' for tickers
+                 tradable at some point in it
+
+        Returns:
+            list: Tickers in membership order
+        """
+        if how not in ('all', 'any'):
+            raise ValueError(f"Unknown how '{how}', expected 'all' or 'any'")
+        first = self._segment(start)
+        last = int(np.searchsorted(self.boundaries, _ns(end), side='left'))
+        window = self._active[first:max(last, first) + 1]
+        mask = window.all(axis=0) if how == 'all' else window.any(axis=0)
+        return [ticker for ticker, keep in zip(self.tickers, mask) if keep]
+
+    def sectors(self, date=None) -> Dict[str, List[str]]:
+        """Group -> tickers, restricted to the members on `date` when given."""
+        members = set(self.members(date)) if date is not None else set(self.tickers)
+        sectors = {}
+        for ticker in self.tickers:
+            if ticker in members and ticker in self.groups:
+                sectors.setdefault(self.groups[ticker], []).append(ticker)
+        return sectors